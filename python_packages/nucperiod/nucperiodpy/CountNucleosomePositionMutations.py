@@ -5,9 +5,9 @@
 
 import os, warnings
 from typing import List
-from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog, Selections
 from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import (Metadata, generateFilePath, getDataDirectory,
-                                                                  DataTypeStr, getAcceptableChromosomes)
+                                                                  DataTypeStr, getAcceptableChromosomes, writeTableToTSV)
+from nucperiodpy.helper_scripts.Instrumentation import measureStage
 
 
 class MutationData:
@@ -76,6 +76,9 @@ class CountsFileGenerator():
         self.currentMutation: MutationData = None
         self.currentNucleosome: NucleosomeData = None
 
+        # The number of mutations read from the mutation file so far.
+        self.mutationsRead = 0
+
 
     # Reads in the next mutation from the mutation data into currentMutation
     def readNextMutation(self) -> MutationData:
@@ -87,7 +90,9 @@ class CountsFileGenerator():
         if len(nextLine) == 0: 
             self.currentMutation = None
         # Otherwise, read in the next mutation.
-        else: self.currentMutation = MutationData(nextLine, self.acceptableChromosomes)
+        else: 
+            self.currentMutation = MutationData(nextLine, self.acceptableChromosomes)
+            self.mutationsRead += 1
 
     
     # Reads in the next nucleosome from the nucleosome positioning file into currentNucleosome
@@ -197,80 +202,98 @@ class CountsFileGenerator():
             self.reconcileChromosomes()
 
 
+    # Returns the counts at each dyad position as a table (a dictionary of column headers paired with lists of values).
+    def getCountsTable(self):
+
+        dyadPositions = list(range(-self.dyadRadius - self.linkerOffset, self.dyadRadius + self.linkerOffset + 1))
+
+        countsTable = dict()
+        countsTable["Dyad_Position"] = dyadPositions
+        countsTable["Plus_Strand_Counts"] = [self.plusStrandMutationCounts[i] for i in dyadPositions]
+        countsTable["Minus_Strand_Counts"] = [self.minusStrandMutationCounts[i] for i in dyadPositions]
+        countsTable["Both_Strands_Counts"] = [self.plusStrandMutationCounts[i] + self.minusStrandMutationCounts[i]
+                                              for i in dyadPositions]
+        countsTable["Aligned_Strands_Counts"] = [self.plusStrandMutationCounts[i] + self.minusStrandMutationCounts[-i]
+                                                 for i in dyadPositions]
+        return countsTable
+
+
     def writeResults(self):
 
         # Write the results to the output file.
-        with open(self.nucleosomeMutationCountsFilePath,'w') as nucleosomeMutationCountsFile:
-            
-            # Write the headers to the file.
-            nucleosomeMutationCountsFile.write('\t'.join(("Dyad_Position","Plus_Strand_Counts",
-                                                "Minus_Strand_Counts","Both_Strands_Counts",
-                                                "Aligned_Strands_Counts")) + '\n')
-            
-            # Write the data.
-            for i in range(-self.dyadRadius - self.linkerOffset, self.dyadRadius + self.linkerOffset + 1):
-                nucleosomeMutationCountsFile.write('\t'.join((str(i), str(self.plusStrandMutationCounts[i]), 
-                                                              str(self.minusStrandMutationCounts[i]), 
-                                                              str(self.plusStrandMutationCounts[i] + self.minusStrandMutationCounts[i]),
-                                                              str(self.plusStrandMutationCounts[i] + self.minusStrandMutationCounts[-i]))) 
-                                                   + '\n')
+        writeTableToTSV(self.getCountsTable(), self.nucleosomeMutationCountsFilePath)
 
 
-def countNucleosomePositionMutations(mutationFilePaths, countSingleNuc, countNucGroup, linkerOffset):
+# Counts the mutations at each dyad position for a single mutation file and writes the results to the appropriate raw
+# counts files.  Returns a dictionary of the raw counts file paths paired with the counts tables written to them.
+def getNucleosomeMutationCountsTables(mutationFilePath, countSingleNuc, countNucGroup, linkerOffset):
 
     if not (countSingleNuc or countNucGroup):
         raise ValueError("Must count in either a single nucleosome or group nucleosome radius.")
 
-    nucleosomeMutationCountsFilePaths = list() # A list of paths to the output files generated by the function
-
-    # Loop through each given mutation file path, creating a corresponding nucleosome mutation count file for each.
-    for mutationFilePath in mutationFilePaths:
+    countsTables = dict()
 
-        print("\nWorking with",os.path.split(mutationFilePath)[1])
+    print("\nWorking with",os.path.split(mutationFilePath)[1])
 
-        # Make sure we have the expected file type.
-        if not DataTypeStr.mutations in os.path.basename(mutationFilePath): 
-            raise ValueError("Mutation file should have \"" + DataTypeStr.mutations + "\" in the name.")
+    # Make sure we have the expected file type.
+    if not DataTypeStr.mutations in os.path.basename(mutationFilePath): 
+        raise ValueError("Mutation file should have \"" + DataTypeStr.mutations + "\" in the name.")
 
-        # Get metadata and use it to generate a path to the nucleosome positions file.
-        metadata = Metadata(mutationFilePath)
+    # Get metadata and use it to generate a path to the nucleosome positions file.
+    metadata = Metadata(mutationFilePath)
 
-        # Get the list of acceptable chromosomes
-        acceptableChromosomes = getAcceptableChromosomes(metadata.genomeFilePath)
+    # Get the list of acceptable chromosomes
+    acceptableChromosomes = getAcceptableChromosomes(metadata.genomeFilePath)
 
-        # Generate the counts file for a single nucleosome region if requested.
-        if countSingleNuc:
+    # Generate the counts file for a single nucleosome region if requested.
+    if countSingleNuc:
 
-            # Generate the output file path
-            nucleosomeMutationCountsFilePath = generateFilePath(directory = metadata.directory,
-                                                                dataGroup = metadata.dataGroupName, linkerOffset = linkerOffset, 
-                                                                fileExtension = ".tsv", dataType = DataTypeStr.rawNucCounts)
+        # Generate the output file path
+        nucleosomeMutationCountsFilePath = generateFilePath(directory = metadata.directory,
+                                                            dataGroup = metadata.dataGroupName, linkerOffset = linkerOffset, 
+                                                            fileExtension = ".tsv", dataType = DataTypeStr.rawNucCounts)
 
-            # Ready, set, go!
-            print("Counting mutations at each nucleosome position in a 73 bp radius +", str(linkerOffset), "bp linker DNA.")
+        # Ready, set, go!
+        print("Counting mutations at each nucleosome position in a 73 bp radius +", str(linkerOffset), "bp linker DNA.")
+        with measureStage("countNucleosomeMutations (73 bp radius)", mutationFilePath) as stageMetrics:
             counter = CountsFileGenerator(mutationFilePath, metadata.baseNucPosFilePath, 
                                           nucleosomeMutationCountsFilePath, 73, linkerOffset, acceptableChromosomes)
             counter.count()
             counter.writeResults()
+            stageMetrics.records = counter.mutationsRead
 
-            nucleosomeMutationCountsFilePaths.append(nucleosomeMutationCountsFilePath)
+        countsTables[nucleosomeMutationCountsFilePath] = counter.getCountsTable()
 
-        # Generate the counts file for a nucleosome group region if requested.
-        if countNucGroup:
+    # Generate the counts file for a nucleosome group region if requested.
+    if countNucGroup:
 
-            # Generate the output file path
-            nucleosomeMutationCountsFilePath = generateFilePath(directory = metadata.directory,
-                                                                dataGroup = metadata.dataGroupName, usesNucGroup = True,
-                                                                fileExtension = ".tsv", dataType = DataTypeStr.rawNucCounts)
+        # Generate the output file path
+        nucleosomeMutationCountsFilePath = generateFilePath(directory = metadata.directory,
+                                                            dataGroup = metadata.dataGroupName, usesNucGroup = True,
+                                                            fileExtension = ".tsv", dataType = DataTypeStr.rawNucCounts)
 
-            # Ready, set, go!
-            print("Counting mutations at each nucleosome position in a 1000 bp radius.")
+        # Ready, set, go!
+        print("Counting mutations at each nucleosome position in a 1000 bp radius.")
+        with measureStage("countNucleosomeMutations (1000 bp radius)", mutationFilePath) as stageMetrics:
             counter = CountsFileGenerator(mutationFilePath, metadata.baseNucPosFilePath, 
                                           nucleosomeMutationCountsFilePath, 1000, 0, acceptableChromosomes)
             counter.count()
             counter.writeResults()
+            stageMetrics.records = counter.mutationsRead
+
+        countsTables[nucleosomeMutationCountsFilePath] = counter.getCountsTable()
 
-            nucleosomeMutationCountsFilePaths.append(nucleosomeMutationCountsFilePath)
+    return countsTables
+
+
+def countNucleosomePositionMutations(mutationFilePaths, countSingleNuc, countNucGroup, linkerOffset):
+
+    nucleosomeMutationCountsFilePaths = list() # A list of paths to the output files generated by the function
+
+    # Loop through each given mutation file path, creating a corresponding nucleosome mutation count file for each.
+    for mutationFilePath in mutationFilePaths:
+        nucleosomeMutationCountsFilePaths += getNucleosomeMutationCountsTables(mutationFilePath, countSingleNuc,
+                                                                               countNucGroup, linkerOffset).keys()
 
     return nucleosomeMutationCountsFilePaths
 
@@ -278,6 +301,7 @@ def countNucleosomePositionMutations(mutationFilePaths, countSingleNuc, countNuc
 def main():
 
     #Create the Tkinter UI
+    from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog, Selections
     dialog = TkinterDialog(workingDirectory=getDataDirectory())
     dialog.createMultipleFileSelector("Mutation Files:",0,DataTypeStr.mutations+".bed",("Bed Files",".bed"))
     
@@ -2,21 +2,26 @@
 # create a bed file with an expanded tri/pentanucleotide context around the mutation.
 
 import os
-from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog, Selections
 from nucperiodpy.helper_scripts.UsefulBioinformaticsFunctions import bedToFasta, FastaFileIterator
 from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import Metadata, generateFilePath, DataTypeStr, getContext, getDataDirectory
+from nucperiodpy.helper_scripts.Instrumentation import measureStage
 
 
 # Expands the range of each mutation position in the original mutation file to encompass one extra base on either side.
+# Returns the number of mutations read from the original mutation file.
 def expandBedPositions(inputBedFilePath,bedExpansionFilePath,contextNum):
     "Expands the range of each mutation position in the original mutation file to encompass one extra base on either side."
 
+    mutationsRead = 0
+
     with open(bedExpansionFilePath,'w') as bedExpansionFile:
         with open(inputBedFilePath, 'r') as inputBedFile:
 
             print("Writing expanded mutation indicies to intermediate bed file...")
             for line in inputBedFile:
 
+                mutationsRead += 1
+
                 # Get a list of all the arguments for a single mutation in the bed file.
                 choppedUpLine = line.strip().split('\t')
 
@@ -32,6 +37,8 @@ def expandBedPositions(inputBedFilePath,bedExpansionFilePath,contextNum):
                 else: print("Mutation at chromosome", choppedUpLine[0], "with expanded start pos", choppedUpLine[1],
                             "extends into invalid positions.  Skipping.")
 
+    return mutationsRead
+
 
 # Uses the expanded reads fasta file to create a new bed file with the expanded mutational context.
 def generateExpandedContext(inputBedFilePath,fastaReadsFilePath,expandedContextFilePath,contextNum):
@@ -109,14 +116,16 @@ def expandContext(inputBedFilePaths, expansionContextNum):
         if not os.path.exists(intermediateFilesDirectory):
             os.mkdir(os.path.join(intermediateFilesDirectory))
 
-        # Expand the nucleotide coordinates in the singlenuc context bed file as requested.
-        expandBedPositions(inputBedFilePath,bedExpansionFilePath,expansionContextNum)
+        with measureStage("expandContext", inputBedFilePath) as stageMetrics:
+
+            # Expand the nucleotide coordinates in the singlenuc context bed file as requested.
+            stageMetrics.records = expandBedPositions(inputBedFilePath,bedExpansionFilePath,expansionContextNum)
 
-        # Convert the expanded coordinates in the bed file to the referenced nucleotides in fasta format.
-        bedToFasta(bedExpansionFilePath,metadata.genomeFilePath,fastaReadsFilePath)
+            # Convert the expanded coordinates in the bed file to the referenced nucleotides in fasta format.
+            bedToFasta(bedExpansionFilePath,metadata.genomeFilePath,fastaReadsFilePath)
 
-        # Using the newly generated fasta file, create a new bed file with the expanded context.
-        generateExpandedContext(inputBedFilePath,fastaReadsFilePath,expandedContextFilePath,expansionContextNum)
+            # Using the newly generated fasta file, create a new bed file with the expanded context.
+            generateExpandedContext(inputBedFilePath,fastaReadsFilePath,expandedContextFilePath,expansionContextNum)
 
         expandedContextFilePaths.append(expandedContextFilePath)
 
@@ -130,6 +139,7 @@ def expandContext(inputBedFilePaths, expansionContextNum):
 def main():
 
     # Create the Tkinter dialog.
+    from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog, Selections
     dialog = TkinterDialog(workingDirectory=getDataDirectory())
     dialog.createLabel("Note: Either single-base or trinuc context bed files will suffice.  Both are not necessary.",0,0,2)
     dialog.createMultipleFileSelector("Single-Base Bed File:",1,"singlenuc_" + DataTypeStr.mutations + ".bed",("Bed Files",".bed"))
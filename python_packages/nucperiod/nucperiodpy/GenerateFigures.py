@@ -1,9 +1,10 @@
 # This script takes paths to files containing nucleosome counts and exports them to an R script which generates
 # some nice plots for the files and exports them to a given location.
 
-import os, subprocess, sys
-from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog
-from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import getDataDirectory, rScriptsDirectory, checkDirs
+import os, subprocess
+from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import getDataDirectory, rScriptsDirectory, checkDirs, DataTypeStr
+from nucperiodpy.helper_scripts.DataCatalog import getCatalogedFilesInDirectory
+from nucperiodpy.helper_scripts.Instrumentation import measureStage
 
 
 def generateFigures(tsvFilePaths, rdaFilePaths, exportPath, omitOutliers, smoothNucGroup, 
@@ -35,33 +36,44 @@ def generateFigures(tsvFilePaths, rdaFilePaths, exportPath, omitOutliers, smooth
 
     # Call the R script to generate the figures.
     print("Calling R script...")
-    subprocess.run(" ".join(("Rscript",os.path.join(rScriptsDirectory,"GenerateFigures.R"),inputsFilePath, str(omitOutliers),
-                             str(smoothNucGroup), str(includeNorm), str(includeRaw), str(strandAlign))),
-                   shell = True, check = True)
+    with measureStage("R: GenerateFigures") as stageMetrics:
+        stageMetrics.records = len(tsvFilePaths) + len(rdaFilePaths)
+        stageMetrics.bytes = sum(os.path.getsize(filePath) for filePath in tsvFilePaths + rdaFilePaths)
+        subprocess.run(" ".join(("Rscript",os.path.join(rScriptsDirectory,"GenerateFigures.R"),inputsFilePath, str(omitOutliers),
+                                 str(smoothNucGroup), str(includeNorm), str(includeRaw), str(strandAlign))),
+                       shell = True, check = True)
 
 
 def parseArgs(args):
     
     # If only the subcommand was given, run the UI.
-    if len(sys.argv) == 2: 
+    if not args.subcommandArgumentsGiven: 
         main(); return
 
-    # Format the arguments.
-    if args.tsv_paths is None: args.tsv_paths = list()
-    if args.rda_paths is None: args.rda_paths = list()
+    # Format the arguments, searching any given directories for the relevant files.
+    tsvFilePaths = list()
+    for tsvPath in args.tsv_paths or list():
+        if os.path.isdir(tsvPath): tsvFilePaths += getCatalogedFilesInDirectory(tsvPath, DataTypeStr.generalNucCounts + ".tsv")
+        else: tsvFilePaths.append(tsvPath)
+
+    rdaFilePaths = list()
+    for rdaPath in args.rda_paths or list():
+        if os.path.isdir(rdaPath): rdaFilePaths += getCatalogedFilesInDirectory(rdaPath, ".rda")
+        else: rdaFilePaths.append(rdaPath)
 
     if args.output_directory is not None: exportPath = args.output_directory
     elif args.output_file is not None: exportPath = args.output_file
     else: raise ValueError("No output path given.")
 
     # Pass the given commands to the generateFigures function
-    generateFigures(args.tsv_paths, args.rda_paths, exportPath, args.omit_outliers, args.smooth_nuc_group,
+    generateFigures(tsvFilePaths, rdaFilePaths, exportPath, args.omit_outliers, args.smooth_nuc_group,
                     args.include_normalized, args.include_raw, args.align_strands)
 
 
 def main():
 
     #Create the Tkinter UI
+    from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog
     dialog = TkinterDialog(workingDirectory=getDataDirectory())
     dialog.createMultipleFileSelector("Nucleosome Counts Files:",0,
                                       "nucleosome_mutation_counts.tsv",("tsv files",".tsv"))
@@ -3,9 +3,9 @@
 
 import os
 from nucperiodpy.helper_scripts.UsefulBioinformaticsFunctions import reverseCompliment, FastaFileIterator
-from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import (Metadata, DataTypeStr, generateFilePath, 
-                                                                  getDataDirectory, getAcceptableChromosomes)
-from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog, Selections
+from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import (Metadata, DataTypeStr, generateFilePath, getDataDirectory,
+                                                                  getAcceptableChromosomes, getTemporaryFilePath)
+from nucperiodpy.helper_scripts.Instrumentation import measureStage
 
 
 # This function generates a file containing the frequencies of each tri/singlenuc context in a genome
@@ -63,6 +63,25 @@ def generateGenomeContextFrequencyFile(genomeFilePath, genomeContextFrequencyFil
             genomeContextFrequencyFile.write('\n')
 
 
+# Returns the path to the genome context frequency file for the given genome, generating the file first if it doesn't exist.
+# The file is written to a temporary path and then moved into place, so it can be shared safely between processes.
+def checkGenomeContextFrequencyFile(genomeFilePath, genomeName, contextNum, contextText):
+
+    genomeContextFrequencyFilePath = generateFilePath(directory = os.path.dirname(genomeFilePath),
+                                                      dataGroup = genomeName, context = contextText,
+                                                      dataType = "frequency", fileExtension = ".tsv")
+
+    if not os.path.exists(genomeContextFrequencyFilePath):
+        print("Genome " + contextText + " context frequency file not found at path:",genomeContextFrequencyFilePath)
+        print("Generating genome " + contextText + " context frequency file...")
+        temporaryFilePath = getTemporaryFilePath(genomeContextFrequencyFilePath)
+        with measureStage("generateGenomeContextFrequencies", genomeFilePath):
+            generateGenomeContextFrequencyFile(genomeFilePath, temporaryFilePath, contextNum, contextText)
+        os.replace(temporaryFilePath, genomeContextFrequencyFilePath)
+
+    return genomeContextFrequencyFilePath
+
+
 # This function gets the set of genome context counts from a given file path.
 # By default, the counts across both strands are given, but this can be changed to return
 # one strand or the other.
@@ -103,9 +122,8 @@ def getGenomeContextCounts(genomeContextFrequencyFilePath, countPlusStrand = Tru
     return contextCounts
 
 
-# This function generates a file containing the frequencies of each context that appears in a given mutation file.
-def generateMutationContextFrequencyFile(mutationFilePath, mutationContextFrequencyFilePath,
-                                         contextNum, contextText, acceptableChromosomes):
+# This function counts the occurrences of each context that appears in a given mutation file and returns them as a dictionary.
+def countMutationContexts(mutationFilePath, contextNum, contextText, acceptableChromosomes):
 
     contextCounts = dict() # A dictionary of all relevant contexts and their counts.
 
@@ -147,6 +165,12 @@ def generateMutationContextFrequencyFile(mutationFilePath, mutationContextFreque
             contextCounts.setdefault(context,0)
             contextCounts[context] += 1
 
+    return contextCounts
+
+
+# This function writes the given mutation context counts and their frequencies to a file.
+def writeMutationContextFrequencyFile(contextCounts, mutationContextFrequencyFilePath, contextText):
+
     # Get the total number of mutations by summing the context counts
     totalMutations = sum(contextCounts.values())
 
@@ -164,6 +188,16 @@ def generateMutationContextFrequencyFile(mutationFilePath, mutationContextFreque
             mutationContextFrequencyFile.write('\n')
 
 
+# This function generates a file containing the frequencies of each context that appears in a given mutation file.
+# Returns the context counts written to the file.
+def generateMutationContextFrequencyFile(mutationFilePath, mutationContextFrequencyFilePath,
+                                         contextNum, contextText, acceptableChromosomes):
+
+    contextCounts = countMutationContexts(mutationFilePath, contextNum, contextText, acceptableChromosomes)
+    writeMutationContextFrequencyFile(contextCounts, mutationContextFrequencyFilePath, contextText)
+    return contextCounts
+
+
 # This function returns a dictionary with the counts of mutations for each context.
 def getMutationContextCounts(mutationContextFrequencyFilePath):
 
@@ -187,15 +221,9 @@ def getMutationContextCounts(mutationContextFrequencyFilePath):
     return contextCounts
             
 
-# This function takes information on the mutational context frequency and the genome context frequency and uses it
-# to generate a list of probabilities that a given mutation will arise in a given context.
-def generateMutationBackgroundFile(genomeContextFrequencyFilePath, mutationContextFrequencyFilePath, 
-                                   mutationBackgroundFilePath, contextText):
-    print("Generating mutation background...")
-
-    # Get data on the necessary data to generate a background mutation rate.
-    genomeContextCounts = getGenomeContextCounts(genomeContextFrequencyFilePath)
-    mutationContextCounts = getMutationContextCounts(mutationContextFrequencyFilePath)
+# This function takes the counts of each context in the genome and in the mutation data and uses them to generate a
+# dictionary of probabilities that a given mutation will arise in a given context.
+def getBackgroundMutationRates(genomeContextCounts, mutationContextCounts):
 
     backgroundMutationRates = dict() # The rate at which a given context is mutated.
     
@@ -207,7 +235,12 @@ def generateMutationBackgroundFile(genomeContextFrequencyFilePath, mutationConte
     for context in mutationContextCounts:
         backgroundMutationRates[context] = mutationContextCounts[context]/genomeContextCounts[context]
 
-    # Write the results to the mutation background file
+    return backgroundMutationRates
+
+
+# This function writes the given background mutation rates to a mutation background file.
+def writeMutationBackgroundFile(backgroundMutationRates, mutationBackgroundFilePath, contextText):
+
     with open(mutationBackgroundFilePath, 'w') as mutationBackgroundFile:
 
         # Write headers to the file.
@@ -218,6 +251,21 @@ def generateMutationBackgroundFile(genomeContextFrequencyFilePath, mutationConte
             mutationBackgroundFile.write('\t'.join((context,str(backgroundMutationRates[context]))) + '\n')
 
 
+# This function takes information on the mutational context frequency and the genome context frequency and uses it
+# to generate a list of probabilities that a given mutation will arise in a given context.
+def generateMutationBackgroundFile(genomeContextFrequencyFilePath, mutationContextFrequencyFilePath, 
+                                   mutationBackgroundFilePath, contextText):
+    print("Generating mutation background...")
+
+    # Get data on the necessary data to generate a background mutation rate.
+    genomeContextCounts = getGenomeContextCounts(genomeContextFrequencyFilePath)
+    mutationContextCounts = getMutationContextCounts(mutationContextFrequencyFilePath)
+
+    # Write the results to the mutation background file
+    writeMutationBackgroundFile(getBackgroundMutationRates(genomeContextCounts, mutationContextCounts),
+                                mutationBackgroundFilePath, contextText)
+
+
 def generateMutationBackground(mutationFilePaths, backgroundContextNum):
     
     mutationBackgroundFilePaths = list() # A list of paths to the output files generated by the function
@@ -241,11 +289,6 @@ def generateMutationBackground(mutationFilePaths, backgroundContextNum):
         if not DataTypeStr.mutations in os.path.split(mutationFilePath)[1]:
             raise ValueError("Error:  Expected file with \"" + DataTypeStr.mutations + "\" in the name.")
 
-        # Generate the file path for the genome context frequency file.
-        genomeContextFrequencyFilePath = generateFilePath(directory = os.path.dirname(metadata.genomeFilePath),
-                                                          dataGroup = metadata.genomeName, context = contextText,
-                                                          dataType = "frequency", fileExtension = ".tsv")
-
         # Generate the file path for the mutation context frequency file.
         mutationContextFrequencyFilePath = generateFilePath(directory = intermediateFilesDirectory,
                                                             dataGroup = metadata.dataGroupName, context = contextText,
@@ -256,23 +299,24 @@ def generateMutationBackground(mutationFilePaths, backgroundContextNum):
                                                       context = contextText, dataType = DataTypeStr.mutBackground,
                                                       fileExtension = ".tsv")
 
-        # If the genome context frequency file doesn't exist, create it.
-        if not os.path.exists(genomeContextFrequencyFilePath):
-            print("Genome " + contextText + " context frequency file not found at path:",genomeContextFrequencyFilePath)
-            print("Generating genome " + contextText + " context frequency file...")
-            generateGenomeContextFrequencyFile(metadata.genomeFilePath, genomeContextFrequencyFilePath, backgroundContextNum, contextText)
+        # Get the genome context frequency file, creating it if it doesn't exist.
+        genomeContextFrequencyFilePath = checkGenomeContextFrequencyFile(metadata.genomeFilePath, metadata.genomeName,
+                                                                         backgroundContextNum, contextText)
 
         # Create a directory for intermediate files if it does not already exist...
         if not os.path.exists(intermediateFilesDirectory):
             os.mkdir(intermediateFilesDirectory)
 
-        # Create the mutation context frequency file.
-        print("Generating mutation context frequency file...")
-        generateMutationContextFrequencyFile(mutationFilePath,mutationContextFrequencyFilePath, backgroundContextNum, 
-                                             contextText, acceptableChromosomes)
+        with measureStage("generateMutationBackground", mutationFilePath) as stageMetrics:
+
+            # Create the mutation context frequency file.
+            print("Generating mutation context frequency file...")
+            contextCounts = generateMutationContextFrequencyFile(mutationFilePath,mutationContextFrequencyFilePath,
+                                                                 backgroundContextNum, contextText, acceptableChromosomes)
+            stageMetrics.records = sum(contextCounts.values())
 
-        # Generate the mutation background file.
-        generateMutationBackgroundFile(genomeContextFrequencyFilePath,mutationContextFrequencyFilePath,mutationBackgroundFilePath, contextText)
+            # Generate the mutation background file.
+            generateMutationBackgroundFile(genomeContextFrequencyFilePath,mutationContextFrequencyFilePath,mutationBackgroundFilePath, contextText)
 
         mutationBackgroundFilePaths.append(mutationBackgroundFilePath)
 
@@ -282,6 +326,7 @@ def generateMutationBackground(mutationFilePaths, backgroundContextNum):
 def main():
 
     #Create the Tkinter UI
+    from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog, Selections
     dialog = TkinterDialog(workingDirectory=getDataDirectory())
     dialog.createMultipleFileSelector("Bed Mutation Files:",0,DataTypeStr.mutations + ".bed",("Bed Files",".bed"))
     dialog.createDropdown("Background Context",1,0,("Trinuc","Singlenuc", "Pentanuc"))
@@ -3,9 +3,11 @@
 
 import os, subprocess
 from typing import Dict
-from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog, Selections
 from nucperiodpy.helper_scripts.UsefulBioinformaticsFunctions import bedToFasta, reverseCompliment, FastaFileIterator
-from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import getContext, getLinkerOffset, Metadata, generateFilePath, DataTypeStr, getDataDirectory
+from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import (getContext, getLinkerOffset, Metadata, generateFilePath, DataTypeStr,
+                                                                  getDataDirectory, getTemporaryFilePath, getContextText,
+                                                                  writeTableToTSV)
+from nucperiodpy.helper_scripts.Instrumentation import measureStage
 
 
 # This function takes a bed file of strongly positioned nucleosomes and expands their coordinates to encompass
@@ -33,9 +35,9 @@ def generateNucleosomeFasta(baseNucPosFilePath, genomeFilePath, dyadRadius, link
     else: print("Nucleosome fasta file not found at: ",nucPosFastaFilePath,"\nGenerating...", sep = '')
 
     # Generate the (temporary) expanded file path.
-    expandedNucPosBedFilePath = generateFilePath(directory = os.path.dirname(baseNucPosFilePath),
-                                                 dataGroup = os.path.basename(baseNucPosFilePath).rsplit('.',1)[0],
-                                                 dataType = "expanded", fileExtension = ".bed")
+    expandedNucPosBedFilePath = getTemporaryFilePath(generateFilePath(directory = os.path.dirname(baseNucPosFilePath),
+                                                     dataGroup = os.path.basename(baseNucPosFilePath).rsplit('.',1)[0],
+                                                     dataType = "expanded", fileExtension = ".bed"))
 
     # Expand the bed coordinates.
     print("Expanding nucleosome coordinates...")
@@ -53,9 +55,13 @@ def generateNucleosomeFasta(baseNucPosFilePath, genomeFilePath, dyadRadius, link
                 else: print("Nucleosome at chromosome", choppedUpLine[0], "with expanded start pos", choppedUpLine[1],
                             "extends into invalid positions.  Skipping.")
                                             
-    # Convert the expanded bed file to fasta format.
+    # Convert the expanded bed file to fasta format.  (Written to a temporary path and then moved into place
+    # so that other processes never see a partial file.)
     print("Converting expanded coordinates to fasta file...")
-    bedToFasta(expandedNucPosBedFilePath,genomeFilePath,nucPosFastaFilePath, includeStrand=False)
+    temporaryFastaFilePath = getTemporaryFilePath(nucPosFastaFilePath)
+    bedToFasta(expandedNucPosBedFilePath,genomeFilePath,temporaryFastaFilePath, includeStrand=False)
+    os.replace(temporaryFastaFilePath, nucPosFastaFilePath)
+    os.remove(expandedNucPosBedFilePath)
 
     return nucPosFastaFilePath
 
@@ -139,6 +145,43 @@ def generateDyadPosContextCounts(nucPosFastaFilePath, dyadPosContextCountsFilePa
             dyadPosContextCountsFile.write('\n')
         
     
+# Returns the dyad radius and linker offset used for either the single nucleosome or nucleosome group radius.
+def getDyadRadiusAndLinkerOffset(usesNucGroup, linkerOffset):
+    if usesNucGroup: return 1000, 0
+    else: return 73, linkerOffset
+
+
+# Returns the path to the genome wide dyad position context counts file for the given nucleosome positions and radius,
+# generating it (and the nucleosome fasta file it depends on) first if necessary.
+def checkDyadPosContextCountsFile(baseNucPosFilePath, nucPosName, genomeFilePath, contextNum, usesNucGroup, linkerOffset):
+
+    dyadRadius, currentLinkerOffset = getDyadRadiusAndLinkerOffset(usesNucGroup, linkerOffset)
+    contextText = getContextText(contextNum)
+
+    # Generate the path to the tsv file of dyad position context counts
+    dyadPosContextCountsFilePath = generateFilePath(directory = os.path.dirname(baseNucPosFilePath),
+                                                    dataGroup = nucPosName,
+                                                    context = contextText, linkerOffset = currentLinkerOffset,
+                                                    usesNucGroup = usesNucGroup,
+                                                    dataType = "dyad_pos_counts", fileExtension = ".tsv")
+
+    if not os.path.exists(dyadPosContextCountsFilePath):
+
+        with measureStage("generateDyadPosContextCounts", baseNucPosFilePath):
+
+            # Make sure we have a fasta file for strongly positioned nucleosome coordinates
+            nucPosFastaFilePath = generateNucleosomeFasta(baseNucPosFilePath, genomeFilePath, dyadRadius, currentLinkerOffset)
+
+            print("Dyad position " + contextText + " counts file not found at",dyadPosContextCountsFilePath)
+            print("Generating genome wide dyad position " + contextText + " counts file...")
+            temporaryFilePath = getTemporaryFilePath(dyadPosContextCountsFilePath)
+            generateDyadPosContextCounts(nucPosFastaFilePath, temporaryFilePath,
+                                         contextNum, dyadRadius, currentLinkerOffset)
+            os.replace(temporaryFilePath, dyadPosContextCountsFilePath)
+
+    return dyadPosContextCountsFilePath
+
+
 # This function retrieves the context counts for each dyad position in a genome from a given file.
 # The data is returned as a dictionary of dictionaries, with the first key being dyad position and the second
 # being a context.
@@ -165,24 +208,20 @@ def getDyadPosContextCounts(dyadPosContextCountsFilePath):
     return dyadPosContextCounts
 
 
-# This function generates a nucleosome mutation background file from a general mutation background file
-# and a file of strongly positioned nucleosome coordinates.
-def generateNucleosomeMutationBackgroundFile(dyadPosContextCountsFilePath, mutationBackgroundFilePath, 
-                                             nucleosomeMutationBackgroundFilePath, dyadRadius, linkerOffset):
+# This function calculates the expected mutations at each dyad position from the given background mutation rates and
+# dyad position context counts.  The results are returned as a table (a dictionary of column headers paired with lists of values).
+def getNucleosomeMutationBackgroundTable(dyadPosContextCounts, backgroundMutationRate, dyadRadius, linkerOffset):
 
     # Dictionaries of expected mutations for every dyad position included in the analysis, one for each strand.
     plusStrandNucleosomeMutationBackground = dict() 
     minusStrandNucleosomeMutationBackground = dict()
 
     # Initialize the dictionary
-    for dyadPos in range(-dyadRadius - linkerOffset, dyadRadius + linkerOffset + 1): 
+    dyadPositions = list(range(-dyadRadius - linkerOffset, dyadRadius + linkerOffset + 1))
+    for dyadPos in dyadPositions: 
         plusStrandNucleosomeMutationBackground[dyadPos] = 0
         minusStrandNucleosomeMutationBackground[dyadPos] = 0
 
-    # Get the corresponding mutation background and context counts dictionaries.
-    backgroundMutationRate = getGenomeBackgroundMutationRates(mutationBackgroundFilePath)
-    dyadPosContextCounts = getDyadPosContextCounts(dyadPosContextCountsFilePath)
-
     # Calculate the expected mutation rates for each dyad position based on the context counts at that position and that context's mutation rate
     for dyadPos in dyadPosContextCounts:
 
@@ -194,25 +233,34 @@ def generateNucleosomeMutationBackgroundFile(dyadPosContextCountsFilePath, mutat
             plusStrandNucleosomeMutationBackground[dyadPos] += backgroundMutationRate[context] * dyadPosContextCounts[dyadPos][context]
             minusStrandNucleosomeMutationBackground[dyadPos] += backgroundMutationRate[reverseContext] * dyadPosContextCounts[dyadPos][context]
 
-    # Write the results of the dictionary to the nucleosome mutation background file.
-    with open(nucleosomeMutationBackgroundFilePath, 'w') as nucleosomeMutationBackgroundFile:
+    nucleosomeMutationBackgroundTable = dict()
+    nucleosomeMutationBackgroundTable["Dyad_Position"] = dyadPositions
+    nucleosomeMutationBackgroundTable["Expected_Mutations_Plus_Strand"] = [plusStrandNucleosomeMutationBackground[dyadPos]
+                                                                           for dyadPos in dyadPositions]
+    nucleosomeMutationBackgroundTable["Expected_Mutations_Minus_Strand"] = [minusStrandNucleosomeMutationBackground[dyadPos]
+                                                                            for dyadPos in dyadPositions]
+    nucleosomeMutationBackgroundTable["Expected_Mutations_Both_Strands"] = [
+        plusStrandNucleosomeMutationBackground[dyadPos] + minusStrandNucleosomeMutationBackground[dyadPos] for dyadPos in dyadPositions
+    ]
+    nucleosomeMutationBackgroundTable["Expected_Mutations_Aligned_Strands"] = [
+        plusStrandNucleosomeMutationBackground[dyadPos] + minusStrandNucleosomeMutationBackground[-dyadPos] for dyadPos in dyadPositions
+    ]
 
-        # Write the headers for the data.
-        headers = '\t'.join(("Dyad_Position","Expected_Mutations_Plus_Strand",
-                             "Expected_Mutations_Minus_Strand","Expected_Mutations_Both_Strands",
-                             "Expected_Mutations_Aligned_Strands"))
+    return nucleosomeMutationBackgroundTable
 
-        nucleosomeMutationBackgroundFile.write(headers + '\n')
-        
-        # Write the data for each dyad position.
-        for dyadPos in range(- dyadRadius - linkerOffset, dyadRadius + linkerOffset + 1):
 
-            dataRow = '\t'.join((str(dyadPos),str(plusStrandNucleosomeMutationBackground[dyadPos]),
-            str(minusStrandNucleosomeMutationBackground[dyadPos]),
-            str(plusStrandNucleosomeMutationBackground[dyadPos] + minusStrandNucleosomeMutationBackground[dyadPos]),
-            str(plusStrandNucleosomeMutationBackground[dyadPos] + minusStrandNucleosomeMutationBackground[-dyadPos])))
+# This function generates a nucleosome mutation background file from a general mutation background file
+# and a file of strongly positioned nucleosome coordinates.
+def generateNucleosomeMutationBackgroundFile(dyadPosContextCountsFilePath, mutationBackgroundFilePath, 
+                                             nucleosomeMutationBackgroundFilePath, dyadRadius, linkerOffset):
+
+    # Get the corresponding mutation background and context counts dictionaries.
+    backgroundMutationRate = getGenomeBackgroundMutationRates(mutationBackgroundFilePath)
+    dyadPosContextCounts = getDyadPosContextCounts(dyadPosContextCountsFilePath)
 
-            nucleosomeMutationBackgroundFile.write(dataRow + '\n')
+    # Write the expected mutations at each dyad position to the nucleosome mutation background file.
+    writeTableToTSV(getNucleosomeMutationBackgroundTable(dyadPosContextCounts, backgroundMutationRate, dyadRadius, linkerOffset),
+                    nucleosomeMutationBackgroundFilePath)
 
 
 def generateNucleosomeMutationBackground(mutationBackgroundFilePaths, useSingleNucRadius, 
@@ -243,29 +291,12 @@ def generateNucleosomeMutationBackground(mutationBackgroundFilePaths, useSingleN
         def generateBackgroundBasedOnRadius(usesNucGroup):
 
             # Set the dyad radius (And linker offset)
-            if usesNucGroup: 
-                dyadRadius = 1000
-                currentLinkerOffset = 0
-            else: 
-                dyadRadius = 73
-                currentLinkerOffset = linkerOffset
-
-            # Make sure we have a fasta file for strongly positioned nucleosome coordinates
-            nucPosFastaFilePath = generateNucleosomeFasta(metadata.baseNucPosFilePath, metadata.genomeFilePath, dyadRadius, currentLinkerOffset)
-
-            # Generate the path to the tsv file of dyad position context counts
-            dyadPosContextCountsFilePath = generateFilePath(directory = os.path.dirname(metadata.baseNucPosFilePath),
-                                                            dataGroup = metadata.nucPosName,
-                                                            context = contextText, linkerOffset = currentLinkerOffset,
-                                                            usesNucGroup = usesNucGroup,
-                                                            dataType = "dyad_pos_counts", fileExtension = ".tsv")
+            dyadRadius, currentLinkerOffset = getDyadRadiusAndLinkerOffset(usesNucGroup, linkerOffset)
 
             # Make sure we have a tsv file with the appropriate context counts at each dyad position.
-            if not os.path.exists(dyadPosContextCountsFilePath): 
-                print("Dyad position " + contextText + " counts file not found at",dyadPosContextCountsFilePath)
-                print("Generating genome wide dyad position " + contextText + " counts file...")
-                generateDyadPosContextCounts(nucPosFastaFilePath, dyadPosContextCountsFilePath,
-                                            contextNum, dyadRadius, currentLinkerOffset)
+            dyadPosContextCountsFilePath = checkDyadPosContextCountsFile(metadata.baseNucPosFilePath, metadata.nucPosName,
+                                                                         metadata.genomeFilePath, contextNum,
+                                                                         usesNucGroup, linkerOffset)
 
             # A path to the final output file.
             nucleosomeMutationBackgroundFilePath = generateFilePath(directory = metadata.directory, dataGroup = metadata.dataGroupName,
@@ -274,8 +305,10 @@ def generateNucleosomeMutationBackground(mutationBackgroundFilePaths, useSingleN
                                                                     dataType = DataTypeStr.nucMutBackground, fileExtension = ".tsv")
 
             # Generate the nucleosome mutation background file!
-            generateNucleosomeMutationBackgroundFile(dyadPosContextCountsFilePath,mutationBackgroundFilePath,
-                                                    nucleosomeMutationBackgroundFilePath, dyadRadius, currentLinkerOffset)
+            with measureStage("generateNucleosomeMutationBackground (" + str(dyadRadius) + " bp radius)",
+                              mutationBackgroundFilePath):
+                generateNucleosomeMutationBackgroundFile(dyadPosContextCountsFilePath,mutationBackgroundFilePath,
+                                                        nucleosomeMutationBackgroundFilePath, dyadRadius, currentLinkerOffset)
 
             nucleosomeMutationBackgroundFilePaths.append(nucleosomeMutationBackgroundFilePath)
 
@@ -290,6 +323,7 @@ def generateNucleosomeMutationBackground(mutationBackgroundFilePaths, useSingleN
 def main():
 
     #Create the Tkinter UI
+    from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog, Selections
     dialog = TkinterDialog(workingDirectory=getDataDirectory())
     dialog.createMultipleFileSelector("Mutation Background Files:",0,DataTypeStr.mutBackground + ".tsv",("Tab Seperated Values Files",".tsv"))
 
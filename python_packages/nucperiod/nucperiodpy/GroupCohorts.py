@@ -1,7 +1,6 @@
 # This script takes a given cohort group (e.g. microsatellite satellite stability) and groups it by a potential secondary cohort feature (e.g. mut sigs)
 import os
 from typing import Dict
-from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog, Selections
 from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import getDataDirectory
 
 
@@ -61,6 +60,7 @@ def groupCohorts(dataSetDirectory):
 def main():
 
     #Create the Tkinter UI
+    from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog, Selections
     dialog = TkinterDialog(workingDirectory=getDataDirectory())
     dialog.createFileSelector("Data Set Directory:",0,directory=True)
     
@@ -1,9 +1,10 @@
 # This script will be called from the command line to execute other scripts.
+# The module for each command is only imported once that command is chosen (see getCommandFunction), so that
+# startup stays fast and headless commands never load the Tkinter UI.
 from argparse import ArgumentParser
-from nucperiodpy import (RunNucleosomeMutationAnalysis, RunAnalysisSuite, GenerateFigures)
-from nucperiodpy.input_parsing import (ParseCustomBed, ParseICGC)
 from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import DataTypeStr
-import argparse, importlib.util
+from nucperiodpy.helper_scripts.Instrumentation import writeMetricsReport
+import argparse, importlib, importlib.util, sys, time
 if importlib.util.find_spec("shtab") is not None: 
         import shtab
         fileCompletion = shtab.FILE
@@ -15,7 +16,7 @@ else:
 
 def formatParseICGCParser(parseICGCParser: ArgumentParser):
 
-    parseICGCParser.set_defaults(func = ParseICGC.parseArgs)
+    parseICGCParser.set_defaults(commandModule = "nucperiodpy.input_parsing.ParseICGC")
     parseICGCParser.add_argument("ICGCFilePaths", nargs = '*',
                                  help = "One or more paths to ICGC files to parse.  Should be gzipped.  If given a directory, \
                                          the directory will be recursively searched for files ending in \".tsv.gz\".").complete = fileCompletion
@@ -30,11 +31,18 @@ def formatParseICGCParser(parseICGCParser: ArgumentParser):
                                  help = "Whether or not to stratify results by microsatellite stability")
     parseICGCParser.add_argument("-s", "--stratify-by-Mut-Sigs", action = "store_true", 
                                  help = "Whether or not to stratify results by mutation signature")
+    parseICGCParser.add_argument("-j", "--jobs", type = int, default = 1,
+                                 help = "The number of ICGC files to convert and pass to the custom bed parser in parallel.  \
+                                         When greater than 1, the output for each file is written to a log file \
+                                         in its intermediate_files directory.  (1 by default)")
+    parseICGCParser.add_argument("-r", "--stream-records", action = "store_true",
+                                 help = "Pass mutations directly to the custom bed parser in a single pass instead of \
+                                         writing them to an intermediate custom bed file first.")
 
 
 def formatParseBedParser(parseBedParser: ArgumentParser):
 
-    parseBedParser.set_defaults(func = ParseCustomBed.parseArgs)
+    parseBedParser.set_defaults(commandModule = "nucperiodpy.input_parsing.ParseCustomBed")
     parseBedParser.add_argument("bedFilePaths", nargs = '*',
                                 help = "One or more paths to bed files to parse.  If given a directory, \
                                         the directory will be recursively searched for files ending in \"custom_input.bed\".").complete = fileCompletion
@@ -48,11 +56,15 @@ def formatParseBedParser(parseBedParser: ArgumentParser):
                                  help = "Whether or not to stratify results by microsatellite stability")
     parseBedParser.add_argument("-s", "--stratify-by-Mut-Sigs", action = "store_true", 
                                  help = "Whether or not to stratify results by mutation signature")
+    parseBedParser.add_argument("-p", "--single-pass", action = "store_true",
+                                 help = "Check, auto-acquire, and convert each input file in a single pass without sorting or \
+                                 overwriting it.  Data stratified by microsatellite stability or mutation signature is \
+                                 staged and sorted once at the end.")
 
 
 def formatMainPipelineParser(mainPipelineParser: ArgumentParser):
 
-    mainPipelineParser.set_defaults(func = RunAnalysisSuite.parseArgs)
+    mainPipelineParser.set_defaults(commandModule = "nucperiodpy.RunAnalysisSuite")
     mainPipelineParser.add_argument("mutationFilePaths", nargs = '*',
                                     help = "One or more bed mutation files to run through the pipeline.  These files should be \
                                             output from either parseICGC or parseBed.  If given a directory, the directory \
@@ -78,11 +90,31 @@ def formatMainPipelineParser(mainPipelineParser: ArgumentParser):
     mainPipelineParser.add_argument("-g", "--nuc-group-radius", action = "store_true",
                                     help = "Generate output files where mutations are counted within a 1000 base pair radius \
                                             of each dyad center to cover a group of several nucleosomes.")
+    mainPipelineParser.add_argument("-m", "--nucleosome-mutation-cutoff", type = int, default = 0,
+                                    help = "Skip data sets with fewer than this many mutations within 60 base pairs of \
+                                            nucleosome dyads as early as possible in the pipeline.  The periodicity analysis \
+                                            filters out data sets below 5000 such mutations anyway.  (No cutoff by default)")
+    mainPipelineParser.add_argument("-j", "--jobs", type = int, default = 1,
+                                    help = "The number of mutation files to run through the pipeline in parallel.  \
+                                            When greater than 1, the output for each file is written to a log file \
+                                            in its intermediate_files directory.  (1 by default)")
+    mainPipelineParser.add_argument("-f", "--force", action = "store_true",
+                                    help = "Recompute every stage, even if its outputs are up to date with its inputs.")
+    mainPipelineParser.add_argument("-i", "--in-memory", action = "store_true",
+                                    help = "Pass mutation context counts, backgrounds, and counts directly between stages \
+                                            instead of through intermediate files.  Only the raw and normalized counts files \
+                                            are written.  (Only affects context normalization.)")
+    mainPipelineParser.add_argument("-k", "--keep-intermediates", action = "store_true",
+                                    help = "When running in memory, also write the mutation context frequency, mutation \
+                                            background, and nucleosome mutation background files.")
+    mainPipelineParser.add_argument("-r", "--resume", action = "store_true",
+                                    help = "Resume a previous run with the same inputs and options that did not finish, \
+                                            skipping any tasks it completed.")
 
 
 def formatperiodicityAnalysisParser(periodicityAnalysisParser: ArgumentParser):
 
-    periodicityAnalysisParser.set_defaults(func = RunNucleosomeMutationAnalysis.parseArgs)
+    periodicityAnalysisParser.set_defaults(commandModule = "nucperiodpy.RunNucleosomeMutationAnalysis")
 
     periodicityAnalysisParser.add_argument("nucleosomeMutationFilePaths", nargs = '*',
                                            help = "One or more nucleosome mutation counts file paths.  These files should be \
@@ -95,6 +127,11 @@ def formatperiodicityAnalysisParser(periodicityAnalysisParser: ArgumentParser):
                                                    output the periodicity results.  The analysis process will attempt to create \
                                                    the file if it does not already exist.").complete = fileCompletion
 
+    periodicityAnalysisParser.add_argument("-p", "--permutations", type = int, default = 0,
+                                           help = "Derive an empirical p-value for each periodicity SNR by comparing it to the \
+                                                   SNRs of this many random shuffles of the counts across dyad positions.  \
+                                                   (e.g. 10000)  By default, no permutations are run.")
+
     groupComparison = periodicityAnalysisParser.add_argument_group("Periodicity Comparison")
     groupComparison.add_argument("--group-1", nargs = '*',
                                  help = "One or more nucleosome file paths, similar to the nucleosomeMutationFilePaths argument.  \
@@ -106,14 +143,33 @@ def formatperiodicityAnalysisParser(periodicityAnalysisParser: ArgumentParser):
                                        help = "The counterpart to --group-1").complete = fileCompletion
 
 
+def formatAsymmetryAnalysisParser(asymmetryAnalysisParser: ArgumentParser):
+
+    asymmetryAnalysisParser.set_defaults(commandModule = "nucperiodpy.RunAsymmetryAnalysis")
+
+    asymmetryAnalysisParser.add_argument("nucleosomeMutationFilePaths", nargs = '*',
+                                         help = "One or more nucleosome mutation counts file paths.  These files should be \
+                                                 output from the main nucperiod pipeline.  If given a directory, the directory \
+                                                 will be recursively searched for files ending in \
+                                                 \"" + DataTypeStr.generalNucCounts + ".tsv\"").complete = fileCompletion
+    asymmetryAnalysisParser.add_argument("-o", "--output-file-path",
+                                         help = "The output .tsv file path for the asymmetry analysis results.").complete = fileCompletion
+    asymmetryAnalysisParser.add_argument("-v", "--valleys", action = "store_true",
+                                         help = "Compare the valleys in each data set instead of the peaks.")
+    asymmetryAnalysisParser.add_argument("-a", "--align-strands", action = "store_true",
+                                         help = "Use strand aligned counts instead of the counts for both strands.")
+
+
 def formatGenerateFiguresParser(generateFiguresParser: ArgumentParser):
 
-    generateFiguresParser.set_defaults(func = GenerateFigures.parseArgs)
+    generateFiguresParser.set_defaults(commandModule = "nucperiodpy.GenerateFigures")
 
     generateFiguresParser.add_argument("--rda-paths", nargs = '*',
-                                        help = "One or more paths to .rda files resulting from the periodicity analysis.").complete = fileCompletion
+                                        help = "One or more paths to .rda files resulting from the periodicity analysis.  \
+                                                Directories are searched for .rda files.").complete = fileCompletion
     generateFiguresParser.add_argument("--tsv-paths", nargs = '*',
-                                       help = "One or more paths to .tsv nucleosome counts files.").complete = fileCompletion
+                                       help = "One or more paths to .tsv nucleosome counts files.  \
+                                               Directories are searched for nucleosome counts files.").complete = fileCompletion
 
     outputGroup = generateFiguresParser.add_mutually_exclusive_group()
 
@@ -141,6 +197,58 @@ def formatGenerateFiguresParser(generateFiguresParser: ArgumentParser):
 
     generateFiguresParser.add_argument("-r", "--include-raw", action = "store_true",
                                        help = "For .rda input, use raw counts tables to generate figures.")
+
+
+# Converts the given text to a count, allowing scientific notation. (e.g. "1e6")
+def getCount(countText):
+    return int(float(countText))
+
+
+def formatBenchmarkParser(benchmarkParser: ArgumentParser):
+
+    benchmarkParser.set_defaults(commandModule = "nucperiodpy.benchmarks.RunBenchmarks")
+    benchmarkParser.add_argument("-m", "--mutations", type = getCount, default = 10**4,
+                                 help = "The number of synthetic mutations to generate, e.g. 1e4 to 1e8. (Default: 1e4)")
+    benchmarkParser.add_argument("-c", "--cohorts", type = int, default = 0,
+                                 help = "Assign the mutations to this many cohorts, which are then separated by parseBed.  \
+                                         (By default, no cohort column is generated.)")
+    benchmarkParser.add_argument("--genome-size", type = getCount, default = 10**6,
+                                 help = "The size of the synthetic genome in base pairs. (Default: 1e6)")
+    benchmarkParser.add_argument("--chromosomes", type = int, default = 4,
+                                 help = "The number of chromosomes in the synthetic genome. (Default: 4)")
+    benchmarkParser.add_argument("--seed", type = int, default = 0,
+                                 help = "The seed used to generate the synthetic data. (Default: 0)")
+    benchmarkParser.add_argument("-o", "--output-dir",
+                                 help = "The directory to write the synthetic data, logs, and benchmark report to.  \
+                                         By default, a new temporary directory is created.").complete = fileCompletion
+    benchmarkParser.add_argument("-k", "--keep-data", action = "store_true",
+                                 help = "Keep the synthetic data directory after the benchmark finishes.")
+    benchmarkParser.add_argument("-j", "--jobs", type = int, default = 1,
+                                 help = "The number of jobs to pass to the main pipeline.")
+    benchmarkParser.add_argument("-i", "--in-memory", action = "store_true",
+                                 help = "Run the main pipeline in in-memory mode.  (Used automatically if R is not installed.)")
+    benchmarkParser.add_argument("-g", "--nuc-group-radius", action = "store_true",
+                                 help = "Also count mutations in the 1000 base pair nucleosome group radius.  \
+                                         (Generating its genome-wide background is slow for large genomes.)")
+
+
+def formatMicroBenchmarkParser(microBenchmarkParser: ArgumentParser):
+
+    microBenchmarkParser.set_defaults(commandModule = "nucperiodpy.benchmarks.MicroBenchmarks")
+    microBenchmarkParser.add_argument("kernels", nargs = '*', metavar = "kernel",
+                                      help = "The kernels to benchmark, e.g. FastaFileIterator or WriteManager.writeData.  \
+                                              (By default, all of them.)")
+    microBenchmarkParser.add_argument("-r", "--repeats", type = int,
+                                      help = "The number of times to run each kernel.  The best time is compared. \
+                                              (Default: 5, or 15 when saving or comparing against a baseline)")
+    microBenchmarkParser.add_argument("--save-baseline", metavar = "baseline.json",
+                                      help = "Save the results to this file as a baseline.").complete = fileCompletion
+    microBenchmarkParser.add_argument("--compare", metavar = "baseline.json",
+                                      help = "Compare the results against this previously saved baseline.").complete = fileCompletion
+    microBenchmarkParser.add_argument("--threshold", type = float, default = 20,
+                                      help = "Flag kernels which are this many percent slower than the baseline as \
+                                              regressions.  Kernels which appear to have regressed are run again to \
+                                              confirm it before they are flagged. (Default: 20)")
     
 
 def getMainParser():
@@ -148,6 +256,12 @@ def getMainParser():
     # Initialize the argument parser.
     parser = argparse.ArgumentParser(description = "Run nucperiod to analyze nucleosome mutational periodicity.",
                                      prog = "nucperiod")
+    parser.add_argument("--metrics", metavar = "out.json",
+                        help = "Write the wall time, CPU time, peak memory usage, and records/bytes processed by each \
+                                stage of the given command to this json file.").complete = fileCompletion
+    parser.add_argument("--profile", metavar = "DIR",
+                        help = "Profile the given command, writing a .pstats file for each stage (and one for everything \
+                                outside of the stages) along with a summary of the top hotspots to this directory.").complete = fileCompletion
     subparsers = parser.add_subparsers(title='nucperiod command', required = True, dest = "nucperiod command")
 
     ### Create the subparsers for each relevant script.
@@ -179,20 +293,79 @@ def getMainParser():
     formatperiodicityAnalysisParser(periodicityAnalysisParser)
     
 
+    # For AsymmetryAnalysis...
+    asymmetryAnalysisParser = subparsers.add_parser("asymmetryAnalysis", description = "Pass in one or more nucleosome mutation counts \
+                                                                                        files to compare the extremes on either side \
+                                                                                        of the dyad for signs of asymmetry.")
+    formatAsymmetryAnalysisParser(asymmetryAnalysisParser)
+
+
     # For GenerateFigures...
     generateFiguresParser = subparsers.add_parser("generateFigures", description = "Generates figures from nucleosome counts data or \
                                                                                     the output from the periodicity analysis.")
     formatGenerateFiguresParser(generateFiguresParser)                                                                                
 
 
+    # For RunBenchmarks...
+    benchmarkParser = subparsers.add_parser("benchmark", description = "Generate a synthetic genome, nucleosome map, and \
+                                                                        mutation data set, and then time parseBed, the main \
+                                                                        pipeline, and the periodicity analysis on them.")
+    formatBenchmarkParser(benchmarkParser)
+
+
+    # For MicroBenchmarks...
+    microBenchmarkParser = subparsers.add_parser("microbenchmark", description = "Time the hot kernels of nucperiod on fixed \
+                                                                                  synthetic inputs, reporting the time taken \
+                                                                                  per record.")
+    formatMicroBenchmarkParser(microBenchmarkParser)
+
+
     return parser
 
 
+# The options given before the subcommand which take a value.
+globalOptionsWithValues = ("--metrics", "--profile")
+
+
+# Returns whether or not any arguments were given to the subcommand in the given command line arguments (excluding the
+# program name), skipping over any global options given before it.  If none were, the command opens its UI instead.
+def checkForSubcommandArguments(commandLineArguments):
+
+    i = 0
+    while i < len(commandLineArguments) and commandLineArguments[i].startswith('-'):
+        # Options given as "--option value" (or an abbreviation of the option) also skip their value.
+        if '=' not in commandLineArguments[i] and any(option.startswith(commandLineArguments[i])
+                                                      for option in globalOptionsWithValues): i += 2
+        else: i += 1
+
+    # The argument at i is the subcommand itself.
+    return len(commandLineArguments) > i + 1
+
+
+# Imports the module for the chosen command and returns the function which runs it.
+def getCommandFunction(args):
+    return importlib.import_module(args.commandModule).parseArgs
+
+
 def main():
 
     # Run the relevant function for the subparser given.
     args = getMainParser().parse_args()
-    args.func(args)
+    args.subcommandArgumentsGiven = checkForSubcommandArguments(sys.argv[1:])
+    commandFunction = getCommandFunction(args)
+
+    if args.profile is not None:
+        from nucperiodpy.helper_scripts.Profiling import CommandProfiler
+        profiler = CommandProfiler(args.profile)
+        profiler.start()
+
+    startTime = time.perf_counter()
+    try: commandFunction(args)
+    finally:
+        if args.profile is not None: profiler.stop()
+        # Report any metrics, even if the command failed partway through.
+        if args.metrics is not None:
+            writeMetricsReport(args.metrics, ' '.join(sys.argv[1:]), time.perf_counter() - startTime)
 
 
 if __name__ == "__main__": main()
\ No newline at end of file
@@ -1,10 +1,10 @@
 # This script takes raw nucleosome mutation count files, and passes them an R script which normalizes the data.
 
-import os, subprocess, datetime
+import os, math, tempfile, subprocess, datetime
 from typing import List
-from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog, Selections
 from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import (getLinkerOffset, getContext, getDataDirectory, Metadata, 
                                                                   generateFilePath, DataTypeStr, rScriptsDirectory, checkForNucGroup)
+from nucperiodpy.helper_scripts.Instrumentation import measureStage
 
 
 # Pairs each background file path with its respective raw counts file path.
@@ -56,6 +56,61 @@ def getCustomBackgroundRawPairs(customRawCountsFilePaths, customBackgroundCounts
     return customBackgroundRawPairs
 
 
+# Normalizes the given raw counts table by the given nucleosome mutation background table the same way that
+# normalizeNucleosomeMutationCounts in nucperiodR does, returning a table of the normalized values.
+# (Tables are dictionaries of column headers paired with lists of values.)
+def getNormalizedCountsTable(rawCountsTable, backgroundCountsTable):
+
+    # Make sure that the raw and background counts both use the same number of dyad positions.
+    if len(rawCountsTable["Dyad_Position"]) != len(backgroundCountsTable["Dyad_Position"]):
+        raise ValueError("Unequal dyad positions in raw vs. background counts data.")
+
+    # Compute a factor to adjust normalized values based on the ratio of total background:raw nucleosome mutation counts.
+    totalRawCounts = sum(rawCountsTable["Both_Strands_Counts"])
+    if totalRawCounts == 0: totalCountsAdjust = float("inf")
+    else: totalCountsAdjust = sum(backgroundCountsTable["Expected_Mutations_Both_Strands"]) / totalRawCounts
+
+    # Normalizes data by dividing raw by expected, except in the case where expected is 0. (To avoid dividing by zero)
+    def normalize(rawColumn, expectedColumn):
+        return [0 if expected == 0 else raw/expected*totalCountsAdjust
+                for raw, expected in zip(rawCountsTable[rawColumn], backgroundCountsTable[expectedColumn])]
+
+    normalizedCountsTable = dict()
+    normalizedCountsTable["Dyad_Position"] = backgroundCountsTable["Dyad_Position"]
+    normalizedCountsTable["Normalized_Minus_Strand"] = normalize("Minus_Strand_Counts", "Expected_Mutations_Minus_Strand")
+    normalizedCountsTable["Normalized_Plus_Strand"] = normalize("Plus_Strand_Counts", "Expected_Mutations_Plus_Strand")
+    normalizedCountsTable["Normalized_Both_Strands"] = normalize("Both_Strands_Counts", "Expected_Mutations_Both_Strands")
+    normalizedCountsTable["Normalized_Aligned_Strands"] = normalize("Aligned_Strands_Counts", "Expected_Mutations_Aligned_Strands")
+
+    return normalizedCountsTable
+
+
+# Formats values in normalized counts tables the same way as data.table's fwrite: up to 15 significant digits, written in
+# fixed notation unless scientific notation (e.g. "1e-04") would be shorter.
+# Like fwrite, NaN values (e.g. from data sets with no raw counts) are written as blank and infinities as "Inf" or "-Inf".
+def formatNormalizedValue(value):
+
+    if not isinstance(value, float): return str(value)
+    elif math.isnan(value): return ''
+    elif math.isinf(value): return "Inf" if value > 0 else "-Inf"
+    elif value == 0: return '0'
+
+    # Get the significant digits (without trailing zeros) and the exponent.
+    mantissa, exponent = ("%.14e" % abs(value)).split('e')
+    digits = mantissa.replace('.','').rstrip('0')
+    exponent = int(exponent)
+
+    if exponent >= 0:
+        fixedNotation = digits[:exponent+1].ljust(exponent+1,'0')
+        if len(digits) > exponent+1: fixedNotation += '.' + digits[exponent+1:]
+    else: fixedNotation = "0." + '0'*(-exponent-1) + digits
+
+    scientificNotation = (digits[0] + ('.' + digits[1:] if len(digits) > 1 else '') +
+                          'e' + ('-' if exponent < 0 else '+') + "%02d" % abs(exponent))
+
+    return ('-' if value < 0 else '') + (fixedNotation if len(fixedNotation) <= len(scientificNotation) else scientificNotation)
+
+
 def normalizeCounts(backgroundCountsFilePaths: List[str], customRawCountsFilePaths: List[str] = list(), customBackgroundCountsDir = None):
 
     normalizedCountsFilePaths = list()
@@ -68,7 +123,8 @@ def normalizeCounts(backgroundCountsFilePaths: List[str], customRawCountsFilePat
         for customBackgroundCountsFilePath in customBackgroundRawPairs:
             backgroundRawPairs[customBackgroundCountsFilePath] = customBackgroundRawPairs[customBackgroundCountsFilePath]
 
-    # Iterate through each background + raw counts pair
+    # Iterate through each background + raw counts pair, collecting the files to pass to the R script.
+    normalizationInputs = list()
     for backgroundCountsFilePath in backgroundRawPairs:
 
         rawCountsFilePath = backgroundRawPairs[backgroundCountsFilePath]
@@ -85,14 +141,23 @@ def normalizeCounts(backgroundCountsFilePaths: List[str], customRawCountsFilePat
                                                     usesNucGroup = checkForNucGroup(backgroundCountsFilePath),
                                                     dataType = DataTypeStr.normNucCounts, fileExtension = ".tsv")
 
-        # Pass the file paths to the R script to generate the normalized counts file.
-        print("Calling R script to generate normalized counts...")
-        subprocess.run(" ".join(("Rscript",os.path.join(rScriptsDirectory,"NormalizeNucleosomeMutationCounts.R"),
-                                 rawCountsFilePath,backgroundCountsFilePath,normalizedCountsFilePath)), 
-                       shell = True, check = True)
-
+        normalizationInputs.append('$'.join((rawCountsFilePath,backgroundCountsFilePath,normalizedCountsFilePath)))
         normalizedCountsFilePaths.append(normalizedCountsFilePath)
 
+    # Pass every set of file paths to the R script at once (so that R is only started once) to generate the normalized counts files.
+    # The file paths are written to a temporary inputs file, one set per line, since there may be too many to fit on the command line.
+    if len(normalizedCountsFilePaths) > 0:
+        print("\nCalling R script to generate normalized counts...")
+        inputsFileDescriptor, inputsFilePath = tempfile.mkstemp(prefix = "normalization_inputs_", suffix = ".txt")
+        try:
+            with open(inputsFileDescriptor, 'w') as inputsFile:
+                inputsFile.write('\n'.join(normalizationInputs) + '\n')
+            with measureStage("R: NormalizeNucleosomeMutationCounts") as stageMetrics:
+                stageMetrics.records = len(normalizedCountsFilePaths)
+                subprocess.run(" ".join(("Rscript",os.path.join(rScriptsDirectory,"NormalizeNucleosomeMutationCounts.R"),
+                                         inputsFilePath)), shell = True, check = True)
+        finally: os.remove(inputsFilePath)
+
     # Document where the custom background counts came from in each relevant directory.
     if customBackgroundCountsDir is not None:
         for customRawCountsDir in set([os.path.dirname(customRawCountsFilePath) for customRawCountsFilePath in customRawCountsFilePaths]):
@@ -109,6 +174,7 @@ def normalizeCounts(backgroundCountsFilePaths: List[str], customRawCountsFilePat
 def main():
 
     #Create the Tkinter UI
+    from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog, Selections
     dialog = TkinterDialog(workingDirectory=getDataDirectory())
     dialog.createMultipleFileSelector("Background Nucleosome Mutation Counts Files:",0,
                                       DataTypeStr.nucMutBackground + ".tsv",("Tab Seperated Values Files",".tsv"))
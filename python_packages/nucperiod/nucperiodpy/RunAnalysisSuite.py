@@ -2,27 +2,39 @@
 # and produce the normalized dyad position counts, along with all the relevant intermediate files.
 
 from typing import List
-import os, sys
-from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog, Selections
-from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import DataTypeStr, getDataDirectory, getFilesInDirectory
+import os
+from nucperiodpy.helper_scripts.TaskScheduler import TaskScheduler
+from nucperiodpy.helper_scripts.FileFingerprints import (getFingerprintFilePath, runIfOutdated, checkFingerprints,
+                                                         recordFingerprints)
+from nucperiodpy.helper_scripts.RunJournal import RunJournal, getRunJournalFilePath
+from nucperiodpy.helper_scripts.DataCatalog import getCatalogedFilesInDirectory, updateCatalog
+from nucperiodpy.helper_scripts.Instrumentation import measureStage
+from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import (DataTypeStr, getDataDirectory,
+                                                                  getMutationFileCounts, getNucMutCounts, Metadata,
+                                                                  generateFilePath, checkDirs, getAcceptableChromosomes,
+                                                                  getContextText, checkForNucGroup, writeTableToTSV)
 from nucperiodpy.ExpandContext import expandContext
-from nucperiodpy.GenerateMutationBackground import generateMutationBackground
-from nucperiodpy.GenerateNucleosomeMutationBackground import generateNucleosomeMutationBackground
-from nucperiodpy.CountNucleosomePositionMutations import countNucleosomePositionMutations
-from nucperiodpy.NormalizeMutationCounts import normalizeCounts
+from nucperiodpy.GenerateMutationBackground import (generateMutationBackground, checkGenomeContextFrequencyFile,
+                                                    countMutationContexts, getGenomeContextCounts, getBackgroundMutationRates,
+                                                    writeMutationContextFrequencyFile, writeMutationBackgroundFile)
+from nucperiodpy.GenerateNucleosomeMutationBackground import (generateNucleosomeMutationBackground,
+                                                              checkDyadPosContextCountsFile, getDyadPosContextCounts,
+                                                              getDyadRadiusAndLinkerOffset, getNucleosomeMutationBackgroundTable)
+from nucperiodpy.CountNucleosomePositionMutations import countNucleosomePositionMutations, getNucleosomeMutationCountsTables
+from nucperiodpy.NormalizeMutationCounts import normalizeCounts, getNormalizedCountsTable, formatNormalizedValue
 
 
 def parseArgs(args):
     
     # If only the subcommand was given, run the UI.
-    if len(sys.argv) == 2: 
+    if not args.subcommandArgumentsGiven: 
         main(); return
 
     # Get the bed mutation files from the given paths, searching directories if necessary.
     finalBedMutationPaths = list()
     for mutationFilePath in args.mutationFilePaths:
         if os.path.isdir(mutationFilePath):
-            finalBedMutationPaths += getFilesInDirectory(mutationFilePath, DataTypeStr.mutations + ".bed")
+            finalBedMutationPaths += getCatalogedFilesInDirectory(mutationFilePath, DataTypeStr.mutations + ".bed")
         else: finalBedMutationPaths.append(mutationFilePath)
 
     assert len(finalBedMutationPaths) > 0, "No bed mutation files were found."
@@ -35,12 +47,15 @@ def parseArgs(args):
     elif args.background is not None: normalizationMethod = "Custom Background"
 
     runAnalysisSuite(finalBedMutationPaths, normalizationMethod, args.background, 
-                     args.singlenuc_radius, args.add_linker, args.nuc_group_radius)
+                     args.singlenuc_radius, args.add_linker, args.nuc_group_radius,
+                     args.nucleosome_mutation_cutoff, args.jobs, args.force,
+                     args.in_memory, args.keep_intermediates, args.resume)
 
 
 def main():
 
     # Create the Tkinter dialog.
+    from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog, Selections
     dialog = TkinterDialog(workingDirectory=getDataDirectory())
     dialog.createMultipleFileSelector("Bed Mutation Files:",0,DataTypeStr.mutations + ".bed",("Bed Files",".bed"))
 
@@ -81,8 +96,306 @@ def main():
                      includeLinker, useNucGroupRadius)
 
 
+# Returns the number associated with the context of the given mutation file.
+def determineMutationFileContext(mutationFilePath: str):
+
+    if mutationFilePath.endswith("singlenuc_context_mutations.bed"): return 1
+    elif mutationFilePath.endswith("trinuc_context_mutations.bed"): return 3
+    elif mutationFilePath.endswith("pentanuc_context_mutations.bed"): return 5
+    else: raise ValueError("Unexpected file ending for " + os.path.basename(mutationFilePath))
+
+
+# Returns the path to the log file which records the output from running the given mutation file through the pipeline.
+def getPipelineLogFilePath(mutationFilePath):
+
+    metadata = Metadata(mutationFilePath)
+    intermediateFilesDirectory = os.path.join(metadata.directory,"intermediate_files")
+    checkDirs(intermediateFilesDirectory)
+    return generateFilePath(directory = intermediateFilesDirectory, dataGroup = metadata.dataGroupName,
+                            dataType = "pipeline_log", fileExtension = ".txt")
+
+
+# Expands the context of the given mutation file and returns the path to the new mutation file.
+def expandMutationFileContext(mutationFilePath, expansionContextNum):
+
+    print("\nExpanding file context...")
+    return expandContext((mutationFilePath,),expansionContextNum)[0]
+
+
+# Returns the counts file whose nucleosome mutations are checked against the cutoff: the single nucleosome counts file
+# if one was generated, and otherwise the nucleosome group counts file.  Mutations are counted at every nucleosome they
+# overlap, so the counts within 60 bp of the dyad are the same at either dyad radius.
+def getCutoffCountsFilePath(countsFilePaths):
+    for countsFilePath in countsFilePaths:
+        if not checkForNucGroup(countsFilePath): return countsFilePath
+    return countsFilePaths[0]
+
+
+# Counts the mutations at each dyad position for the given mutation file.  Returns the paths to the resulting
+# raw counts files, or None if the data set has too few nucleosome mutations to pass the cutoff.
+def countMutationsAboveCutoff(mutationFilePath, useSingleNucRadius, useNucGroupRadius, linkerOffset, nucleosomeMutationCutoff):
+
+    print("\nCounting mutations at each dyad position...")
+    nucleosomeMutationCountsFilePaths = countNucleosomePositionMutations((mutationFilePath,), useSingleNucRadius,
+                                                                         useNucGroupRadius, linkerOffset)
+
+    # Now that exact counts are available, drop the data set if it falls short of the cutoff.
+    if (nucleosomeMutationCutoff > 0 and
+        not passesNucleosomeMutationCutoff(mutationFilePath, getNucMutCounts(getCutoffCountsFilePath(nucleosomeMutationCountsFilePaths)),
+                                           nucleosomeMutationCutoff, "nucleosome mutations")):
+        return None
+    else: return nucleosomeMutationCountsFilePaths
+
+
+# Generates the mutation background for the given mutation file.  The counts file paths are not used directly,
+# but are required so that data sets which were dropped after counting (None) never have a background generated.
+def generateCountedMutationBackground(mutationFilePath, nucleosomeMutationCountsFilePaths, backgroundContextNum):
+
+    print("\nGenerating genome-wide mutation background...")
+    return generateMutationBackground((mutationFilePath,), backgroundContextNum)
+
+
+# Normalizes the counts for all of the given data sets with a single call to normalizeCounts (so that R is only started
+# once), as the pipeline did before it was split into tasks.  Each data set is given by the path to its normalization
+# fingerprint file and the paths to its nucleosome mutation background and raw counts files.  Data sets which were
+# dropped (None) are skipped, as are data sets whose normalized counts are already up to date (unless force is True).
+# Returns the paths to the normalized counts files for every data set.
+def normalizeDataSetCounts(fingerprintFilePaths, nucleosomeBackgroundFilePathLists, countsFilePathLists, force):
+
+    normalizedCountsFilePaths = list()
+    outdatedDataSets = list() # The fingerprint file path and input file paths for each data set that needs normalizing.
+
+    for fingerprintFilePath, nucleosomeBackgroundFilePaths, countsFilePaths in zip(fingerprintFilePaths,
+                                                                                   nucleosomeBackgroundFilePathLists,
+                                                                                   countsFilePathLists):
+
+        if nucleosomeBackgroundFilePaths is None or countsFilePaths is None: continue
+        inputFilePaths = (nucleosomeBackgroundFilePaths, countsFilePaths)
+
+        if not force:
+            isUpToDate, result = checkFingerprints(fingerprintFilePath, inputFilePaths, ())
+            if isUpToDate:
+                print("\nOutputs are up to date for", os.path.basename(fingerprintFilePath).rsplit(".json",1)[0] + ".  Skipping.")
+                normalizedCountsFilePaths += result
+                continue
+
+        outdatedDataSets.append((fingerprintFilePath, inputFilePaths))
+
+    if len(outdatedDataSets) == 0: return normalizedCountsFilePaths
+
+    print("\nNormalizing counts with nucleosome background data...")
+    newNormalizedCountsFilePaths = normalizeCounts([nucleosomeBackgroundFilePath
+                                                    for _, (nucleosomeBackgroundFilePaths, _) in outdatedDataSets
+                                                    for nucleosomeBackgroundFilePath in nucleosomeBackgroundFilePaths])
+
+    # Record the fingerprints for each data set with its own normalized counts files (which share its directory).
+    for fingerprintFilePath, inputFilePaths in outdatedDataSets:
+        dataDirectory = os.path.dirname(inputFilePaths[0][0])
+        result = [normalizedCountsFilePath for normalizedCountsFilePath in newNormalizedCountsFilePaths
+                  if os.path.dirname(normalizedCountsFilePath) == dataDirectory]
+        recordFingerprints(fingerprintFilePath, inputFilePaths, (), result)
+        normalizedCountsFilePaths += result
+
+    return normalizedCountsFilePaths
+
+
+# Counts mutations, generates backgrounds, and normalizes the counts for the given mutation file, passing the mutation
+# context counts, background mutation rates, and counts tables directly between stages instead of writing and re-reading
+# intermediate files.  Only the raw and normalized counts files are written, unless intermediate files are requested.
+# Returns the paths to the counts files, or None if the data set has too few nucleosome mutations to pass the cutoff.
+def runInMemoryPipeline(mutationFilePath, genomeContextFrequencyFilePath, dyadPosContextCountsFilePaths,
+                        normalizationMethodNum, useSingleNucRadius, useNucGroupRadius, linkerOffset,
+                        nucleosomeMutationCutoff, keepIntermediates):
+
+    metadata = Metadata(mutationFilePath)
+    contextText = getContextText(normalizationMethodNum)
+
+    print("\nCounting mutations at each dyad position...")
+    countsTables = getNucleosomeMutationCountsTables(mutationFilePath, useSingleNucRadius, useNucGroupRadius, linkerOffset)
+    countsFilePaths = list(countsTables.keys())
+
+    # Drop the data set if it falls short of the cutoff.  (Using the same dyad position cutoff as getNucMutCounts)
+    if nucleosomeMutationCutoff > 0:
+        countsTable = countsTables[getCutoffCountsFilePath(countsFilePaths)]
+        nucMutCounts = sum(counts for dyadPos, counts in zip(countsTable["Dyad_Position"], countsTable["Both_Strands_Counts"])
+                           if abs(dyadPos) <= 60)
+        if not passesNucleosomeMutationCutoff(mutationFilePath, nucMutCounts, nucleosomeMutationCutoff, "nucleosome mutations"):
+            return None
+
+    print("\nGenerating mutation background...")
+    with measureStage("generateMutationBackground", mutationFilePath) as stageMetrics:
+        mutationContextCounts = countMutationContexts(mutationFilePath, normalizationMethodNum, contextText,
+                                                      getAcceptableChromosomes(metadata.genomeFilePath))
+        backgroundMutationRates = getBackgroundMutationRates(getGenomeContextCounts(genomeContextFrequencyFilePath),
+                                                             mutationContextCounts)
+        stageMetrics.records = sum(mutationContextCounts.values())
+
+    if keepIntermediates:
+        intermediateFilesDirectory = os.path.join(metadata.directory,"intermediate_files")
+        checkDirs(intermediateFilesDirectory)
+        writeMutationContextFrequencyFile(mutationContextCounts,
+                                          generateFilePath(directory = intermediateFilesDirectory,
+                                                           dataGroup = metadata.dataGroupName, context = contextText,
+                                                           dataType = "mutation_frequencies", fileExtension = ".tsv"),
+                                          contextText)
+        writeMutationBackgroundFile(backgroundMutationRates,
+                                    generateFilePath(directory = metadata.directory, dataGroup = metadata.dataGroupName,
+                                                     context = contextText, dataType = DataTypeStr.mutBackground,
+                                                     fileExtension = ".tsv"),
+                                    contextText)
+
+    print("\nNormalizing counts with nucleosome background data...")
+    for countsFilePath, dyadPosContextCountsFilePath in zip(list(countsFilePaths), dyadPosContextCountsFilePaths):
+
+        usesNucGroup = checkForNucGroup(countsFilePath)
+        dyadRadius, currentLinkerOffset = getDyadRadiusAndLinkerOffset(usesNucGroup, linkerOffset)
+        with measureStage("generateNucleosomeMutationBackground (" + str(dyadRadius) + " bp radius)", mutationFilePath):
+            nucleosomeMutationBackgroundTable = getNucleosomeMutationBackgroundTable(
+                getDyadPosContextCounts(dyadPosContextCountsFilePath), backgroundMutationRates, dyadRadius, currentLinkerOffset
+            )
+
+        if keepIntermediates:
+            writeTableToTSV(nucleosomeMutationBackgroundTable,
+                            generateFilePath(directory = metadata.directory, dataGroup = metadata.dataGroupName,
+                                             context = contextText, linkerOffset = currentLinkerOffset,
+                                             usesNucGroup = usesNucGroup, dataType = DataTypeStr.nucMutBackground,
+                                             fileExtension = ".tsv"))
+
+        normalizedCountsFilePath = generateFilePath(directory = metadata.directory, dataGroup = metadata.dataGroupName,
+                                                    context = contextText, linkerOffset = currentLinkerOffset,
+                                                    usesNucGroup = usesNucGroup, dataType = DataTypeStr.normNucCounts,
+                                                    fileExtension = ".tsv")
+        with measureStage("normalizeCounts", countsFilePath):
+            writeTableToTSV(getNormalizedCountsTable(countsTables[countsFilePath], nucleosomeMutationBackgroundTable),
+                            normalizedCountsFilePath, formatNormalizedValue)
+        countsFilePaths.append(normalizedCountsFilePath)
+
+    return countsFilePaths
+
+
+# Adds the tasks needed to run a single mutation file through the pipeline to the given scheduler, along with any
+# tasks that generate files shared between data sets (which are only added once, no matter how many data sets use them).
+# Each task for the data set records fingerprints of its inputs and outputs and is skipped on later runs if its
+# outputs are still up to date, unless force is True.
+# If a list of normalization data sets is given, the data set's normalization is not added as its own task.  Instead,
+# its fingerprint file path and the tasks for its nucleosome mutation background and counts are added to the list,
+# so that every data set can be normalized at once.  (See normalizeDataSetCounts)
+# Returns the IDs of the tasks whose results are paths to the final counts files.
+def addPipelineTasks(scheduler: TaskScheduler, mutationFilePath, normalizationMethodNum, customBackgroundDir,
+                     useSingleNucRadius, useNucGroupRadius, linkerOffset, nucleosomeMutationCutoff, logFilePath,
+                     force = False, inMemory = False, keepIntermediates = False, normalizationDataSets: list = None):
+
+    metadata = Metadata(mutationFilePath)
+    dataSetName = metadata.dataGroupName # Used in task IDs so that they don't change when the mutation file's context is expanded.
+
+    # Returns the path to the fingerprint file for the given stage for this data set.
+    def getStageFingerprintFilePath(stageName):
+        return getFingerprintFilePath(metadata.directory, metadata.dataGroupName, stageName)
+
+    # Tasks for files shared between data sets.
+    acceptableChromosomesTask = scheduler.addTask("Finding acceptable chromosomes for " + metadata.genomeName,
+                                                  getAcceptableChromosomes, metadata.genomeFilePath)
+
+    # Adds the tasks for the genome context frequency and dyad position context counts files needed to generate backgrounds.
+    def addSharedBackgroundTasks():
+
+        contextText = getContextText(normalizationMethodNum)
+        genomeFrequencyTask = scheduler.addTask("Counting genome " + contextText + " contexts for " + metadata.genomeName,
+                                                checkGenomeContextFrequencyFile, metadata.genomeFilePath, metadata.genomeName,
+                                                normalizationMethodNum, contextText)
+        dyadPosCountsTasks = list()
+        for usesNucGroup in (False, True):
+            if (usesNucGroup and useNucGroupRadius) or (not usesNucGroup and useSingleNucRadius):
+                if usesNucGroup: radiusText = " (nuc-group radius)"
+                else: radiusText = " (single nucleosome radius)"
+                dyadPosCountsTasks.append(scheduler.addTask(
+                    "Counting dyad position " + contextText + " contexts for " + metadata.nucPosName + radiusText,
+                    checkDyadPosContextCountsFile, metadata.baseNucPosFilePath, metadata.nucPosName,
+                    metadata.genomeFilePath, normalizationMethodNum, usesNucGroup, linkerOffset))
+
+        return genomeFrequencyTask, dyadPosCountsTasks
+
+    # Tasks for this data set.  (If the mutation file's context is already sufficient, it is used directly.)
+    if normalizationMethodNum is not None and determineMutationFileContext(mutationFilePath) < normalizationMethodNum:
+        expansionTask = scheduler.addTask("Expanding context for " + dataSetName, expandMutationFileContext,
+                                          mutationFilePath, normalizationMethodNum, logFilePath = logFilePath)
+    else: expansionTask = mutationFilePath
+
+    # In memory mode, everything after context expansion happens in a single task for each data set.
+    if inMemory and normalizationMethodNum is not None:
+        genomeFrequencyTask, dyadPosCountsTasks = addSharedBackgroundTasks()
+        return [scheduler.addTask(
+            "Running in-memory pipeline for " + dataSetName, runIfOutdated,
+            getStageFingerprintFilePath("in_memory_pipeline"),
+            [expansionTask, metadata.baseNucPosFilePath, genomeFrequencyTask] + dyadPosCountsTasks,
+            (normalizationMethodNum, useSingleNucRadius, useNucGroupRadius, linkerOffset, nucleosomeMutationCutoff,
+             keepIntermediates), force,
+            runInMemoryPipeline, expansionTask, genomeFrequencyTask, dyadPosCountsTasks, normalizationMethodNum,
+            useSingleNucRadius, useNucGroupRadius, linkerOffset, nucleosomeMutationCutoff, keepIntermediates,
+            dependencies = (acceptableChromosomesTask.taskID,), logFilePath = logFilePath
+        ).taskID]
+
+    countsTask = scheduler.addTask(
+        "Counting nucleosome mutations for " + dataSetName, runIfOutdated,
+        getStageFingerprintFilePath("counts"), (expansionTask, metadata.baseNucPosFilePath),
+        (useSingleNucRadius, useNucGroupRadius, linkerOffset, nucleosomeMutationCutoff), force,
+        countMutationsAboveCutoff, expansionTask, useSingleNucRadius, useNucGroupRadius, linkerOffset, nucleosomeMutationCutoff,
+        dependencies = (acceptableChromosomesTask.taskID,), logFilePath = logFilePath
+    )
+    finalTaskIDs = [countsTask.taskID]
+
+    if normalizationMethodNum is not None:
+
+        genomeFrequencyTask, dyadPosCountsTasks = addSharedBackgroundTasks()
+
+        mutationBackgroundTask = scheduler.addTask(
+            "Generating mutation background for " + dataSetName, runIfOutdated,
+            getStageFingerprintFilePath("mutation_background"), (expansionTask, genomeFrequencyTask),
+            (normalizationMethodNum,), force,
+            generateCountedMutationBackground, expansionTask, countsTask, normalizationMethodNum,
+            dependencies = (acceptableChromosomesTask.taskID,), logFilePath = logFilePath
+        )
+        nucleosomeBackgroundTask = scheduler.addTask(
+            "Generating nucleosome mutation background for " + dataSetName, runIfOutdated,
+            getStageFingerprintFilePath("nucleosome_mutation_background"), [mutationBackgroundTask] + dyadPosCountsTasks,
+            (useSingleNucRadius, useNucGroupRadius, linkerOffset), force,
+            generateNucleosomeMutationBackground, mutationBackgroundTask, useSingleNucRadius, useNucGroupRadius, linkerOffset,
+            logFilePath = logFilePath
+        )
+        if normalizationDataSets is not None:
+            normalizationDataSets.append((getStageFingerprintFilePath("normalization"), nucleosomeBackgroundTask, countsTask))
+        else:
+            finalTaskIDs.append(scheduler.addTask(
+                "Normalizing counts for " + dataSetName, runIfOutdated,
+                getStageFingerprintFilePath("normalization"), (nucleosomeBackgroundTask, countsTask), (), force,
+                normalizeCounts, nucleosomeBackgroundTask, logFilePath = logFilePath
+            ).taskID)
+
+    elif customBackgroundDir is not None:
+        customBackgroundFilePaths = getCatalogedFilesInDirectory(customBackgroundDir, DataTypeStr.rawNucCounts + ".tsv")
+        finalTaskIDs.append(scheduler.addTask(
+            "Normalizing counts with custom background for " + dataSetName, runIfOutdated,
+            getStageFingerprintFilePath("custom_normalization"), [countsTask] + customBackgroundFilePaths,
+            (customBackgroundDir,), force,
+            normalizeCounts, list(), countsTask, customBackgroundDir, logFilePath = logFilePath
+        ).taskID)
+
+    return finalTaskIDs
+
+
+# If a nucleosome mutation cutoff is given, data sets with fewer mutations than the cutoff within 60 bp of nucleosome dyads
+# (The same criterion used to filter data sets in the periodicity analysis) are dropped as early as possible:
+# first based on their total mutation counts, and then based on their raw nucleosome mutation counts.
+# If more than one job is requested, the pipeline's tasks are run in parallel on a pool of worker processes,
+# and the output for each file is written to a log file in its intermediate_files directory.
+# Stages whose outputs are already up to date from a previous run are skipped unless force is True.
+# In memory mode, data flows directly between the counting, background, and normalization stages, and intermediate
+# files (mutation context frequencies and mutation backgrounds) are only written if keepIntermediates is True.
+# Completed tasks are recorded in a run journal, and if resume is True, tasks completed by a previous (failed) run
+# with the same inputs and parameters are not run again.
 def runAnalysisSuite(mutationFilePaths: List[str], normalizationMethod, customBackgroundDir, useSingleNucRadius,
-                     includeLinker, useNucGroupRadius):
+                     includeLinker, useNucGroupRadius, nucleosomeMutationCutoff = 0, jobs = 1, force = False,
+                     inMemory = False, keepIntermediates = False, resume = False):
 
     # Make sure at least one radius was selected.
     if not useNucGroupRadius and not useSingleNucRadius:
@@ -102,50 +415,87 @@ def runAnalysisSuite(mutationFilePaths: List[str], normalizationMethod, customBa
         normalizationMethodNum = None
     else: raise ValueError("Matching strings is hard.")
 
+    if normalizationMethod != "Custom Background": customBackgroundDir = None
+
     # Set the linker offset
     if includeLinker: linkerOffset = 30
     else: linkerOffset = 0
 
-    ### Ensure that every mutation file has a context sufficient for the requested background.
-
-    # Returns the number associated with the context of the given mutation file.
-    def determineMutationFileContext(mutationFilePath: str):
-
-        if mutationFilePath.endswith("singlenuc_context_mutations.bed"): return 1
-        elif mutationFilePath.endswith("trinuc_context_mutations.bed"): return 3
-        elif mutationFilePath.endswith("pentanuc_context_mutations.bed"): return 5
-        else: raise ValueError("Unexpected file ending for " + os.path.basename(mutationFilePath))
-
-    # create a new list of mutation file paths, replacing any with contexts that are too low.
-    if normalizationMethodNum is not None:
-        print("\nExpanding file context where necessary...\n")
-        updatedMutationFilePaths = list()
-        for mutationFilePath in mutationFilePaths:
-            if determineMutationFileContext(mutationFilePath) < normalizationMethodNum:
-                updatedMutationFilePaths += expandContext((mutationFilePath,),normalizationMethodNum)
-            else: updatedMutationFilePaths.append(mutationFilePath)
-    else: updatedMutationFilePaths = mutationFilePaths
-
-    ### Run the rest of the analysis.
-
-    print("\nCounting mutations at each dyad position...\n")                                                                             
-    nucleosomeMutationCountsFilePaths = countNucleosomePositionMutations(updatedMutationFilePaths, useSingleNucRadius,
-                                                                         useNucGroupRadius, linkerOffset)
-
-    if normalizationMethodNum is not None:
-
-        print("\nGenerating genome-wide mutation background...\n")
-        mutationBackgroundFilePaths = generateMutationBackground(updatedMutationFilePaths,normalizationMethodNum)
-
-        print("\nGenerating nucleosome mutation background...\n")
-        nucleosomeMutationBackgroundFilePaths = generateNucleosomeMutationBackground(mutationBackgroundFilePaths, useSingleNucRadius, 
-                                                                                     useNucGroupRadius, linkerOffset)
-
-        print("\nNormalizing counts with nucleosome background data...\n")
-        normalizeCounts(nucleosomeMutationBackgroundFilePaths)
-
-    elif normalizationMethod == "Custom Background":
-        print("\nNormalizing counts using custom background data...\n")
-        normalizeCounts(list(), nucleosomeMutationCountsFilePaths, customBackgroundDir)
+    # Get the journal for this run, which records completed tasks so that a failed run can be resumed.
+    # (Runs are identified by the data directories they use, since mutation file names change when their context is expanded.)
+    journalFilePath = getRunJournalFilePath([os.path.dirname(mutationFilePath) for mutationFilePath in mutationFilePaths],
+                                            [normalizationMethod, customBackgroundDir, useSingleNucRadius, useNucGroupRadius,
+                                             linkerOffset, nucleosomeMutationCutoff, inMemory, keepIntermediates])
+
+    ### Skip any data sets which can't possibly have enough mutations to pass the nucleosome mutation cutoff.
+    if nucleosomeMutationCutoff > 0:
+        print("\nSkipping data sets with fewer than", nucleosomeMutationCutoff, "mutations...")
+        mutationFilePaths = [mutationFilePath for mutationFilePath in mutationFilePaths
+                             if passesNucleosomeMutationCutoff(mutationFilePath, getMutationFileCounts(mutationFilePath),
+                                                               nucleosomeMutationCutoff)]
+        if len(mutationFilePaths) == 0:
+            print("No data sets have enough mutations to continue.")
+            return
+
+    ### Run the rest of the analysis as a graph of tasks, where each task runs as soon as the tasks it depends on have finished.
+    ### (With more than one job, each data set's output goes to its own log file.)
+    journal = RunJournal(journalFilePath, resume)
+    scheduler = TaskScheduler(jobs, journal)
+    finalTaskIDs = list()
+
+    # When running one task at a time, normalize every data set at once at the end, so that R is only started once.
+    # (With more jobs, each data set is normalized as soon as it is ready, and failures don't affect other data sets.)
+    if jobs == 1: normalizationDataSets = list()
+    else: normalizationDataSets = None
+
+    for mutationFilePath in mutationFilePaths:
+
+        if jobs > 1:
+            logFilePath = getPipelineLogFilePath(mutationFilePath)
+            if not resume: open(logFilePath, 'w').close()
+        else: logFilePath = None
+
+        finalTaskIDs += addPipelineTasks(scheduler, mutationFilePath, normalizationMethodNum, customBackgroundDir,
+                                         useSingleNucRadius, useNucGroupRadius, linkerOffset, nucleosomeMutationCutoff,
+                                         logFilePath, force, inMemory, keepIntermediates, normalizationDataSets)
+
+    if normalizationDataSets:
+        finalTaskIDs.append(scheduler.addTask(
+            "Normalizing counts for all data sets", normalizeDataSetCounts,
+            [fingerprintFilePath for fingerprintFilePath, _, _ in normalizationDataSets],
+            [nucleosomeBackgroundTask.optional() for _, nucleosomeBackgroundTask, _ in normalizationDataSets],
+            [countsTask.optional() for _, _, countsTask in normalizationDataSets], force
+        ).taskID)
+
+    print("\nRunning", len(scheduler.tasks), "tasks for", len(mutationFilePaths), "data set(s) using", jobs, "job(s)...")
+    try: scheduler.run()
+    except BaseException:
+        journal.close()
+        print("\nThe run did not finish.  Use the resume option with the same inputs to continue where it left off.")
+        raise
+
+    # The run finished, so the journal is no longer needed.
+    journal.delete()
+
+    # Catalog the new files so that selecting them later (e.g. for the periodicity analysis) is a quick lookup.
+    updateCatalog(*set(os.path.dirname(os.path.abspath(mutationFilePath)) for mutationFilePath in mutationFilePaths))
+
+    nucleosomeMutationCountsFilePaths = list()
+    for taskID in finalTaskIDs:
+        if scheduler.getResult(taskID) is not None: nucleosomeMutationCountsFilePaths += scheduler.getResult(taskID)
+
+    if len(nucleosomeMutationCountsFilePaths) == 0:
+        print("No data sets have enough nucleosome mutations to continue.")
+
+    return nucleosomeMutationCountsFilePaths
+
+
+# Returns whether or not the given mutation counts satisfy the nucleosome mutation cutoff, informing the user if they don't.
+def passesNucleosomeMutationCutoff(mutationFilePath, mutationCounts, nucleosomeMutationCutoff, countsDescription = "mutations"):
+
+    if mutationCounts >= nucleosomeMutationCutoff: return True
+    else:
+        print(os.path.basename(mutationFilePath), "has only", mutationCounts, countsDescription, "and will be skipped.")
+        return False
 
 if __name__ == "__main__": main()
\ No newline at end of file
@@ -0,0 +1,82 @@
+# This script takes nucleosome mutation counts files and passes them to an R script which finds the extremes
+# (peaks or valleys) in each data set and compares the two halves of the nucleosome to test for asymmetry.
+
+import os, subprocess
+from typing import List
+from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import DataTypeStr, getDataDirectory, rScriptsDirectory
+from nucperiodpy.helper_scripts.DataCatalog import getCatalogedFilesInDirectory
+from nucperiodpy.helper_scripts.Instrumentation import measureStage
+
+
+# All the given counts files are analyzed in a single (vectorized) R call.  Single nucleosome, linker,
+# and nuc-group counts files may be mixed, as data sets are grouped by their dyad positions before analysis.
+def runAsymmetryAnalysis(nucleosomeMutationCountsFilePaths: List[str], outputFilePath: str,
+                         findMaxes = True, alignStrands = False):
+
+    # Check for valid input.
+    assert len(nucleosomeMutationCountsFilePaths) > 0, "No nucleosome counts files given."
+    assert outputFilePath.endswith(".tsv"), "Output file should end with \".tsv\"."
+
+    # Write the inputs to a temporary file to be read by the R script
+    inputsFilePath = os.path.join(rScriptsDirectory,"inputs.txt")
+
+    with open(inputsFilePath, 'w') as inputsFile:
+        inputsFile.write('\n'.join(('$'.join(nucleosomeMutationCountsFilePaths), outputFilePath)) + '\n')
+
+    # Call the R script
+    print("Calling R script...")
+    with measureStage("R: RunAsymmetryAnalysis") as stageMetrics:
+        stageMetrics.records = len(nucleosomeMutationCountsFilePaths)
+        stageMetrics.bytes = sum(os.path.getsize(filePath) for filePath in nucleosomeMutationCountsFilePaths)
+        subprocess.run(" ".join(("Rscript",os.path.join(rScriptsDirectory,"RunAsymmetryAnalysis.R"),inputsFilePath,
+                                 str(findMaxes).upper(), str(alignStrands).upper())), shell = True, check = True)
+
+    print("Results can be found at",outputFilePath)
+
+
+def parseArgs(args):
+
+    # If only the subcommand was given, run the UI.
+    if not args.subcommandArgumentsGiven:
+        main(); return
+
+    # Get the counts files from the given paths, searching directories if necessary.
+    finalCountsFilePaths = list()
+    for countsFilePath in args.nucleosomeMutationFilePaths:
+        if os.path.isdir(countsFilePath):
+            finalCountsFilePaths += getCatalogedFilesInDirectory(countsFilePath, DataTypeStr.generalNucCounts + ".tsv")
+        else: finalCountsFilePaths.append(countsFilePath)
+
+    assert args.output_file_path is not None, "No output file path was given."
+
+    runAsymmetryAnalysis(finalCountsFilePaths, args.output_file_path, not args.valleys, args.align_strands)
+
+
+def main():
+
+    #Create the Tkinter UI
+    from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog, Selections
+    dialog = TkinterDialog(workingDirectory=getDataDirectory())
+    dialog.createMultipleFileSelector("Nucleosome Mutation Counts files:",0,
+                                      DataTypeStr.normNucCounts + ".tsv",("Tab Seperated Values Files",".tsv"),
+                                      additionalFileEndings = (DataTypeStr.rawNucCounts + ".tsv",))
+    dialog.createFileSelector("Output File", 1, ("Tab Separated Values File", ".tsv"), newFile = True)
+    dialog.createCheckbox("Find valleys instead of peaks", 2, 0)
+    dialog.createCheckbox("Strand align results", 2, 1)
+
+    # Run the UI
+    dialog.mainloop()
+
+    # If no input was received (i.e. the UI was terminated prematurely), then quit!
+    if dialog.selections is None: quit()
+
+    # Get the user's input from the dialog.
+    selections: Selections = dialog.selections
+    nucleosomeMutationCountsFilePaths = list(selections.getFilePathGroups())[0]
+    outputFilePath = list(selections.getIndividualFilePaths())[0]
+    findMaxes = not selections.getToggleStates()[0]
+    alignStrands = bool(selections.getToggleStates()[1])
+
+    runAsymmetryAnalysis(nucleosomeMutationCountsFilePaths, outputFilePath, findMaxes, alignStrands)
+
+if __name__ == "__main__": main()
@@ -1,12 +1,12 @@
 # This script takes normalized nucleosome mutation counts files and passes them to an R script
 # which outputs relevant data about them such as periodicity snr, assymetry, and differences between MSI and MSS data.
 
-import os, subprocess, sys
+import os, subprocess
 from typing import List
 from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import (DataTypeStr, getDataDirectory, Metadata,
-                                                                  rScriptsDirectory, getContext, checkForNucGroup,
-                                                                  getFilesInDirectory)
-from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog, Selections
+                                                                  rScriptsDirectory, getContext, checkForNucGroup)
+from nucperiodpy.helper_scripts.DataCatalog import getCatalogedFilesInDirectory, getCatalogEntries, getDataType
+from nucperiodpy.helper_scripts.Instrumentation import measureStage
 
 
 # Given a list of file paths pointing to nucleosome mutation data, returns the paths that fit the given specifications
@@ -18,29 +18,44 @@ def getFilePathGroup(potentialFilePaths, normalizationMethods: List[int], single
     
     filePathGroup = list() # The file paths to be returned.
 
+    # Look up the files' information in the data catalog where possible, rather than parsing it for every file.
+    catalogEntries = getCatalogEntries(potentialFilePaths)
+
     for potentialFilePath in potentialFilePaths:
 
-        potentialFileName = os.path.basename(potentialFilePath)
+        if potentialFilePath in catalogEntries:
+            catalogEntry = catalogEntries[potentialFilePath]
+            dataType = catalogEntry["dataType"]
+            context = catalogEntry["context"]
+            usesNucGroup = catalogEntry["nucGroup"]
+            isMSI, isMSS = catalogEntry["MSI"], catalogEntry["MSS"]
+        else:
+            dataType = getDataType(os.path.basename(potentialFilePath))
+            context = getContext(potentialFilePath, True)
+            usesNucGroup = checkForNucGroup(potentialFilePath)
+            isMSI, isMSS = None, None
 
         # Does it satisfy the normalization methods qualification? 
         # (Also ensure that we have nucleosome counts, whether raw or normalized.)
-        if DataTypeStr.rawNucCounts in potentialFileName and 0 in normalizationMethods:
+        if dataType == DataTypeStr.rawNucCounts and 0 in normalizationMethods:
             passed = True
-        elif DataTypeStr.normNucCounts in potentialFileName and getContext(potentialFilePath, True) in normalizationMethods:
+        elif dataType == DataTypeStr.normNucCounts and context in normalizationMethods:
             passed = True
         else: continue
 
         # Does it satisfy the nucleosome radius qualification?
-        if checkForNucGroup(potentialFilePath) and nucGroup:
+        if usesNucGroup and nucGroup:
             passed = True
-        elif not checkForNucGroup(potentialFilePath) and singleNuc:
+        elif not usesNucGroup and singleNuc:
             passed = True
         else: continue
 
         # Does it satisfy the microsatellite stability qualifications?
-        cohortDesignations = Metadata(potentialFilePath).cohorts
-        if "MSI" in cohortDesignations and not MSI: continue
-        elif "MSS" in cohortDesignations and not MSS: continue
+        if isMSI is None:
+            cohortDesignations = Metadata(potentialFilePath).cohorts
+            isMSI, isMSS = "MSI" in cohortDesignations, "MSS" in cohortDesignations
+        if isMSI and not MSI: continue
+        elif isMSS and not MSS: continue
 
         # If we've made it this far, add the file path to the return group!
         filePathGroup.append(potentialFilePath)        
@@ -48,8 +63,11 @@ def getFilePathGroup(potentialFilePaths, normalizationMethods: List[int], single
     return filePathGroup
 
 
+# If permutations is greater than 0, the periodicity SNR of each data set is also given an empirical p-value
+# by comparing it against the SNRs of that many random shuffles of its counts across dyad positions.
 def runNucleosomeMutationAnalysis(nucleosomeMutationCountsFilePaths: List[str], outputFilePath: str, 
-                                  filePathGroup1: List[str] = list(), filePathGroup2: List[str] = list()):
+                                  filePathGroup1: List[str] = list(), filePathGroup2: List[str] = list(),
+                                  permutations = 0):
 
     # Check for valid input.
     assert (len(filePathGroup1) == 0) == (len(filePathGroup2) == 0), (
@@ -58,6 +76,7 @@ def runNucleosomeMutationAnalysis(nucleosomeMutationCountsFilePaths: List[str],
         "No normalized counts files given.")
     assert outputFilePath.endswith(".rda") or outputFilePath.endswith(".tsv"), (
         "Output file should end with \".rda\" or \".tsv\".")
+    assert permutations >= 0, "The number of permutations should not be negative."
 
     # Write the inputs to a temporary file to be read by the R script
     inputsFilePath = os.path.join(rScriptsDirectory,"inputs.txt")
@@ -74,8 +93,11 @@ def runNucleosomeMutationAnalysis(nucleosomeMutationCountsFilePaths: List[str],
 
     # Call the R script
     print("Calling R script...")
-    subprocess.run(" ".join(("Rscript",os.path.join(rScriptsDirectory,"RunNucleosomeMutationAnalysis.R"),inputsFilePath)),
-                   shell = True, check = True)
+    with measureStage("R: RunNucleosomeMutationAnalysis") as stageMetrics:
+        stageMetrics.records = len(nucleosomeMutationCountsFilePaths)
+        stageMetrics.bytes = sum(os.path.getsize(filePath) for filePath in nucleosomeMutationCountsFilePaths)
+        subprocess.run(" ".join(("Rscript",os.path.join(rScriptsDirectory,"RunNucleosomeMutationAnalysis.R"),inputsFilePath,
+                                 str(permutations))), shell = True, check = True)
 
     print("Results can be found at",outputFilePath)
 
@@ -83,7 +105,7 @@ def runNucleosomeMutationAnalysis(nucleosomeMutationCountsFilePaths: List[str],
 def parseArgs(args):
     
     # If only the subcommand was given, run the UI.
-    if len(sys.argv) == 2: 
+    if not args.subcommandArgumentsGiven: 
         main(); return
 
     # Determine what files were passed to each argument.
@@ -97,7 +119,7 @@ def parseArgs(args):
             for filePath in filePaths:
 
                 if os.path.isdir(filePath):
-                    filePathGroups[i] += getFilesInDirectory(filePath, DataTypeStr.generalNucCounts + ".tsv")
+                    filePathGroups[i] += getCatalogedFilesInDirectory(filePath, DataTypeStr.generalNucCounts + ".tsv")
                 else: filePathGroups[i].append(filePath)
 
     # Make sure that any file paths passed to group 1 or group 2 are present in the default group.
@@ -106,12 +128,13 @@ def parseArgs(args):
             if filePath not in filePathGroups[0]: filePathGroups[0].append(filePath)
 
     runNucleosomeMutationAnalysis(filePathGroups[0], args.output_file_path,
-                                  filePathGroups[1], filePathGroups[2])
+                                  filePathGroups[1], filePathGroups[2], args.permutations)
 
 
 def main():
 
     #Create the Tkinter UI
+    from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog, Selections
     dialog = TkinterDialog(workingDirectory=getDataDirectory(), scrollable=True)
     dialog.createMultipleFileSelector("Nucleosome Mutation Counts files:",0,
                                       DataTypeStr.normNucCounts + ".tsv",("Tab Seperated Values Files",".tsv"),
@@ -3,7 +3,7 @@
 import os
 import tkinter as tk
 from tkinter import filedialog
-from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import getFilesInDirectory
+from nucperiodpy.helper_scripts.DataCatalog import getCatalogedFilesInDirectory
 
 
 class MultipleFileSelector(tk.Frame):
@@ -141,7 +141,7 @@ class MultipleFileSelector(tk.Frame):
 
         for path in self.getPaths():
             if os.path.isdir(path):
-                filePaths += getFilesInDirectory(path,self.fileEnding,*self.additionalFileEndings)
+                filePaths += getCatalogedFilesInDirectory(path,self.fileEnding,*self.additionalFileEndings)
             else:
                 filePaths.append(path)
         
@@ -0,0 +1,386 @@
+# This script runs micro-benchmarks of the hot kernels in nucperiod (fasta parsing, context counting, mutation counting,
+# writing parsed mutations, and validating custom bed input) on fixed synthetic inputs, reporting the time taken per
+# record so that optimizations can be validated in isolation.  Results can be saved as a baseline and compared against
+# in later runs.
+
+import os, io, gc, sys, json, time, shutil, random, tempfile, platform, statistics, contextlib
+from abc import ABC, abstractmethod
+from nucperiodpy.benchmarks.SyntheticData import (generateChromosomeSequence, writeChromosomeToFasta,
+                                                  writeNucleosomePositions, getSortedRandomPositions, bases)
+from nucperiodpy.helper_scripts.UsefulBioinformaticsFunctions import (FastaFileIterator, reverseCompliment,
+                                                                      parseFastaDescription)
+from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import generateMetadata, InputFormat
+from nucperiodpy.CountNucleosomePositionMutations import CountsFileGenerator
+from nucperiodpy.GenerateNucleosomeMutationBackground import generateDyadPosContextCounts
+from nucperiodpy.GenerateMutationBackground import generateGenomeContextFrequencyFile
+from nucperiodpy.input_parsing.WriteManager import WriteManager
+from nucperiodpy.input_parsing.ParseCustomBed import validateCustomBedFile
+
+# The inputs are always generated from this seed so that every run (and every baseline) times exactly the same work.
+microBenchmarkSeed = 0
+chromosomes = ("chr1", "chr2", "chr3", "chr4")
+chromosomeLength = 250000
+
+
+# The base class for each micro-benchmark.  setUp is run once to write the benchmark's inputs, beforeRun and afterRun
+# are run (untimed) around every repetition, and run is the timed kernel, which returns the number of records processed.
+class MicroBenchmark(ABC):
+
+    name = None
+    recordUnit = "records"
+
+    def __init__(self, workDirectory):
+        self.workDirectory = workDirectory
+        self.randomGenerator = random.Random(microBenchmarkSeed)
+
+    def setUp(self): pass
+
+    def beforeRun(self): pass
+
+    @abstractmethod
+    def run(self): pass
+
+    def afterRun(self): pass
+
+
+    # Writes a fasta file of random sequences of the given length with bedtools getfasta style headers.
+    # (e.g. ">chr1:1000-1003(+)")  Returns the file path.
+    def writeBedtoolsFasta(self, fileName, entryCount, sequenceLength):
+
+        fastaFilePath = os.path.join(self.workDirectory, fileName)
+        with open(fastaFilePath, 'w') as fastaFile:
+            for i in range(entryCount):
+                start = i*10
+                fastaFile.write('>' + chromosomes[i%len(chromosomes)] + ':' + str(start) + '-' + str(start + sequenceLength) +
+                                '(' + self.randomGenerator.choice(('+','-')) + ")\n")
+                fastaFile.write(''.join(self.randomGenerator.choices(bases, k = sequenceLength)) + '\n')
+
+        return fastaFilePath
+
+
+class FastaFileIteratorBenchmark(MicroBenchmark):
+
+    name = "FastaFileIterator"
+    recordUnit = "fasta entries"
+    entryCount = 200000
+
+    def setUp(self):
+        self.fastaFilePath = self.writeBedtoolsFasta("trinucs.fa", self.entryCount, 3)
+
+    def run(self):
+
+        entries = 0
+        with open(self.fastaFilePath, 'r') as fastaFile:
+            for _ in FastaFileIterator(fastaFile): entries += 1
+        return entries
+
+
+class ReverseComplimentBenchmark(MicroBenchmark):
+
+    name = "reverseCompliment"
+    recordUnit = "sequences"
+    sequenceCount = 500000
+
+    def setUp(self):
+        self.sequences = [''.join(self.randomGenerator.choices(bases, k = 3)) for _ in range(self.sequenceCount)]
+
+    def run(self):
+
+        for sequence in self.sequences: reverseCompliment(sequence)
+        return len(self.sequences)
+
+
+class ParseFastaDescriptionBenchmark(MicroBenchmark):
+
+    name = "parseFastaDescription"
+    recordUnit = "descriptions"
+    descriptionCount = 500000
+
+    def setUp(self):
+
+        self.descriptions = list()
+        for i in range(self.descriptionCount):
+            start = self.randomGenerator.randrange(chromosomeLength)
+            self.descriptions.append('>' + chromosomes[i%len(chromosomes)] + ':' + str(start) + '-' + str(start+3) +
+                                     '(' + self.randomGenerator.choice(('+','-')) + ')')
+
+    def run(self):
+
+        for description in self.descriptions: parseFastaDescription(description)
+        return len(self.descriptions)
+
+
+class CountsFileGeneratorBenchmark(MicroBenchmark):
+
+    name = "CountsFileGenerator.count"
+    recordUnit = "mutations"
+    mutationCount = 200000
+
+    # Writes sorted mutations and nucleosome positions across the synthetic chromosomes.
+    def setUp(self):
+
+        self.mutationFilePath = os.path.join(self.workDirectory, "count_mutations.bed")
+        self.nucPosFilePath = os.path.join(self.workDirectory, "count_nucleosomes.bed")
+        self.countsFilePath = os.path.join(self.workDirectory, "count_results.tsv")
+
+        with open(self.mutationFilePath, 'w') as mutationFile, open(self.nucPosFilePath, 'w') as nucPosFile:
+            for chromosome in chromosomes:
+                writeNucleosomePositions(chromosome, chromosomeLength, nucPosFile, self.randomGenerator)
+                for position in getSortedRandomPositions(self.mutationCount//len(chromosomes), chromosomeLength,
+                                                         self.randomGenerator):
+                    mutationFile.write('\t'.join((chromosome, str(position), str(position+1), 'C', 'T',
+                                                  self.randomGenerator.choice(('+','-')))) + '\n')
+
+    def beforeRun(self):
+        self.countsFileGenerator = CountsFileGenerator(self.mutationFilePath, self.nucPosFilePath, self.countsFilePath,
+                                                       73, 0, chromosomes)
+
+    def run(self):
+
+        self.countsFileGenerator.count()
+        return self.countsFileGenerator.mutationsRead
+
+    def afterRun(self):
+        self.countsFileGenerator.mutationFile.close()
+        self.countsFileGenerator.nucPosFile.close()
+
+
+class DyadPosContextCountsBenchmark(MicroBenchmark):
+
+    name = "generateDyadPosContextCounts"
+    recordUnit = "contexts"
+    nucleosomeCount = 5000
+    dyadRadius = 73
+    contextNum = 3
+
+    # Writes nucleosome sequences with enough flanking sequence to get a full context at every dyad position.
+    def setUp(self):
+
+        self.nucPosFastaFilePath = self.writeBedtoolsFasta("nucleosome_sequences.fa", self.nucleosomeCount,
+                                                           self.dyadRadius*2 + 1 + (self.contextNum//2)*2)
+        self.dyadPosContextCountsFilePath = os.path.join(self.workDirectory, "dyad_pos_context_counts.tsv")
+
+    def run(self):
+
+        generateDyadPosContextCounts(self.nucPosFastaFilePath, self.dyadPosContextCountsFilePath,
+                                     self.contextNum, self.dyadRadius, 0)
+        return self.nucleosomeCount * (self.dyadRadius*2 + 1)
+
+
+class GenomeContextFrequencyBenchmark(MicroBenchmark):
+
+    name = "generateGenomeContextFrequencyFile"
+    recordUnit = "bases"
+    contextNum = 3
+
+    def setUp(self):
+
+        self.genomeFilePath = os.path.join(self.workDirectory, "genome.fa")
+        self.genomeContextFrequencyFilePath = os.path.join(self.workDirectory, "genome_context_frequency.tsv")
+        with open(self.genomeFilePath, 'w') as genomeFile:
+            for chromosome in chromosomes:
+                writeChromosomeToFasta(chromosome, generateChromosomeSequence(chromosomeLength, self.randomGenerator),
+                                       genomeFile)
+
+    def run(self):
+
+        generateGenomeContextFrequencyFile(self.genomeFilePath, self.genomeContextFrequencyFilePath,
+                                           self.contextNum, "trinuc")
+        return chromosomeLength * len(chromosomes)
+
+
+class WriteDataBenchmark(MicroBenchmark):
+
+    name = "WriteManager.writeData"
+    recordUnit = "mutations"
+    mutationCount = 200000
+
+    # Sets up a data group directory (with metadata) for the WriteManager and the mutations to write to it.
+    def setUp(self):
+
+        self.dataGroupDirectory = os.path.join(self.workDirectory, "write_data")
+        os.mkdir(self.dataGroupDirectory)
+        generateMetadata("write_data", "synthetic_genome", "synthetic_nucleosomes", "input.bed",
+                         InputFormat.customBed, self.dataGroupDirectory)
+
+        self.mutations = list()
+        for i in range(self.mutationCount):
+            position = self.randomGenerator.randrange(chromosomeLength)
+            self.mutations.append((chromosomes[i%len(chromosomes)], str(position), str(position+1),
+                                   self.randomGenerator.choice(bases), self.randomGenerator.choice(bases),
+                                   self.randomGenerator.choice(('+','-'))))
+
+    def beforeRun(self):
+        self.writeManager = WriteManager(self.dataGroupDirectory)
+
+    # Only the writes themselves are timed, so the output is closed without the sorting and metadata updates.
+    def run(self):
+
+        writeData = self.writeManager.writeData
+        for mutation in self.mutations: writeData(*mutation)
+        self.writeManager.rootOutputFile.close()
+        self.writeManager.fanOutWriter.close()
+        return len(self.mutations)
+
+
+class ValidateCustomBedBenchmark(MicroBenchmark):
+
+    name = "validateCustomBedFile"
+    recordUnit = "entries"
+    entryCount = 500000
+
+    def setUp(self):
+
+        self.customBedFilePath = os.path.join(self.workDirectory, "validate_custom_input.bed")
+        with open(self.customBedFilePath, 'w') as customBedFile:
+            for i in range(self.entryCount):
+                position = self.randomGenerator.randrange(chromosomeLength)
+                customBedFile.write('\t'.join((chromosomes[i%len(chromosomes)], str(position), str(position+1),
+                                               self.randomGenerator.choice(bases), self.randomGenerator.choice(bases),
+                                               self.randomGenerator.choice(('+','-')), "cohort" + str(i%10))) + '\n')
+
+    def run(self):
+
+        validateCustomBedFile(self.customBedFilePath, chromosomes)
+        return self.entryCount
+
+
+microBenchmarks = {microBenchmark.name:microBenchmark for microBenchmark in
+                   (FastaFileIteratorBenchmark, ReverseComplimentBenchmark, ParseFastaDescriptionBenchmark,
+                    CountsFileGeneratorBenchmark, DyadPosContextCountsBenchmark, GenomeContextFrequencyBenchmark,
+                    WriteDataBenchmark, ValidateCustomBedBenchmark)}
+
+
+# Runs the given micro-benchmark the given number of times and returns a dictionary of its results.
+# Like timeit, garbage collection is disabled while the kernel is timed.
+# The times from earlier runs of the same micro-benchmark can be given to combine them with the new ones.
+def runMicroBenchmark(microBenchmark: MicroBenchmark, repeats, nanosecondsPerRecord = None):
+
+    if nanosecondsPerRecord is None: nanosecondsPerRecord = list()
+    for _ in range(repeats):
+
+        microBenchmark.beforeRun()
+
+        # Output from the kernels (e.g. progress messages) is discarded so it doesn't interfere with the results.
+        with contextlib.redirect_stdout(io.StringIO()):
+            gcWasEnabled = gc.isenabled()
+            gc.disable()
+            try:
+                startTime = time.perf_counter_ns()
+                records = microBenchmark.run()
+                elapsedTime = time.perf_counter_ns() - startTime
+            finally:
+                if gcWasEnabled: gc.enable()
+
+        microBenchmark.afterRun()
+        nanosecondsPerRecord.append(elapsedTime/records)
+
+    return {"records":records, "recordUnit":microBenchmark.recordUnit, "repeats":len(nanosecondsPerRecord),
+            "bestNanosecondsPerRecord":min(nanosecondsPerRecord),
+            "medianNanosecondsPerRecord":statistics.median(nanosecondsPerRecord),
+            "nanosecondsPerRecord":nanosecondsPerRecord}
+
+
+# Returns whether or not the given result is slower than the given baseline result by more than the given threshold.
+def isRegression(result, baselineResult, threshold):
+    return result["bestNanosecondsPerRecord"] > baselineResult["bestNanosecondsPerRecord"] * (1 + threshold)
+
+
+# Compares the given results against a baseline, printing the change in the best time per record for each kernel.
+# Kernels which are slower than the baseline by more than the given threshold (a fraction) are flagged as regressions.
+# Returns the names of the regressed kernels.
+def compareToBaseline(results, baselineResults, baselineFilePath, threshold):
+
+    print("\nComparison against baseline:", baselineFilePath)
+    print('\t'.join(("Kernel", "Baseline (ns)", "Current (ns)", "Change", "")))
+
+    regressions = list()
+    for kernelName, result in results.items():
+
+        if kernelName not in baselineResults:
+            print('\t'.join((kernelName, "NA", "%.1f" % result["bestNanosecondsPerRecord"], "NA", "not in baseline")))
+            continue
+
+        baselineResult = baselineResults[kernelName]
+        ratio = result["bestNanosecondsPerRecord"] / baselineResult["bestNanosecondsPerRecord"]
+        if isRegression(result, baselineResult, threshold):
+            flag = "REGRESSION"
+            regressions.append(kernelName)
+        elif ratio < 1 - threshold: flag = "improved"
+        else: flag = ''
+        if baselineResult["records"] != result["records"]: flag += " (inputs differ from baseline)"
+
+        print('\t'.join((kernelName, "%.1f" % baselineResult["bestNanosecondsPerRecord"],
+                         "%.1f" % result["bestNanosecondsPerRecord"], "%+.1f%%" % ((ratio - 1)*100), flag.strip())))
+
+    return regressions
+
+
+# Runs the given micro-benchmarks (all of them by default), printing the time taken per record by each.
+# The results can be saved as a baseline, and/or compared against a previously saved baseline.
+# By default, each kernel is run 5 times, or 15 times when saving or comparing against a baseline.  When comparing, a kernel which
+# appears to have regressed is run again (up to confirmationRuns more times, keeping the best time from every run) before
+# it is reported, so that a passing slowdown of the machine isn't mistaken for a regression.
+# Returns a dictionary of the results for each kernel.
+def runMicroBenchmarks(kernelNames = None, repeats = None, saveBaselineFilePath = None,
+                       compareBaselineFilePath = None, threshold = 0.2, confirmationRuns = 2):
+
+    if kernelNames is None or len(kernelNames) == 0: kernelNames = list(microBenchmarks)
+    for kernelName in kernelNames:
+        if kernelName not in microBenchmarks:
+            raise ValueError("Unknown kernel: " + kernelName + ".  Expected one of: " + ", ".join(microBenchmarks))
+    if repeats is None: repeats = 5 if saveBaselineFilePath is None and compareBaselineFilePath is None else 15
+    if repeats < 1: raise ValueError("Each micro-benchmark must be run at least once.")
+
+    if compareBaselineFilePath is not None:
+        with open(compareBaselineFilePath, 'r') as baselineFile:
+            baselineResults = json.load(baselineFile)["kernels"]
+
+    # Any metadata read by the kernels should resolve its external data within the temporary work directory.
+    workDirectory = tempfile.mkdtemp(prefix = "nucperiod_microbenchmarks_")
+    originalDataDirectory = os.getenv("NUCPERIOD_DATA_DIR")
+    os.environ["NUCPERIOD_DATA_DIR"] = workDirectory
+
+    results = dict()
+    try:
+        print('\t'.join(("Kernel", "Records", "Best (ns/record)", "Median (ns/record)")))
+        for kernelName in kernelNames:
+
+            microBenchmark = microBenchmarks[kernelName](workDirectory)
+            microBenchmark.setUp()
+            results[kernelName] = runMicroBenchmark(microBenchmark, repeats)
+
+            if compareBaselineFilePath is not None and kernelName in baselineResults:
+                for _ in range(confirmationRuns):
+                    if not isRegression(results[kernelName], baselineResults[kernelName], threshold): break
+                    results[kernelName] = runMicroBenchmark(microBenchmark, repeats, results[kernelName]["nanosecondsPerRecord"])
+
+            print('\t'.join((kernelName, str(results[kernelName]["records"]) + ' ' + microBenchmark.recordUnit,
+                             "%.1f" % results[kernelName]["bestNanosecondsPerRecord"],
+                             "%.1f" % results[kernelName]["medianNanosecondsPerRecord"])))
+            sys.stdout.flush()
+
+    finally:
+        shutil.rmtree(workDirectory)
+        if originalDataDirectory is None: del os.environ["NUCPERIOD_DATA_DIR"]
+        else: os.environ["NUCPERIOD_DATA_DIR"] = originalDataDirectory
+
+    if saveBaselineFilePath is not None:
+        with open(saveBaselineFilePath, 'w') as baselineFile:
+            json.dump({"python":platform.python_version(), "platform":platform.platform(),
+                       "kernels":results}, baselineFile, indent = 2)
+        print("\nBaseline saved to", saveBaselineFilePath)
+
+    if compareBaselineFilePath is not None:
+        regressions = compareToBaseline(results, baselineResults, compareBaselineFilePath, threshold)
+        if len(regressions) > 0:
+            print(len(regressions), "kernel(s) regressed by more than", "%g%%" % (threshold*100), "against the baseline.")
+
+    return results
+
+
+# Given a namespace resulting from an argparser object (constructed in nucperiodpy.Main),
+# use the input to run this script.
+def parseArgs(args):
+
+    runMicroBenchmarks(args.kernels, args.repeats, args.save_baseline, args.compare, args.threshold/100)
@@ -0,0 +1,200 @@
+# This script runs an end-to-end benchmark of nucperiod on a synthetic data set: the data is parsed with parseBed,
+# run through the main pipeline, and then passed to the periodicity analysis.  Each stage is run as a separate nucperiod
+# command so that its wall time, CPU time, and peak memory usage can be measured independently.  Stages which need
+# external tools (bedtools or R) that are not installed are skipped, so the benchmark can run on any plain Linux box.
+# The startup time of each command is also checked, along with whether it (wrongly) loads the Tkinter UI.
+
+import os, sys, json, time, shutil, tempfile, platform, subprocess
+from nucperiodpy.helper_scripts.Instrumentation import measureStage, getPeakRSS
+from nucperiodpy.benchmarks.SyntheticData import generateSyntheticDataSet
+
+
+# Run in a separate process to time how long nucperiod takes to import and set up the given command (without running it).
+# Prints the time taken and whether tkinter was imported along the way.
+startupCheckCode = ("import sys, time; startTime = time.perf_counter(); from nucperiodpy import Main; "
+                    "Main.getCommandFunction(Main.getMainParser().parse_args(sys.argv[1:])); "
+                    "print(time.perf_counter() - startTime, 'tkinter' in sys.modules)")
+
+
+# Returns the environment for nucperiod child processes, which use the given data directory
+# and can find this copy of nucperiodpy.
+def getBenchmarkEnvironment(dataDirectory):
+
+    environment = dict(os.environ)
+    environment["NUCPERIOD_DATA_DIR"] = dataDirectory
+    packageParentDirectory = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    environment["PYTHONPATH"] = os.pathsep.join(filter(None, (packageParentDirectory, environment.get("PYTHONPATH"))))
+    return environment
+
+
+# Measures the startup time of the given nucperiod command over the given number of runs, returning a dictionary with
+# the best times for the whole process and for importing and setting up the command alone.
+# Commands should not import tkinter, since they are expected to run on machines without a display (or tk at all).
+def measureStartupTime(commandArgs, dataDirectory, repeats = 5):
+
+    processTimes = list()
+    importTimes = list()
+    tkinterImported = False
+
+    for _ in range(repeats):
+        startTime = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", startupCheckCode] + commandArgs, capture_output = True, text = True,
+                                check = True, env = getBenchmarkEnvironment(dataDirectory)).stdout
+        processTimes.append(time.perf_counter() - startTime)
+
+        importTime, tkinterImportedText = output.split()[-2:]
+        importTimes.append(float(importTime))
+        tkinterImported = tkinterImported or tkinterImportedText == "True"
+
+    return {"command":commandArgs[0], "processSeconds":min(processTimes), "importSeconds":min(importTimes),
+            "tkinterImported":tkinterImported}
+
+
+# Prints a table summarizing the startup time of each command.
+def printStartupSummary(startupResults):
+
+    print("\n" + '\t'.join(("Command", "Startup (ms)", "Import (ms)", "Loads tkinter")))
+    for startupResult in startupResults:
+        print('\t'.join((startupResult["command"], "%.0f" % (startupResult["processSeconds"]*1000),
+                         "%.0f" % (startupResult["importSeconds"]*1000),
+                         "YES" if startupResult["tkinterImported"] else "no")))
+
+
+# Runs the given nucperiod command in a separate process, using the given data directory, and returns a dictionary
+# describing its performance.  The command's own metrics report is used to break its time down further by stage.
+def runBenchmarkStage(stageName, commandArgs, dataDirectory, outputDirectory):
+
+    metricsFilePath = os.path.join(outputDirectory, stageName + "_metrics.json")
+    logFilePath = os.path.join(outputDirectory, stageName + "_log.txt")
+
+    print("\nRunning benchmark stage:", stageName)
+    stageResult = {"stage":stageName, "command":' '.join(commandArgs)}
+    startTime = time.perf_counter()
+
+    with open(logFilePath, 'w') as logFile:
+        process = subprocess.Popen([sys.executable, "-m", "nucperiodpy.Main", "--metrics", metricsFilePath] + commandArgs,
+                                   stdout = logFile, stderr = subprocess.STDOUT, env = getBenchmarkEnvironment(dataDirectory))
+
+        # wait4 gives the CPU time used by this child process alone (unlike getrusage, which combines every child).
+        # (Its peak memory usage is not used, since on Linux it includes the memory this process was using when it forked.)
+        if hasattr(os, "wait4"):
+            _, exitStatus, resourceUsage = os.wait4(process.pid, 0)
+            process.returncode = os.WEXITSTATUS(exitStatus) if os.WIFEXITED(exitStatus) else -1
+            stageResult["CPUTimeSeconds"] = resourceUsage.ru_utime + resourceUsage.ru_stime
+        else: process.wait()
+
+    stageResult["wallTimeSeconds"] = time.perf_counter() - startTime
+    stageResult["status"] = "completed" if process.returncode == 0 else "failed (see " + logFilePath + ')'
+
+    # Use the command's own metrics to find its peak memory usage and break its time down by substage.
+    if os.path.exists(metricsFilePath):
+        with open(metricsFilePath, 'r') as metricsFile:
+            stageResult["substages"] = json.load(metricsFile)["stageTotals"]
+        peakRSSValues = [substage["maxPeakRSSKilobytes"] for substage in stageResult["substages"].values()
+                         if substage["maxPeakRSSKilobytes"] is not None]
+        if len(peakRSSValues) > 0: stageResult["peakRSSKilobytes"] = max(peakRSSValues)
+
+    print("Stage", stageResult["status"], "in", "%.2f" % stageResult["wallTimeSeconds"], "seconds.")
+    return stageResult
+
+
+# Prints a table summarizing the results of each benchmark stage.
+def printBenchmarkSummary(stageResults, mutationCount):
+
+    print("\n" + '\t'.join(("Stage", "Status", "Wall (s)", "CPU (s)", "Peak RSS (MB)", "Mutations/s")))
+    for stageResult in stageResults:
+
+        row = [stageResult["stage"], stageResult["status"].split(' (')[0]]
+        if "wallTimeSeconds" in stageResult:
+            row.append("%.2f" % stageResult["wallTimeSeconds"])
+            row.append("%.2f" % stageResult["CPUTimeSeconds"] if stageResult.get("CPUTimeSeconds") is not None else "NA")
+            row.append("%.1f" % (stageResult["peakRSSKilobytes"]/1024) if stageResult.get("peakRSSKilobytes") is not None else "NA")
+            row.append("%.0f" % (mutationCount/stageResult["wallTimeSeconds"]) if stageResult["wallTimeSeconds"] > 0 else "NA")
+        else: row += ["NA"]*4
+
+        print('\t'.join(row))
+
+
+# Generates a synthetic data set with the given number of mutations (optionally assigned to the given number of cohorts)
+# and runs it through parseBed, the main pipeline, and the periodicity analysis, reporting the performance of each stage.
+# Returns the path to the benchmark report.
+def runBenchmark(mutationCount, cohortCount = 0, genomeSize = 10**6, chromosomeCount = 4, seed = 0,
+                 outputDirectory = None, keepData = False, jobs = 1, inMemory = False, useNucGroupRadius = False):
+
+    if outputDirectory is None: outputDirectory = tempfile.mkdtemp(prefix = "nucperiod_benchmark_")
+    outputDirectory = os.path.abspath(outputDirectory)
+    dataDirectory = os.path.join(outputDirectory, "nucperiod_data")
+    if os.path.exists(dataDirectory): shutil.rmtree(dataDirectory)
+
+    bedtoolsFound = shutil.which("bedtools") is not None
+    RFound = shutil.which("Rscript") is not None
+    if not bedtoolsFound: print("bedtools not found.  Context normalization will be skipped.")
+    if not RFound: print("Rscript not found.  The periodicity analysis will be skipped.")
+
+    stageResults = list()
+
+    # Generate the synthetic data.
+    with measureStage("generateSyntheticData") as stageMetrics:
+        genomeFilePath, nucPosFilePath, customBedFilePath = generateSyntheticDataSet(
+            dataDirectory, mutationCount, cohortCount, genomeSize, chromosomeCount, seed
+        )
+        stageMetrics.records = mutationCount
+    stageResults.append({"stage":stageMetrics.stageName, "status":"completed", "wallTimeSeconds":stageMetrics.wallTime,
+                         "CPUTimeSeconds":stageMetrics.CPUTime, "peakRSSKilobytes":getPeakRSS()})
+    dataGroupDirectory = os.path.dirname(customBedFilePath)
+
+    # Set up the commands for each stage.
+    parseBedArgs = ["parseBed", customBedFilePath, "-g", genomeFilePath, "-n", nucPosFilePath]
+    if cohortCount > 0: parseBedArgs.append("-c")
+
+    mainPipelineArgs = ["mainPipeline", dataGroupDirectory, "-s", "-f", "-j", str(jobs)]
+    if useNucGroupRadius: mainPipelineArgs.append("-g")
+    if bedtoolsFound:
+        mainPipelineArgs += ["-c", "3"]
+        # Without R, normalization can still be benchmarked using the in-memory pipeline.
+        if inMemory or not RFound: mainPipelineArgs.append("-i")
+    else: mainPipelineArgs.append("-n")
+
+    periodicityAnalysisArgs = ["periodicityAnalysis", dataGroupDirectory, "-o",
+                               os.path.join(outputDirectory, "periodicity_results.tsv")]
+
+    # Check the startup time of each command.
+    print("\nMeasuring startup times...")
+    startupResults = [measureStartupTime(commandArgs, dataDirectory) for commandArgs in
+                      (parseBedArgs, mainPipelineArgs, periodicityAnalysisArgs)]
+
+    # Run each stage, skipping any that can't be run.
+    previousStageFailed = False
+    for stageName, commandArgs, requirementMet, requirement in (("parseBed", parseBedArgs, True, None),
+                                                                 ("mainPipeline", mainPipelineArgs, True, None),
+                                                                 ("periodicityAnalysis", periodicityAnalysisArgs, RFound, "Rscript")):
+        if previousStageFailed:
+            stageResults.append({"stage":stageName, "status":"skipped (a previous stage failed)"})
+        elif not requirementMet:
+            stageResults.append({"stage":stageName, "status":"skipped (" + requirement + " not found)"})
+        else:
+            stageResults.append(runBenchmarkStage(stageName, commandArgs, dataDirectory, outputDirectory))
+            previousStageFailed = stageResults[-1]["status"] != "completed"
+
+    # Write the report.
+    report = {"mutations":mutationCount, "cohorts":cohortCount, "genomeSize":genomeSize, "chromosomes":chromosomeCount,
+              "seed":seed, "jobs":jobs, "nucGroupRadius":useNucGroupRadius, "bedtoolsFound":bedtoolsFound, "RscriptFound":RFound,
+              "python":platform.python_version(), "platform":platform.platform(), "startup":startupResults, "stages":stageResults}
+    reportFilePath = os.path.join(outputDirectory, "benchmark_report.json")
+    with open(reportFilePath, 'w') as reportFile: json.dump(report, reportFile, indent = 2)
+
+    printStartupSummary(startupResults)
+    printBenchmarkSummary(stageResults, mutationCount)
+
+    if not keepData: shutil.rmtree(dataDirectory)
+    print("\nBenchmark report written to", reportFilePath)
+
+    return reportFilePath
+
+
+# Given a namespace resulting from an argparser object (constructed in nucperiodpy.Main),
+# use the input to run this script.
+def parseArgs(args):
+
+    runBenchmark(args.mutations, args.cohorts, args.genome_size, args.chromosomes, args.seed,
+                 args.output_dir, args.keep_data, args.jobs, args.in_memory, args.nuc_group_radius)
@@ -0,0 +1,102 @@
+# This script generates a synthetic data set for benchmarking: a random genome fasta file, a map of evenly spaced
+# nucleosome dyads, and a custom bed file of random single base substitutions (optionally assigned to cohorts).
+# Everything is streamed to disk (apart from one chromosome sequence at a time) so that very large data sets can be generated.
+
+import os, random
+from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import checkDirs, generateFilePath, DataTypeStr
+
+bases = ('A','C','G','T')
+
+
+# Returns a random chromosome sequence of the given length.  (Generated in blocks to limit the memory used along the way.)
+def generateChromosomeSequence(chromosomeLength, randomGenerator: random.Random, blockSize = 10**6):
+    return ''.join(''.join(randomGenerator.choices(bases, k = min(blockSize, chromosomeLength - blockStart)))
+                   for blockStart in range(0, chromosomeLength, blockSize))
+
+
+# Writes the given chromosome sequence to the given (open) genome fasta file.
+def writeChromosomeToFasta(chromosome, sequence, genomeFile):
+
+    genomeFile.write('>' + chromosome + '\n')
+    for lineStart in range(0, len(sequence), 60):
+        genomeFile.write(sequence[lineStart:lineStart+60] + '\n')
+
+
+# Writes nucleosome positions for the given chromosome with a dyad every 147 bp plus a random linker (20-60 bp).
+# Dyads are kept far enough away from the ends of the chromosome for the 1000 bp nucleosome group radius.
+def writeNucleosomePositions(chromosome, chromosomeLength, nucPosFile, randomGenerator: random.Random):
+
+    dyadCenter = 1100
+    while dyadCenter < chromosomeLength - 1100:
+        nucPosFile.write('\t'.join((chromosome, str(dyadCenter), str(dyadCenter+1))) + '\n')
+        dyadCenter += 147 + randomGenerator.randint(20, 60)
+
+
+# Yields the given number of random positions in [0, length) in ascending order without holding them in memory.
+# Each position is the minimum of the remaining uniformly distributed positions, which lies above the previous one.
+def getSortedRandomPositions(count, length, randomGenerator: random.Random):
+
+    previousFraction = 0
+    for remaining in range(count, 0, -1):
+        previousFraction += (1 - previousFraction) * (1 - randomGenerator.random()**(1/remaining))
+        yield min(int(previousFraction * length), length - 1)
+
+
+# Writes the given number of random single base substitutions in the given chromosome to the given (open) custom bed
+# file, sorted by position.  The reference bases match the chromosome sequence, and if cohortCount is greater than 0,
+# each mutation is assigned to a random cohort.
+def writeMutations(chromosome, sequence, mutationCount, cohortCount, customBedFile, randomGenerator: random.Random):
+
+    for position in getSortedRandomPositions(mutationCount, len(sequence), randomGenerator):
+
+        referenceBase = sequence[position]
+        mutantBase = randomGenerator.choice([base for base in bases if base != referenceBase])
+        choppedUpLine = [chromosome, str(position), str(position+1), referenceBase, mutantBase, '+']
+        if cohortCount > 0: choppedUpLine.append("cohort" + str(randomGenerator.randint(1, cohortCount)))
+
+        customBedFile.write('\t'.join(choppedUpLine) + '\n')
+
+
+# Generates a complete synthetic data set in the given nucperiod data directory: the genome and nucleosome map under
+# __external_data, and a custom bed input file in its own data group directory, ready to be passed to parseBed.
+# Returns the paths to the genome fasta file, nucleosome map, and custom bed file.
+def generateSyntheticDataSet(dataDirectory, mutationCount, cohortCount = 0, genomeSize = 10**6, chromosomeCount = 4,
+                             seed = 0, dataGroupName = "synthetic"):
+
+    if genomeSize // chromosomeCount < 10000:
+        raise ValueError("Each synthetic chromosome should be at least 10000 bp long to fit the nucleosome group radius.")
+    if mutationCount < 1: raise ValueError("At least one mutation must be generated.")
+
+    randomGenerator = random.Random(seed)
+
+    genomeDirectory = os.path.join(dataDirectory, "__external_data", "synthetic_genome")
+    nucPosDirectory = os.path.join(genomeDirectory, "synthetic_nucleosomes")
+    dataGroupDirectory = os.path.join(dataDirectory, dataGroupName)
+    checkDirs(nucPosDirectory, dataGroupDirectory)
+
+    genomeFilePath = os.path.join(genomeDirectory, "synthetic_genome.fa")
+    nucPosFilePath = os.path.join(nucPosDirectory, "synthetic_nucleosomes.bed")
+    customBedFilePath = generateFilePath(directory = dataGroupDirectory, dataGroup = dataGroupName,
+                                         dataType = DataTypeStr.customInput, fileExtension = ".bed")
+
+    # Generate the data one chromosome at a time (in sorted order, so the output files are sorted too) so that only
+    # a single chromosome sequence is ever held in memory.
+    chromosomeLength = genomeSize // chromosomeCount
+    chromosomes = sorted("chr" + str(i+1) for i in range(chromosomeCount))
+    print("Generating a", chromosomeLength*chromosomeCount, "bp synthetic genome with", chromosomeCount, "chromosome(s),",
+          "a synthetic nucleosome map, and", mutationCount, "synthetic mutations...")
+
+    with open(genomeFilePath, 'w') as genomeFile, open(nucPosFilePath, 'w') as nucPosFile:
+        with open(customBedFilePath, 'w') as customBedFile:
+
+            for i, chromosome in enumerate(chromosomes):
+
+                sequence = generateChromosomeSequence(chromosomeLength, randomGenerator)
+                writeChromosomeToFasta(chromosome, sequence, genomeFile)
+                writeNucleosomePositions(chromosome, chromosomeLength, nucPosFile, randomGenerator)
+
+                # Distribute the mutations evenly between the (equally sized) chromosomes.
+                chromosomeMutationCount = mutationCount // chromosomeCount + (1 if i < mutationCount % chromosomeCount else 0)
+                writeMutations(chromosome, sequence, chromosomeMutationCount, cohortCount, customBedFile, randomGenerator)
+
+    return genomeFilePath, nucPosFilePath, customBedFilePath
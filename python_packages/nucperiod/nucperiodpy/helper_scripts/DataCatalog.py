@@ -0,0 +1,237 @@
+# This script maintains a SQLite catalog of every file in the nucperiod data directory along with the information
+# encoded in its name and metadata (data group, data type, context, linker offset, nucleosome radius, cohorts, and
+# parent data).  Each directory in the catalog is stored with a signature (modification time) of itself and its metadata
+# file, so the catalog is brought up to date by re-reading only the directories that have changed since the last lookup,
+# and files can then be selected with indexed queries instead of walking and parsing the whole directory tree.
+
+import os, time, importlib.util
+from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import (DataTypeStr, getDataDirectory, getFilesInDirectory,
+                                                                  getFileSignature, readMetadataFile, getContext,
+                                                                  getLinkerOffset, checkForNucGroup)
+
+if importlib.util.find_spec("sqlite3") is not None: import sqlite3
+else: sqlite3 = None
+
+catalogFileName = ".catalog.sqlite"
+
+# Directories modified this recently (in nanoseconds) may still be changing within the resolution of their modification
+# time, so their signature is not recorded and they are re-read at the next lookup.
+racyModificationWindow = 2*10**9
+
+# The data types to look for in file names, from most to least specific. (e.g. "raw_nucleosome_mutation_counts" also
+# contains "nucleosome_mutation_counts")
+dataTypesBySpecificity = (DataTypeStr.rawNucCounts, DataTypeStr.normNucCounts, DataTypeStr.nucMutBackground,
+                          DataTypeStr.mutBackground, DataTypeStr.customBackgroundInfo, DataTypeStr.mutations,
+                          DataTypeStr.customInput)
+
+
+# Returns the data type designated in the given file name, or None if it has none.
+def getDataType(fileName):
+
+    for dataType in dataTypesBySpecificity:
+        if dataType in fileName: return dataType
+    return None
+
+
+# Returns the nucperiod data directory without prompting for one, or None if it has not been set up.
+def getConfiguredDataDirectory():
+
+    if (os.getenv("NUCPERIOD_DATA_DIR") is None and
+        not os.path.exists(os.path.join(os.getenv("HOME"), ".nucperiod", "data_dir.txt"))): return None
+    return getDataDirectory()
+
+
+class DataCatalog:
+
+    def __init__(self, dataDirectory = None):
+
+        if dataDirectory is None: dataDirectory = getDataDirectory()
+        self.dataDirectory = os.path.abspath(dataDirectory)
+        self.catalogFilePath = os.path.join(self.dataDirectory, catalogFileName)
+
+        self.connection = sqlite3.connect(self.catalogFilePath, timeout = 60)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS directories (path TEXT PRIMARY KEY, parent TEXT, "
+                                    "signature TEXT)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS directoriesByParent ON directories (parent)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, directory TEXT, "
+                                    "fileName TEXT, dataGroup TEXT, dataType TEXT, context INTEGER, linkerOffset INTEGER, "
+                                    "nucGroup INTEGER, cohorts TEXT, MSI INTEGER, MSS INTEGER, parentDataPath TEXT)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS filesByDirectory ON files (directory)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS filesByDataType ON files (dataType, path)")
+
+
+    # Create the necessary functions to use the class with the "with" keyword.
+    def __enter__(self): return self
+
+    def __exit__(self, type, value, tb): self.connection.close()
+
+
+    # Returns whether or not the given path is inside the data directory (and can therefore be cataloged).
+    def contains(self, path):
+        return os.path.abspath(path).startswith(self.dataDirectory + os.path.sep)
+
+
+    # Returns the bounds of the range of paths inside the given directory, for use in indexed queries.
+    def getPathRange(self, directory):
+
+        directoryPrefix = os.path.join(os.path.abspath(directory), '')
+        return directoryPrefix, directoryPrefix + chr(0x10FFFF)
+
+
+    # Returns the signature used to check the given directory (and its metadata) for changes,
+    # or None if it was changed too recently to be trusted.
+    def getDirectorySignature(self, directory):
+
+        directorySignature = getFileSignature(directory)
+        metadataSignature = getFileSignature(os.path.join(directory, ".metadata"))
+
+        for signature in (directorySignature, metadataSignature):
+            if signature is not None and time.time_ns() - signature[0] < racyModificationWindow: return None
+
+        return str((directorySignature, metadataSignature))
+
+
+    # Removes the given directory and everything inside it from the catalog.
+    def removeDirectory(self, directory):
+
+        pathRange = self.getPathRange(directory)
+        self.connection.execute("DELETE FROM directories WHERE path = ? OR (path > ? AND path < ?)", (directory,) + pathRange)
+        self.connection.execute("DELETE FROM files WHERE path > ? AND path < ?", pathRange)
+
+
+    # Re-reads the given directory, replacing its entries in the catalog.  Returns the paths to its subdirectories.
+    def catalogDirectory(self, directory, signature):
+
+        # Get the information shared by every file in the directory from its metadata, if present.
+        dataGroup, cohorts, parentDataPath = None, None, None
+        metadataFilePath = os.path.join(directory, ".metadata")
+        if os.path.exists(metadataFilePath):
+            try:
+                metadata = readMetadataFile(metadataFilePath)
+                dataGroup = metadata.get("dataGroupName")
+                cohorts = metadata.get("cohorts")
+                if metadata.get("localParentDataPath") is not None:
+                    parentDataPath = os.path.normpath(os.path.join(directory, metadata["localParentDataPath"]))
+            except (ValueError, IndexError): pass # Malformed metadata is left out of the catalog.
+        cohortDesignations = list() if cohorts in (None, "None") else cohorts.split(", ")
+
+        fileRows = list()
+        subdirectories = list()
+        for directoryEntry in os.scandir(directory):
+
+            if directoryEntry.is_dir():
+                subdirectories.append(directoryEntry.path)
+            elif not directoryEntry.name.startswith(catalogFileName):
+                fileRows.append((directoryEntry.path, directory, directoryEntry.name, dataGroup,
+                                 getDataType(directoryEntry.name), getContext(directoryEntry.name, True),
+                                 getLinkerOffset(directoryEntry.name), checkForNucGroup(directoryEntry.name),
+                                 cohorts, "MSI" in cohortDesignations, "MSS" in cohortDesignations, parentDataPath))
+
+        # Replace the directory's files, and remove any subdirectories which no longer exist.
+        self.connection.execute("DELETE FROM files WHERE directory = ?", (directory,))
+        self.connection.executemany("INSERT OR REPLACE INTO files VALUES (?,?,?,?,?,?,?,?,?,?,?,?)", fileRows)
+
+        for (previousSubdirectory,) in self.connection.execute("SELECT path FROM directories WHERE parent = ?",
+                                                               (directory,)).fetchall():
+            if previousSubdirectory not in subdirectories: self.removeDirectory(previousSubdirectory)
+
+        self.connection.execute("INSERT OR REPLACE INTO directories VALUES (?,?,?)",
+                                (directory, os.path.dirname(directory), signature))
+
+        return subdirectories
+
+
+    # Brings the catalog up to date for everything in the given directory (the whole data directory by default),
+    # only re-reading directories whose signatures have changed.
+    def update(self, directory = None):
+
+        if directory is None: directory = self.dataDirectory
+        directory = os.path.abspath(directory)
+
+        with self.connection:
+
+            if not os.path.isdir(directory):
+                self.removeDirectory(directory)
+                return
+
+            directoriesToCheck = [directory]
+            while len(directoriesToCheck) > 0:
+
+                currentDirectory = directoriesToCheck.pop()
+                signature = self.getDirectorySignature(currentDirectory)
+                catalogedRow = self.connection.execute("SELECT signature FROM directories WHERE path = ?",
+                                                       (currentDirectory,)).fetchone()
+
+                if signature is not None and catalogedRow is not None and catalogedRow[0] == signature:
+                    directoriesToCheck += [path for (path,) in self.connection.execute(
+                        "SELECT path FROM directories WHERE parent = ?", (currentDirectory,))]
+                else: directoriesToCheck += self.catalogDirectory(currentDirectory, signature)
+
+
+    # Returns the paths to all files in the given directory (recursively) which end with any of the given endings.
+    def getFilePaths(self, directory, validEndings):
+
+        self.update(directory)
+        return [path for (path,) in self.connection.execute("SELECT path FROM files WHERE path > ? AND path < ? "
+                                                            "ORDER BY path", self.getPathRange(directory))
+                if path.endswith(tuple(validEndings))]
+
+
+    # Returns the catalog entries for the given file paths as a dictionary of file paths paired with dictionaries of
+    # their cataloged information.  File paths outside of the catalog are left out.
+    def getEntries(self, filePaths):
+
+        for directory in set(os.path.dirname(os.path.abspath(filePath)) for filePath in filePaths
+                             if self.contains(filePath)):
+            self.update(directory)
+
+        entries = dict()
+        cursor = self.connection.cursor()
+        for filePath in filePaths:
+            if not self.contains(filePath): continue
+            cursor.execute("SELECT * FROM files WHERE path = ?", (os.path.abspath(filePath),))
+            row = cursor.fetchone()
+            if row is not None: entries[filePath] = dict(zip((column[0] for column in cursor.description), row))
+
+        return entries
+
+
+# Recursively searches the given directory for files with the specified ending(s), like getFilesInDirectory, but
+# using the catalog when the directory is inside the data directory.  Returns a sorted list of the resulting file paths.
+def getCatalogedFilesInDirectory(directory, validEnding, *additionalValidEndings):
+
+    dataDirectory = getConfiguredDataDirectory()
+    if sqlite3 is None or dataDirectory is None:
+        return getFilesInDirectory(directory, validEnding, *additionalValidEndings)
+
+    with DataCatalog(dataDirectory) as catalog:
+        if not catalog.contains(directory) and os.path.abspath(directory) != catalog.dataDirectory:
+            return getFilesInDirectory(directory, validEnding, *additionalValidEndings)
+        filePaths = catalog.getFilePaths(directory, (validEnding,) + additionalValidEndings)
+
+    # Return the paths relative to the given directory path, as getFilesInDirectory would.
+    absoluteDirectory = os.path.abspath(directory)
+    if directory == absoluteDirectory: return filePaths
+    return [os.path.join(directory, os.path.relpath(filePath, absoluteDirectory)) for filePath in filePaths]
+
+
+# Returns the catalog entries for the given file paths (see DataCatalog.getEntries), or an empty dictionary if
+# the catalog is unavailable.
+def getCatalogEntries(filePaths):
+
+    dataDirectory = getConfiguredDataDirectory()
+    if sqlite3 is None or dataDirectory is None: return dict()
+
+    with DataCatalog(dataDirectory) as catalog: return catalog.getEntries(filePaths)
+
+
+# Brings the catalog up to date for the given directories (e.g. after a stage writes to them), if it is available.
+def updateCatalog(*directories):
+
+    dataDirectory = getConfiguredDataDirectory()
+    if sqlite3 is None or dataDirectory is None: return
+
+    with DataCatalog(dataDirectory) as catalog:
+        for directory in directories:
+            if catalog.contains(directory): catalog.update(directory)
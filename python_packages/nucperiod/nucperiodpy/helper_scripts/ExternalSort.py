@@ -0,0 +1,99 @@
+# This script sorts bed files within python instead of calling on the shell's sort command, which would start a new
+# process for every file.  Files which fit within the memory budget are sorted in memory.  Larger files are split into
+# sorted runs which are spilled to disk and then merged (k-way) into the final output.
+# By default, lines are ordered by chromosome and then numerically by start position, like "sort -k1,1 -k2,2n" in the
+# C locale.  (Chromosomes are compared as python strings, which is how the rest of the pipeline expects them to be sorted.)
+
+import os, heapq, tempfile
+from typing import List
+from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import getTemporaryFilePath
+
+# The approximate amount of memory (in bytes) to use for sorting before spilling to disk.
+defaultMemoryBudget = 256*2**20
+
+# The approximate memory used by each line (and its sort key) in addition to its length.
+lineOverhead = 250
+
+# The most runs that are merged at once.  (If there are more, they are merged in multiple passes.)
+maxMergeWidth = 64
+
+
+# Sorts by chromosome, then start position, then the rest of the line.
+def bedSortKey(line: str):
+    choppedUpLine = line.split('\t', 2)
+    return (choppedUpLine[0], int(choppedUpLine[1]), line)
+
+
+# Sorts by the cohort designation in the 7th column, then as bedSortKey.  (Like "sort -k7,7 -k1,1 -k2,2n")
+def cohortBedSortKey(line: str):
+    choppedUpLine = line.split('\t')
+    return (choppedUpLine[6].rstrip('\n'), choppedUpLine[0], int(choppedUpLine[1]), line)
+
+
+# Writes the given sorted lines to a new temporary file in the given directory and returns its path.
+def writeRun(lines: List[str], temporaryDirectory):
+
+    runFileDescriptor, runFilePath = tempfile.mkstemp(prefix = "sort_run_", dir = temporaryDirectory)
+    with open(runFileDescriptor, 'w') as runFile: runFile.writelines(lines)
+    return runFilePath
+
+
+# Merges the given sorted runs into the given output file.
+def mergeRuns(runFilePaths, outputFilePath, sortKey):
+
+    runFiles = [open(runFilePath, 'r') for runFilePath in runFilePaths]
+    try:
+        with open(outputFilePath, 'w') as outputFile:
+            outputFile.writelines(heapq.merge(*runFiles, key = sortKey))
+    finally:
+        for runFile in runFiles: runFile.close()
+
+
+# Sorts the given file, writing the result to outputFilePath (or replacing the original file by default).
+# Lines are ordered using the given sort key function, and runs are spilled to disk once memoryBudget (in bytes) is reached.
+def sortFile(filePath, outputFilePath = None, sortKey = bedSortKey, memoryBudget = defaultMemoryBudget):
+
+    if outputFilePath is None: outputFilePath = filePath
+    temporaryDirectory = os.path.dirname(os.path.abspath(outputFilePath))
+    runFilePaths = list()
+
+    try:
+
+        # Read the file in chunks that fit within the memory budget, sorting each one.
+        with open(filePath, 'r') as unsortedFile:
+            while True:
+
+                lines = list()
+                memoryUsed = 0
+                for line in unsortedFile:
+                    if not line.endswith('\n'): line += '\n'
+                    lines.append(line)
+                    memoryUsed += len(line) + lineOverhead
+                    if memoryUsed >= memoryBudget: break
+
+                lines.sort(key = sortKey)
+
+                # If the whole file fit in memory, write it straight to the output.
+                if len(runFilePaths) == 0 and memoryUsed < memoryBudget:
+                    temporaryOutputFilePath = getTemporaryFilePath(outputFilePath)
+                    with open(temporaryOutputFilePath, 'w') as outputFile: outputFile.writelines(lines)
+                    os.replace(temporaryOutputFilePath, outputFilePath)
+                    return
+
+                if len(lines) > 0: runFilePaths.append(writeRun(lines, temporaryDirectory))
+                if memoryUsed < memoryBudget: break
+
+        # Merge the runs, in multiple passes if there are too many to open at once.
+        while len(runFilePaths) > maxMergeWidth:
+            mergedRunFilePath = writeRun(list(), temporaryDirectory)
+            mergeRuns(runFilePaths[:maxMergeWidth], mergedRunFilePath, sortKey)
+            for runFilePath in runFilePaths[:maxMergeWidth]: os.remove(runFilePath)
+            runFilePaths = runFilePaths[maxMergeWidth:] + [mergedRunFilePath]
+
+        temporaryOutputFilePath = getTemporaryFilePath(outputFilePath)
+        mergeRuns(runFilePaths, temporaryOutputFilePath, sortKey)
+        os.replace(temporaryOutputFilePath, outputFilePath)
+
+    finally:
+        for runFilePath in runFilePaths:
+            if os.path.exists(runFilePath): os.remove(runFilePath)
@@ -0,0 +1,125 @@
+# This script contains a class for writing to many output files at once without waiting on the disk.  Text written to
+# each file is collected in a large buffer, and full buffers are passed to a background thread to be written, so that
+# the writing overlaps with whatever is producing the text and far fewer (but larger) writes are made.
+
+import threading, queue
+from typing import List
+
+
+# A file opened through a FanOutWriter.  Behaves like a (write only) file object.
+class BufferedOutputFile:
+
+    __slots__ = ("fanOutWriter", "file", "buffer", "unbufferedSize", "closed")
+
+    def __init__(self, fanOutWriter, file):
+        self.fanOutWriter: FanOutWriter = fanOutWriter
+        self.file = file
+        self.buffer: List[str] = list()
+        self.unbufferedSize = fanOutWriter.bufferSize # The number of characters that can be written before flushing.
+        self.closed = False
+
+
+    # Create the necessary functions to use the class with the "with" keyword.
+    def __enter__(self): return self
+
+    def __exit__(self, type, value, tb): self.close()
+
+
+    def write(self, text: str):
+
+        self.buffer.append(text)
+        self.unbufferedSize -= len(text)
+        if self.unbufferedSize <= 0: self.flush()
+
+
+    def writelines(self, lines):
+        for line in lines: self.write(line)
+
+
+    # Passes any buffered text on to the background thread.
+    def flush(self):
+
+        if len(self.buffer) > 0:
+            self.fanOutWriter.submit(self.file.write, ''.join(self.buffer))
+            self.buffer = list()
+            self.unbufferedSize = self.fanOutWriter.bufferSize
+
+
+    # Writes any remaining text and closes the file.  By default, waits until everything written to it is on disk
+    # (so that the file can be read or sorted as soon as this returns).
+    def close(self, waitForWrites = True):
+
+        if self.closed: return
+        self.flush()
+        self.fanOutWriter.submit(self.file.close)
+        if waitForWrites: self.fanOutWriter.waitForWrites()
+        self.closed = True
+
+
+# Opens files for buffered writing and writes full buffers to them from a background thread.
+# Use with the "with" keyword (or call close) to stop the background thread once all files are closed.
+class FanOutWriter:
+
+    def __init__(self, bufferSize = 2**20, maxQueuedBuffers = 32):
+
+        self.bufferSize = bufferSize # The number of characters to buffer for each file before writing.
+
+        # The writes waiting for the background thread.  (Bounded, so that the buffers can't pile up in memory
+        # if the disk can't keep up.)
+        self.pendingWrites = queue.Queue(maxQueuedBuffers)
+        self.error = None # Any exception raised in the background thread, to be raised again in the main thread.
+
+        self.writerThread = threading.Thread(target = self.writePendingData, daemon = True)
+        self.writerThread.start()
+
+
+    # Create the necessary functions to use the class with the "with" keyword.
+    def __enter__(self): return self
+
+    def __exit__(self, type, value, tb): self.close()
+
+
+    # Run in the background thread, carrying out each submitted write until told to stop (given None).
+    def writePendingData(self):
+
+        while True:
+            pendingWrite = self.pendingWrites.get()
+            try:
+                if pendingWrite is None: return
+                function, args = pendingWrite
+                function(*args)
+            except Exception as error:
+                if self.error is None: self.error = error
+            finally: self.pendingWrites.task_done()
+
+
+    # Raises any exception from the background thread.
+    def checkForErrors(self):
+        if self.error is not None:
+            raise ValueError("Error encountered while writing output in the background.") from self.error
+
+
+    # Queues the given function (a write or close) to be run in the background thread.
+    def submit(self, function, *args):
+        self.checkForErrors()
+        self.pendingWrites.put((function, args))
+
+
+    # Waits until every queued write has been carried out.
+    def waitForWrites(self):
+        self.pendingWrites.join()
+        self.checkForErrors()
+
+
+    # Opens the given file path for buffered writing and returns the resulting file object.
+    def open(self, filePath, mode = 'w') -> BufferedOutputFile:
+        return BufferedOutputFile(self, open(filePath, mode))
+
+
+    # Waits for any queued writes and stops the background thread.  Files should be closed first.
+    def close(self):
+
+        if not self.writerThread.is_alive(): return
+        self.pendingWrites.put(None)
+        self.writerThread.join()
+        self.checkForErrors()
@@ -0,0 +1,90 @@
+# This script contains functions for recording "fingerprints" (size and modification time) of the files used and produced
+# by a stage of the pipeline, along with the parameters it was run with.  When the pipeline is re-run, any stage whose
+# inputs, parameters, and outputs match its recorded fingerprints is up to date and can be skipped.
+
+import os, json
+from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import checkDirs, getTemporaryFilePath
+
+
+# Returns the fingerprint for the given file as a list of its size and modification time (in nanoseconds).
+def getFileFingerprint(filePath):
+
+    fileStats = os.stat(filePath)
+    return [fileStats.st_size, fileStats.st_mtime_ns]
+
+
+# Flattens the given file path(s) (which may be nested in lists or tuples) into a single list of file paths.
+def flattenFilePaths(filePaths):
+
+    if filePaths is None: return list()
+    elif isinstance(filePaths, str): return [filePaths]
+
+    flattenedFilePaths = list()
+    for filePath in filePaths: flattenedFilePaths += flattenFilePaths(filePath)
+    return flattenedFilePaths
+
+
+# Returns the path to the fingerprint file for the given stage of the pipeline for the given data directory.
+def getFingerprintFilePath(dataDirectory, dataGroupName, stageName):
+    return os.path.join(dataDirectory, "intermediate_files", "fingerprints", dataGroupName + '_' + stageName + ".json")
+
+
+# Checks the given fingerprint file against the current state of the given inputs and parameters.
+# Returns whether or not the recorded outputs are up to date, and the result recorded for the stage.
+def checkFingerprints(fingerprintFilePath, inputFilePaths, parameters):
+
+    if not os.path.exists(fingerprintFilePath): return False, None
+
+    with open(fingerprintFilePath, 'r') as fingerprintFile:
+        try: fingerprints = json.load(fingerprintFile)
+        except ValueError: return False, None
+
+    # Make sure the parameters match.  (They are passed through json so that tuples are compared as lists.)
+    if fingerprints.get("parameters") != json.loads(json.dumps(parameters)): return False, None
+
+    # Make sure every input and output file still exists and is unchanged.
+    currentInputFingerprints = dict()
+    for inputFilePath in flattenFilePaths(inputFilePaths):
+        if not os.path.exists(inputFilePath): return False, None
+        currentInputFingerprints[inputFilePath] = getFileFingerprint(inputFilePath)
+    if fingerprints.get("inputs") != currentInputFingerprints: return False, None
+
+    for outputFilePath, outputFingerprint in fingerprints.get("outputs", dict()).items():
+        if not os.path.exists(outputFilePath) or getFileFingerprint(outputFilePath) != outputFingerprint:
+            return False, None
+
+    return True, fingerprints.get("result")
+
+
+# Records the fingerprints for the given inputs, parameters, and the output files in the given result.
+def recordFingerprints(fingerprintFilePath, inputFilePaths, parameters, result):
+
+    fingerprints = dict()
+    fingerprints["parameters"] = parameters
+    fingerprints["inputs"] = {inputFilePath:getFileFingerprint(inputFilePath)
+                              for inputFilePath in flattenFilePaths(inputFilePaths)}
+    fingerprints["outputs"] = {outputFilePath:getFileFingerprint(outputFilePath)
+                               for outputFilePath in flattenFilePaths(result)}
+    fingerprints["result"] = result
+
+    checkDirs(os.path.dirname(fingerprintFilePath))
+    temporaryFilePath = getTemporaryFilePath(fingerprintFilePath)
+    with open(temporaryFilePath, 'w') as fingerprintFile:
+        json.dump(fingerprints, fingerprintFile, indent = 1)
+    os.replace(temporaryFilePath, fingerprintFilePath)
+
+
+# Runs the given function with the given arguments unless the fingerprints recorded for it show that its outputs are
+# already up to date (or force is True).  The function's result should be a file path, a (nested) list of file paths,
+# or None.  Returns the function's result, or the recorded result if the function was skipped.
+def runIfOutdated(fingerprintFilePath, inputFilePaths, parameters, force, function, *args):
+
+    if not force:
+        isUpToDate, result = checkFingerprints(fingerprintFilePath, inputFilePaths, parameters)
+        if isUpToDate:
+            print("\nOutputs are up to date for", os.path.basename(fingerprintFilePath).rsplit(".json",1)[0] + ".  Skipping.")
+            return result
+
+    result = function(*args)
+    recordFingerprints(fingerprintFilePath, inputFilePaths, parameters, result)
+    return result
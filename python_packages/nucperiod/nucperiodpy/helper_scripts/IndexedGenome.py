@@ -0,0 +1,117 @@
+# This script contains a class for retrieving sequences directly from a genome fasta file, without calling on bedtools.
+# The genome is indexed with a samtools faidx compatible ".fai" file (which bedtools and samtools will also use) and
+# memory-mapped, so any sequence can be read by jumping straight to its position in the file.
+
+import os, mmap
+from typing import List
+from nucperiodpy.helper_scripts.UsefulBioinformaticsFunctions import reverseCompliment
+from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import getTemporaryFilePath
+
+
+# Returns the path to the fasta index for the given genome, creating the index if it doesn't exist or is out of date.
+def getFastaIndex(genomeFilePath):
+
+    fastaIndexFilePath = genomeFilePath + ".fai"
+    if os.path.exists(fastaIndexFilePath) and os.path.getmtime(fastaIndexFilePath) >= os.path.getmtime(genomeFilePath):
+        return fastaIndexFilePath
+
+    print("Indexing", os.path.basename(genomeFilePath) + "...")
+
+    # Each line of the index contains a sequence's name, length, byte offset, bases per line, and bytes per line.
+    indexEntries: List[list] = list()
+    offset = 0
+    with open(genomeFilePath, 'rb') as genomeFile:
+        for line in genomeFile:
+
+            if line.startswith(b'>'):
+                indexEntries.append([line[1:].split()[0].decode(), 0, offset + len(line), None, None])
+
+            elif len(indexEntries) > 0 and line.strip():
+                indexEntry = indexEntries[-1]
+                bases = len(line.rstrip(b"\r\n"))
+                if indexEntry[3] is None: indexEntry[3], indexEntry[4] = bases, len(line)
+                elif indexEntry[1] % indexEntry[3] != 0 or bases > indexEntry[3]:
+                    raise ValueError("Sequence lines for " + indexEntry[0] + " in " + genomeFilePath + " are not all " +
+                                     "the same length, so the genome cannot be indexed.")
+                indexEntry[1] += bases
+
+            offset += len(line)
+
+    temporaryFilePath = getTemporaryFilePath(fastaIndexFilePath)
+    with open(temporaryFilePath, 'w') as fastaIndexFile:
+        for name, length, sequenceOffset, lineBases, lineWidth in indexEntries:
+            fastaIndexFile.write('\t'.join((name, str(length), str(sequenceOffset), str(lineBases or 0),
+                                            str(lineWidth or 0))) + '\n')
+    os.replace(temporaryFilePath, fastaIndexFilePath)
+
+    return fastaIndexFilePath
+
+
+# Retrieves sequences from a genome fasta file using its index.  Use with the "with" keyword to close the genome file.
+class IndexedGenome:
+
+    def __init__(self, genomeFilePath):
+
+        self.genomeFilePath = genomeFilePath
+
+        # Read in the index as a dictionary of chromosomes paired with their length, offset, bases per line, and bytes per line.
+        self.index = dict()
+        with open(getFastaIndex(genomeFilePath), 'r') as fastaIndexFile:
+            for line in fastaIndexFile:
+                choppedUpLine = line.split('\t')
+                self.index[choppedUpLine[0]] = tuple(int(value) for value in choppedUpLine[1:5])
+
+        self.genomeFile = open(genomeFilePath, 'rb')
+        self.genome = mmap.mmap(self.genomeFile.fileno(), 0, access = mmap.ACCESS_READ)
+
+
+    # Create the necessary functions to use the class with the "with" keyword.
+    def __enter__(self): return self
+
+    def __exit__(self, type, value, tb): self.close()
+
+    def close(self):
+        self.genome.close()
+        self.genomeFile.close()
+
+
+    # Returns the byte offset in the genome file of the given (0 based) position in the given chromosome.
+    def getByteOffset(self, chromosome, position):
+
+        length, offset, lineBases, lineWidth = self.index[chromosome]
+        return offset + position // lineBases * lineWidth + position % lineBases
+
+
+    # Returns whether or not the given region (with 0 based start and 1 based end positions) lies within the genome.
+    def contains(self, chromosome, startPos, endPos):
+        return chromosome in self.index and 0 <= int(startPos) < int(endPos) <= self.index[chromosome][0]
+
+
+    # Returns the (uppercase) sequence from the given chromosome between the given 0 based start and 1 based end
+    # positions (as in a bed file), on the given strand.
+    def fetch(self, chromosome, startPos, endPos, strand = '+'):
+
+        startPos, endPos = int(startPos), int(endPos)
+        if chromosome not in self.index:
+            raise ValueError("Chromosome " + chromosome + " was not found in " + self.genomeFilePath)
+        if not self.contains(chromosome, startPos, endPos):
+            raise ValueError("The region " + chromosome + ':' + str(startPos) + '-' + str(endPos) + " is not within " +
+                             "the bounds of its chromosome in " + self.genomeFilePath)
+
+        sequence = self.genome[self.getByteOffset(chromosome, startPos):
+                               self.getByteOffset(chromosome, endPos)].replace(b'\n', b'').replace(b'\r', b'')
+        sequence = sequence.decode().upper()
+
+        if strand == '-': return reverseCompliment(sequence)
+        else: return sequence
+
+
+    # Returns the sequences for a batch of regions given as (chromosome, startPos, endPos, strand) tuples, in the same
+    # order.  The regions are read in the order they appear in the genome file to keep access to it sequential.
+    def fetchBatch(self, regions):
+
+        sequences = [None]*len(regions)
+        for i in sorted(range(len(regions)), key = lambda i: (self.index[regions[i][0]][1] if regions[i][0] in self.index else -1,
+                                                               int(regions[i][1]))):
+            sequences[i] = self.fetch(*regions[i])
+        return sequences
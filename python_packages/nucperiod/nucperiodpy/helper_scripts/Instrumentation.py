@@ -0,0 +1,129 @@
+# This script contains functions for measuring the wall time, CPU time, peak memory usage, and amount of data processed
+# by each stage of the pipeline, and for writing those measurements to a machine-readable (json) report.
+
+import os, sys, time, json, datetime
+from contextlib import contextmanager
+
+# The resource module is not available on all platforms.  Without it, CPU time falls back to this process only,
+# and peak memory usage is not reported.
+try: import resource
+except ImportError: resource = None
+
+
+# Stores the measurements for a single stage run on a single input file.
+class StageMetrics:
+
+    def __init__(self, stageName, inputFilePath = None):
+
+        self.stageName = stageName
+        self.inputFilePath = inputFilePath
+        self.records = None # Should be set by the stage if it knows how many records (e.g. mutations) it processed.
+        self.bytes = None # Defaults to the size of the input file, but may also be set by the stage.
+        self.wallTime = None
+        self.CPUTime = None
+        self.peakRSS = None
+        self.processID = os.getpid()
+
+        if inputFilePath is not None and os.path.isfile(inputFilePath):
+            self.bytes = os.path.getsize(inputFilePath)
+
+
+    # Returns the measurements as a dictionary, including throughput if possible.
+    def asDict(self):
+
+        metricsDict = {"stage":self.stageName, "inputFile":self.inputFilePath, "wallTimeSeconds":self.wallTime,
+                       "CPUTimeSeconds":self.CPUTime, "peakRSSKilobytes":self.peakRSS,
+                       "records":self.records, "bytes":self.bytes, "processID":self.processID}
+
+        if self.wallTime:
+            if self.records is not None: metricsDict["recordsPerSecond"] = self.records/self.wallTime
+            if self.bytes is not None: metricsDict["bytesPerSecond"] = self.bytes/self.wallTime
+
+        return metricsDict
+
+
+recordedMetrics = list() # The metrics recorded by this process (plus any collected from worker processes).
+
+# Functions to call when a stage starts or finishes (e.g. for profiling), each called with the stage's StageMetrics object.
+stageStartCallbacks = list()
+stageEndCallbacks = list()
+
+
+# Returns the total CPU time used by this process and any of its finished child processes (e.g. bedtools or R).
+def getCPUTime():
+
+    if resource is None: return time.process_time()
+
+    selfUsage = resource.getrusage(resource.RUSAGE_SELF)
+    childUsage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return selfUsage.ru_utime + selfUsage.ru_stime + childUsage.ru_utime + childUsage.ru_stime
+
+
+# Returns the largest peak resident set size (in kilobytes) of this process or any of its finished child processes.
+# (Note that this is a high water mark for the whole process, not just the current stage.)
+def getPeakRSS():
+
+    if resource is None: return None
+
+    peakRSS = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    if sys.platform == "darwin": peakRSS = peakRSS/1024 # macOS reports bytes instead of kilobytes.
+    return peakRSS
+
+
+# Measures the stage run within the context, yielding its StageMetrics object so that the stage can record
+# the number of records and bytes it processed.  The metrics are recorded even if the stage raises an error.
+@contextmanager
+def measureStage(stageName, inputFilePath = None):
+
+    stageMetrics = StageMetrics(stageName, inputFilePath)
+    for callback in stageStartCallbacks: callback(stageMetrics)
+
+    startWallTime = time.perf_counter()
+    startCPUTime = getCPUTime()
+
+    try: yield stageMetrics
+    finally:
+        stageMetrics.wallTime = time.perf_counter() - startWallTime
+        stageMetrics.CPUTime = getCPUTime() - startCPUTime
+        stageMetrics.peakRSS = getPeakRSS()
+        recordedMetrics.append(stageMetrics)
+        for callback in stageEndCallbacks: callback(stageMetrics)
+
+
+# Removes and returns all metrics recorded so far by this process.
+# (Used to send metrics from worker processes back to the main process.)
+def takeRecordedMetrics():
+
+    metrics = list(recordedMetrics)
+    recordedMetrics.clear()
+    return metrics
+
+
+# Adds metrics recorded by another process.
+def addRecordedMetrics(metrics):
+    recordedMetrics.extend(metrics)
+
+
+# Writes all recorded metrics to the given json file, along with totals for each stage.
+def writeMetricsReport(metricsFilePath, command = None, totalWallTime = None):
+
+    stageTotals = dict()
+    for stageMetrics in recordedMetrics:
+
+        totals = stageTotals.setdefault(stageMetrics.stageName, {"runs":0, "wallTimeSeconds":0, "CPUTimeSeconds":0,
+                                                                 "records":None, "bytes":None, "maxPeakRSSKilobytes":None})
+        totals["runs"] += 1
+        totals["wallTimeSeconds"] += stageMetrics.wallTime
+        totals["CPUTimeSeconds"] += stageMetrics.CPUTime
+        if stageMetrics.records is not None: totals["records"] = (totals["records"] or 0) + stageMetrics.records
+        if stageMetrics.bytes is not None: totals["bytes"] = (totals["bytes"] or 0) + stageMetrics.bytes
+        if stageMetrics.peakRSS is not None:
+            totals["maxPeakRSSKilobytes"] = max(stageMetrics.peakRSS, totals["maxPeakRSSKilobytes"] or 0)
+
+    report = {"command":command, "date":str(datetime.datetime.now()), "totalWallTimeSeconds":totalWallTime,
+              "stageTotals":stageTotals, "stages":[stageMetrics.asDict() for stageMetrics in recordedMetrics]}
+
+    with open(metricsFilePath, 'w') as metricsFile:
+        json.dump(report, metricsFile, indent = 2)
+
+    print("Metrics written to", metricsFilePath)
@@ -0,0 +1,106 @@
+# This script contains a profiler which can wrap any nucperiod command, writing a separate cProfile (.pstats) file for
+# each measured stage (see Instrumentation.py) along with a short summary of the biggest hotspots.
+
+import os, re, io, sys, cProfile, pstats, datetime
+from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import checkDirs
+from nucperiodpy.helper_scripts import Instrumentation
+
+
+class CommandProfiler:
+
+    def __init__(self, profileDirectory, hotspotCount = 20):
+
+        self.profileDirectory = os.path.abspath(profileDirectory)
+        self.hotspotCount = hotspotCount
+
+        # Every profile file written during this run starts with the same prefix, so they can be found
+        # (even when written by worker processes) and combined into the summary.
+        self.runPrefix = datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + '_'
+
+        self.commandProfile = cProfile.Profile()
+        self.activeProfiles = list() # A stack of the profiles for the command and any stages currently running.
+        self.stagesProfiled = 0 # Used to give each stage's profile file a unique name.
+
+
+    # Returns a file name friendly version of the given text.
+    def getFileNameText(self, text):
+        return re.sub(r"[^\w.-]+", '_', text).strip('_')
+
+
+    # Starts profiling the command.
+    def start(self):
+
+        checkDirs(self.profileDirectory)
+        Instrumentation.stageStartCallbacks.append(self.startStage)
+        Instrumentation.stageEndCallbacks.append(self.endStage)
+
+        self.activeProfiles.append(self.commandProfile)
+        self.commandProfile.enable()
+
+
+    # Pauses the current profile and starts a new one for the given stage.
+    # (Only one profile can be active at a time, so time spent in a stage is not included in the profile it was called from.)
+    def startStage(self, stageMetrics):
+
+        if len(self.activeProfiles) > 0: self.activeProfiles[-1].disable()
+        stageProfile = cProfile.Profile()
+        self.activeProfiles.append(stageProfile)
+        stageProfile.enable()
+
+
+    # Stops the given stage's profile and writes it to its own .pstats file, then resumes the previous profile.
+    def endStage(self, stageMetrics):
+
+        stageProfile = self.activeProfiles.pop()
+        stageProfile.disable()
+        self.stagesProfiled += 1
+
+        stageText = stageMetrics.stageName
+        if stageMetrics.inputFilePath is not None: stageText += '_' + os.path.basename(stageMetrics.inputFilePath)
+        stageProfile.dump_stats(os.path.join(self.profileDirectory, self.runPrefix + self.getFileNameText(stageText) +
+                                             '_' + str(stageMetrics.processID) + '_' +
+                                             str(self.stagesProfiled) + ".pstats"))
+
+        if len(self.activeProfiles) > 0: self.activeProfiles[-1].enable()
+
+
+    # Stops profiling the command, writes the profile for everything outside of the measured stages,
+    # and writes a summary of the hotspots across all the profiles.
+    def stop(self):
+
+        self.commandProfile.disable()
+        self.activeProfiles.clear()
+        Instrumentation.stageStartCallbacks.remove(self.startStage)
+        Instrumentation.stageEndCallbacks.remove(self.endStage)
+
+        self.commandProfile.dump_stats(os.path.join(self.profileDirectory, self.runPrefix + "command.pstats"))
+        self.writeSummary()
+
+
+    # Combines all the profiles from this run and writes the top functions by cumulative and internal time to a summary
+    # file.  The top functions by internal time are also printed.
+    def writeSummary(self):
+
+        profileFilePaths = sorted(os.path.join(self.profileDirectory, fileName) for fileName in os.listdir(self.profileDirectory)
+                                  if fileName.startswith(self.runPrefix) and fileName.endswith(".pstats"))
+
+        summaryText = io.StringIO()
+        summaryText.write("Profiles combined for this summary:\n")
+        for profileFilePath in profileFilePaths: summaryText.write("  " + os.path.basename(profileFilePath) + '\n')
+
+        combinedStats = pstats.Stats(*profileFilePaths, stream = summaryText)
+        combinedStats.strip_dirs()
+        combinedStats.files = list() # The profile files are already listed above, so don't repeat them with every table.
+
+        summaryText.write("\nTop " + str(self.hotspotCount) + " functions by cumulative time:\n")
+        combinedStats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.hotspotCount)
+        summaryText.write("\nTop " + str(self.hotspotCount) + " functions by internal time:\n")
+        combinedStats.sort_stats(pstats.SortKey.TIME).print_stats(self.hotspotCount)
+
+        summaryFilePath = os.path.join(self.profileDirectory, self.runPrefix + "summary.txt")
+        with open(summaryFilePath, 'w') as summaryFile: summaryFile.write(summaryText.getvalue())
+
+        print("\nProfiling hotspots (by internal time):")
+        combinedStats.stream = sys.stdout
+        combinedStats.sort_stats(pstats.SortKey.TIME).print_stats(min(self.hotspotCount, 10))
+        print("Profiles and full summary written to", self.profileDirectory)
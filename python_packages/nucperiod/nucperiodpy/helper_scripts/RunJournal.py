@@ -0,0 +1,84 @@
+# This script contains a journal which records the tasks completed during a run of the pipeline, so that a run which
+# crashes partway through can be resumed without redoing any of the finished work.
+
+import os, json, hashlib
+from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import getDataDirectory, checkDirs
+from nucperiodpy.helper_scripts.FileFingerprints import flattenFilePaths
+
+
+# Returns the path to the journal for a run with the given data directories and parameters.
+# The same inputs and parameters always produce the same path, so a failed run can find its journal again.
+def getRunJournalFilePath(dataDirectories, parameters):
+
+    runIdentifier = json.dumps([sorted(set(dataDirectories)), parameters])
+    runHash = hashlib.sha1(runIdentifier.encode()).hexdigest()
+    return os.path.join(getDataDirectory(), "__run_journals", runHash + ".jsonl")
+
+
+class RunJournal:
+
+    # Opens the journal at the given path.  If resuming, previously completed tasks are read from the journal.
+    # Otherwise, any existing journal is discarded and a new one is started.
+    def __init__(self, journalFilePath, resume = False):
+
+        self.journalFilePath = journalFilePath
+        self.completedTasks = dict() # The recorded results of completed tasks, keyed by their IDs.
+
+        checkDirs(os.path.dirname(journalFilePath))
+
+        if resume and os.path.exists(journalFilePath): self.readJournal()
+        elif resume: print("No journal found for a previous run with these inputs.  Starting from the beginning.")
+        elif os.path.exists(journalFilePath): os.remove(journalFilePath)
+
+        self.journalFile = open(journalFilePath, 'a')
+
+
+    # Reads the completed tasks from the journal.  Each line is a complete record, so a partially written line at the
+    # end of the file (e.g. from a crash mid-write) is ignored and trimmed from the journal.
+    def readJournal(self):
+
+        with open(self.journalFilePath, 'rb') as journalFile:
+            journalContents = journalFile.read()
+
+        consistentLength = journalContents.rfind(b'\n') + 1
+        if consistentLength < len(journalContents):
+            with open(self.journalFilePath, 'r+b') as journalFile: journalFile.truncate(consistentLength)
+
+        for line in journalContents[:consistentLength].splitlines():
+            try: record = json.loads(line)
+            except ValueError: continue
+            self.completedTasks[record["taskID"]] = record["result"]
+
+        print("Resuming run with", len(self.completedTasks), "task(s) already completed.")
+
+
+    # Returns whether or not the given task was completed in a previous run and, if so, its recorded result.
+    # Tasks whose output files no longer exist are treated as incomplete.
+    def getCompletedTask(self, taskID):
+
+        if taskID not in self.completedTasks: return False, None
+
+        result = self.completedTasks[taskID]
+        for filePath in flattenFilePaths(result):
+            if os.path.isabs(filePath) and not os.path.exists(filePath): return False, None
+
+        return True, result
+
+
+    # Records the given task's result in the journal, making sure it is written to disk before continuing.
+    def recordTask(self, taskID, result):
+
+        self.journalFile.write(json.dumps({"taskID":taskID, "result":result}) + '\n')
+        self.journalFile.flush()
+        os.fsync(self.journalFile.fileno())
+
+
+    # Closes the journal file.
+    def close(self):
+        if not self.journalFile.closed: self.journalFile.close()
+
+
+    # Closes and deletes the journal.  (Used once the run has finished successfully.)
+    def delete(self):
+        self.close()
+        if os.path.exists(self.journalFilePath): os.remove(self.journalFilePath)
@@ -0,0 +1,236 @@
+# This script contains a simple scheduler for running a graph of dependent tasks, either one at a time or on a pool of
+# worker processes.  Each task is run as soon as every task it depends on has finished.
+
+import os, sys
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from nucperiodpy.helper_scripts.Instrumentation import takeRecordedMetrics, addRecordedMetrics
+
+
+# A placeholder for the result of another task.  When given as one of a task's arguments (or as an item in a list or
+# tuple argument), it is replaced with the referenced task's result before the task is run, and the task automatically
+# depends on the referenced task.  If the result is None, the task is skipped, unless the result is not required
+# (see optional), in which case None is passed along instead.
+class TaskResult:
+
+    def __init__(self, taskID, required = True):
+        self.taskID = taskID
+        self.required = required
+
+    # Returns a placeholder for the same result which passes None along instead of causing the task to be skipped.
+    # (e.g. for a task which combines the results of several data sets, some of which may have been dropped)
+    def optional(self):
+        return TaskResult(self.taskID, False)
+
+
+# Stores the information needed to run a single task.
+class Task:
+
+    def __init__(self, taskID, function, args, dependencies, logFilePath):
+
+        self.taskID = taskID
+        self.function = function
+        self.args = args
+        self.logFilePath = logFilePath
+
+        # The task depends on any explicitly given tasks, as well as any tasks whose results are used as arguments.
+        self.dependencies = set(dependencies)
+        for arg in args:
+            if isinstance(arg, TaskResult): self.dependencies.add(arg.taskID)
+            elif isinstance(arg, (list, tuple)):
+                for item in arg:
+                    if isinstance(item, TaskResult): self.dependencies.add(item.taskID)
+
+
+# Redirects all output (including output from subprocesses like bedtools and Rscript) to the given log file.
+# Output is appended so that several tasks can write to the same log file one after another.
+@contextmanager
+def redirectOutputToLogFile(logFilePath):
+
+    sys.stdout.flush(); sys.stderr.flush()
+    originalStdout = os.dup(1)
+    originalStderr = os.dup(2)
+
+    with open(logFilePath, 'a') as logFile:
+        os.dup2(logFile.fileno(), 1)
+        os.dup2(logFile.fileno(), 2)
+        try: yield
+        finally:
+            sys.stdout.flush(); sys.stderr.flush()
+            os.dup2(originalStdout, 1)
+            os.dup2(originalStderr, 2)
+            os.close(originalStdout)
+            os.close(originalStderr)
+
+
+# Runs the given function with the given arguments, writing its output to the given log file if one is given.
+def runTaskFunction(function, args, logFilePath = None):
+
+    if logFilePath is None: return function(*args)
+    with redirectOutputToLogFile(logFilePath): return function(*args)
+
+
+# Runs the given task function in a worker process, returning its result along with any metrics recorded while it ran
+# so that they can be passed back to the main process.
+def runTaskFunctionInWorker(function, args, logFilePath = None):
+
+    takeRecordedMetrics() # Discard anything left over from a previous task that failed in this worker.
+    result = runTaskFunction(function, args, logFilePath)
+    return result, takeRecordedMetrics()
+
+
+class TaskScheduler:
+
+    # If a run journal is given, each completed task is recorded in it, and tasks it shows were completed
+    # in a previous run are not run again.
+    def __init__(self, jobs = 1, journal = None):
+
+        assert jobs > 0, "The number of jobs must be positive."
+
+        self.jobs = jobs
+        self.journal = journal
+        self.tasks = dict() # Tasks, keyed by their IDs, in the order they were added.
+        self.results = dict() # The results of finished tasks, keyed by their IDs.
+        self.failures = dict() # Errors raised by failed tasks, keyed by their IDs.
+
+
+    # Adds a task which runs the given function on the given arguments and returns a TaskResult for it.
+    # If a task with the given ID already exists, no new task is added.  (This allows tasks which create files
+    # shared between several data sets to be requested more than once but run only once.)
+    # Dependencies must be added before the tasks that depend on them, so the graph can never contain a cycle.
+    def addTask(self, taskID, function, *args, dependencies = (), logFilePath = None):
+
+        if taskID not in self.tasks:
+            task = Task(taskID, function, args, dependencies, logFilePath)
+            for dependency in task.dependencies:
+                if dependency not in self.tasks:
+                    raise ValueError("Task \"" + taskID + "\" depends on unknown task \"" + dependency + "\".")
+            self.tasks[taskID] = task
+
+        return TaskResult(taskID)
+
+
+    # Returns the result of the task with the given ID.
+    def getResult(self, taskID):
+        return self.results[taskID]
+
+
+    # Replaces any TaskResult arguments for the given task with the results they reference.
+    # Returns None if any of the required results are None, in which case the task should be skipped.
+    def resolveArgs(self, task: Task):
+
+        resolvedArgs = list()
+        for arg in task.args:
+
+            if isinstance(arg, TaskResult):
+                required = arg.required
+                arg = self.results[arg.taskID]
+                if arg is None and required: return None
+
+            elif isinstance(arg, (list, tuple)):
+                resolvedItems = list()
+                for item in arg:
+                    if isinstance(item, TaskResult):
+                        required = item.required
+                        item = self.results[item.taskID]
+                        if item is None and required: return None
+                    resolvedItems.append(item)
+                arg = type(arg)(resolvedItems)
+
+            resolvedArgs.append(arg)
+
+        return resolvedArgs
+
+
+    # Checks the journal (if there is one) for a result for the given task from a previous run.
+    # If one is found, it is used as the task's result, and True is returned.
+    def checkJournal(self, taskID):
+
+        if self.journal is None: return False
+
+        isCompleted, result = self.journal.getCompletedTask(taskID)
+        if isCompleted:
+            print("Already completed:", taskID)
+            self.results[taskID] = result
+        return isCompleted
+
+
+    # Records the result of a completed task.
+    def recordResult(self, taskID, result):
+
+        self.results[taskID] = result
+        if self.journal is not None: self.journal.recordTask(taskID, result)
+
+
+    # Runs every task.  Tasks whose arguments reference a result of None are skipped and also given a result of None.
+    # When run with a single job, tasks are run in the order they were added, and errors are raised immediately.
+    # Otherwise, tasks are run on a pool of worker processes as soon as their dependencies have finished, and any
+    # tasks which depend on a failed task are not run.  An error summarizing all failures is raised at the end.
+    def run(self):
+
+        if self.jobs == 1:
+            for task in self.tasks.values():
+                if self.checkJournal(task.taskID): continue
+                args = self.resolveArgs(task)
+                if args is None: self.results[task.taskID] = None
+                else: self.recordResult(task.taskID, runTaskFunction(task.function, args, task.logFilePath))
+            return self.results
+
+        remainingTasks = dict(self.tasks)
+        runningTasks = dict() # Task IDs, keyed by the futures associated with them.
+
+        with ProcessPoolExecutor(max_workers = self.jobs) as executor:
+
+            while len(remainingTasks) > 0 or len(runningTasks) > 0:
+
+                # Start (or skip) every task whose dependencies have all finished.
+                # Skipping a task may allow others to start, so keep checking until no more progress is made.
+                progressMade = True
+                while progressMade:
+
+                    progressMade = False
+                    for taskID, task in list(remainingTasks.items()):
+
+                        if not all(dependency in self.results or dependency in self.failures
+                                   for dependency in task.dependencies): continue
+
+                        del remainingTasks[taskID]
+                        progressMade = True
+
+                        if any(dependency in self.failures for dependency in task.dependencies):
+                            self.failures[taskID] = ValueError("A task this task depends on failed.")
+                            continue
+
+                        if self.checkJournal(taskID): continue
+
+                        args = self.resolveArgs(task)
+                        if args is None:
+                            self.results[taskID] = None
+                            continue
+
+                        print("Starting:", taskID)
+                        runningTasks[executor.submit(runTaskFunctionInWorker, task.function, args, task.logFilePath)] = taskID
+
+                if len(runningTasks) == 0: continue
+
+                # Wait for at least one task to finish and record its result.
+                finishedFutures, _ = wait(runningTasks, return_when = FIRST_COMPLETED)
+                for future in finishedFutures:
+
+                    taskID = runningTasks.pop(future)
+                    try: result, metrics = future.result()
+                    except Exception as error:
+                        self.failures[taskID] = error
+                        print("Failed:", taskID, '(' + repr(error) + ')')
+                        if self.tasks[taskID].logFilePath is not None:
+                            print("See the log file for details:", self.tasks[taskID].logFilePath)
+                    else:
+                        addRecordedMetrics(metrics)
+                        self.recordResult(taskID, result)
+                        print("Finished:", taskID)
+
+        if len(self.failures) > 0:
+            raise ValueError(str(len(self.failures)) + " task(s) failed or could not be run:\n" +
+                             '\n'.join(self.failures.keys()))
+
+        return self.results
@@ -3,14 +3,40 @@
 import os, datetime
 from enum import Enum
 
+# Process-wide caches of the data directory text file and metadata files, paired with the signature of the file (see
+# getFileSignature) when it was read, so that the same tiny files are not re-read and re-parsed over and over again.
+dataDirectoryCache = dict()
+metadataCache = dict()
+
+
+# Returns a signature (modification time and size) of the given file which changes whenever the file is modified,
+# or None if the file does not exist.
+def getFileSignature(filePath):
+
+    try: fileStats = os.stat(filePath)
+    except FileNotFoundError: return None
+    return (fileStats.st_mtime_ns, fileStats.st_size)
+
+
 # Get the data directory for nucperiod, creating it from user input if necessary.
 def getDataDirectory():
 
+    # The data directory can be overridden for a single run (e.g. by the benchmarks) through an environment variable.
+    if os.getenv("NUCPERIOD_DATA_DIR") is not None:
+        dataDirectory = os.getenv("NUCPERIOD_DATA_DIR")
+        checkDirs(os.path.join(dataDirectory,"__external_data"))
+        return dataDirectory
+
     # Check for the text file which should contain the path to the data directory.
     dataDirectoryTextFilePath = os.path.join(os.getenv("HOME"), ".nucperiod", "data_dir.txt")
 
-    # If it exists, return the directory path within.
-    if os.path.exists(dataDirectoryTextFilePath):
+    # If it exists, return the directory path within. (The directory is only re-read and re-checked if the file changes.)
+    fileSignature = getFileSignature(dataDirectoryTextFilePath)
+    if fileSignature is not None:
+
+        cachedDataDirectory = dataDirectoryCache.get(dataDirectoryTextFilePath)
+        if cachedDataDirectory is not None and cachedDataDirectory[0] == fileSignature: return cachedDataDirectory[1]
+
         with open(dataDirectoryTextFilePath, 'r') as dataDirectoryTextFile:
             
             dataDirectory = dataDirectoryTextFile.readline().strip()
@@ -20,7 +46,9 @@ def getDataDirectory():
             if not os.path.exists(dataDirectory):
                 print("Data directory not found at expected location: {}".format(dataDirectory))
                 print("Please select a new location to create a data directory.")
-            else: return dataDirectory
+            else:
+                dataDirectoryCache[dataDirectoryTextFilePath] = (fileSignature, dataDirectory)
+                return dataDirectory
 
     else:
 
@@ -128,6 +156,12 @@ def checkDirs(*directoryPaths):
         if not os.path.exists(directoryPath): os.makedirs(directoryPath)
 
 
+# Returns a process-specific temporary path for the given file path.  Shared files (e.g. genome-wide caches) should be
+# written to this path and then moved into place with os.replace so that no process ever reads a partially written file.
+def getTemporaryFilePath(filePath: str):
+    return filePath + ".tmp" + str(os.getpid())
+
+
 # Given a genome fasta file, return the chromosomes present in that file.  
 def getAcceptableChromosomes(genomeFilePath: str):
 
@@ -143,15 +177,17 @@ def getAcceptableChromosomes(genomeFilePath: str):
     if not os.path.exists(acceptableChromosomesFilePath):
         print("Acceptable chromosomes file not found at expected location.  Generating from given fasta file...")
 
+        temporaryFilePath = getTemporaryFilePath(acceptableChromosomesFilePath)
         with open(genomeFilePath, 'r') as genomeFile:
-            with open(acceptableChromosomesFilePath, 'w') as acceptableChromosomesFile:
+            with open(temporaryFilePath, 'w') as acceptableChromosomesFile:
 
                 for line in genomeFile:
                     if line.startswith('>'):
                         chromosomeName = line[1:].strip()
                         print("Found chromosome:", chromosomeName)
                         acceptableChromosomesFile.write(chromosomeName + '\n')
-        
+        os.replace(temporaryFilePath, acceptableChromosomesFilePath)
+
         print("If these chromosome designations seem incorrect, check that the genome fasta file headers are formatted correctly.")
 
     # Create a list of acceptable chromosome strings from the acceptable chromosomes file and return it.
@@ -177,6 +213,14 @@ def getContext(filePath: str, asInt = False):
     return None
 
 
+# Returns the text associated with the given context number (e.g. 3 returns "trinuc").
+def getContextText(contextNum: int):
+
+    contexts = {1:"singlenuc", 3:"trinuc", 5:"pentanuc"}
+    if contextNum not in contexts: raise ValueError("Unexpected context number: " + str(contextNum))
+    return contexts[contextNum]
+
+
 # Returns the amount of linker DNA associated with the given file path.
 def getLinkerOffset(filePath: str):
 
@@ -228,6 +272,32 @@ def getNucMutCounts(rawNucCountsPath, dyadPosCutoff = 60):
     return nucMutCounts
 
 
+# Writes the given table (a dictionary of column headers paired with equal-length lists of values) to a tsv file.
+# Values are converted to text using the given function.
+def writeTableToTSV(table: dict, filePath, formatValue = str):
+
+    with open(filePath, 'w') as tsvFile:
+        tsvFile.write('\t'.join(table.keys()) + '\n')
+        for row in zip(*table.values()):
+            tsvFile.write('\t'.join(formatValue(value) for value in row) + '\n')
+
+
+# Returns the total number of mutations in the given mutation file.
+# The count recorded in the associated metadata is used if present.  Otherwise, the lines in the file are counted.
+# (This is an upper bound on the number of mutations that can fall within any nucleosome radius.)
+def getMutationFileCounts(mutationFilePath):
+
+    mutationCounts = Metadata(mutationFilePath).mutationCounts
+    if mutationCounts is not None: return int(mutationCounts)
+
+    mutationCounts = 0
+    with open(mutationFilePath, 'rb') as mutationFile:
+        for chunk in iter(lambda: mutationFile.read(1024*1024), b''):
+            mutationCounts += chunk.count(b'\n')
+
+    return mutationCounts
+
+
 # Returns whether or not the given file path uses the nuc-group radius.
 def checkForNucGroup(filePath: str):
 
@@ -287,6 +357,9 @@ def generateMetadata(dataGroupName, associatedGenome, associatedNucleosomePositi
                      localParentDataPath, inputFormat, metadataDirectory, *cohorts,
                      callParamsFilePath = None):
 
+    # Make sure a cached copy of any previous metadata isn't used, even if the file's signature happens not to change.
+    metadataCache.pop(os.path.join(metadataDirectory,".metadata"), None)
+
     # Open up the metadata file.
     with open(os.path.join(metadataDirectory,".metadata"), 'w') as metadataFile:
 
@@ -313,6 +386,30 @@ def generateMetadata(dataGroupName, associatedGenome, associatedNucleosomePositi
             metadataFile.write("cohorts:\tNone\n")
 
 
+# Reads the given metadata file and returns its contents as a dictionary of key-value pairs.
+# The parsed contents are cached until the file is modified, and each call returns its own copy.
+def readMetadataFile(metadataFilePath):
+
+    fileSignature = getFileSignature(metadataFilePath)
+    cachedMetadata = metadataCache.get(metadataFilePath)
+    if fileSignature is not None and cachedMetadata is not None and cachedMetadata[0] == fileSignature:
+        return dict(cachedMetadata[1])
+
+    metadata = dict()
+    with open(metadataFilePath, 'r') as metadataFile:
+        for line in metadataFile:
+
+            choppedUpLine = str(line).strip().split(maxsplit = 1)
+
+            if not choppedUpLine[0].endswith(':'):
+                raise ValueError("Malformed metadata line: " + line.strip())
+
+            metadata[choppedUpLine[0][:-1]] = choppedUpLine[1]
+
+    metadataCache[metadataFilePath] = (fileSignature, metadata)
+    return dict(metadata)
+
+
 # Keeps track of data about a given data group by accessing the metadata file in the same directory
 class Metadata:
 
@@ -320,28 +417,15 @@ class Metadata:
     def __init__(self,filePath):
 
         # Get the path to the metadata file.
-        if os.path.isdir(filePath):
-            self.metadataFilePath = os.path.join(filePath,".metadata")
-        else:
-            self.metadataFilePath = os.path.join(os.path.dirname(filePath),".metadata")
+        if os.path.isdir(filePath): metadataDirectory = filePath
+        else: metadataDirectory = os.path.dirname(filePath)
+        self.metadataFilePath = os.path.join(metadataDirectory,".metadata")
 
-        # Read the metadata file and put its contents into and dictionary, key-value pairs in the file.
-        self.metadata = dict()
-        with open(self.metadataFilePath, 'r') as metadataFile:
-            for line in metadataFile:
-
-                choppedUpLine = str(line).strip().split(maxsplit = 1)
-
-                if not choppedUpLine[0].endswith(':'):
-                    raise ValueError("Malformed metadata line: " + line.strip())
-
-                self.metadata[choppedUpLine[0][:-1]] = choppedUpLine[1]
+        # Get the key-value pairs in the metadata file as a dictionary.
+        self.metadata = readMetadataFile(self.metadataFilePath)
 
         # Add the metadata directory to the metadata! (So meta!)
-        if os.path.isdir(filePath):
-            self.metadata["metadataDirectory"] = filePath
-        else:
-            self.metadata["metadataDirectory"] = os.path.dirname(filePath)
+        self.metadata["metadataDirectory"] = metadataDirectory
 
         # Generate quick and easy to use class members to access common metadata!
         self.wrapMetadataInMembers()
@@ -386,9 +470,11 @@ class Metadata:
 
         ### Get file paths for useful metadata associated files.
 
-        self.genomeFilePath = os.path.join(getExternalDataDirectory(),self.genomeName,self.genomeName+".fa")
+        externalDataDirectory = getExternalDataDirectory()
+
+        self.genomeFilePath = os.path.join(externalDataDirectory,self.genomeName,self.genomeName+".fa")
 
-        self.baseNucPosFilePath = os.path.join(getExternalDataDirectory(), self.genomeName,
+        self.baseNucPosFilePath = os.path.join(externalDataDirectory, self.genomeName,
                                                self.nucPosName, self.nucPosName+".bed")
 
         self.parentDataFilePath = os.path.join(self.directory, self.localParentDataPath)
@@ -410,4 +496,5 @@ class Metadata:
             metadataFile.write(key.value + ':\t' + str(value) + '\n')
 
         # Re-wrap metadata to include this new addition.
+        self.metadata[key.value] = str(value)
         self.wrapMetadataInMembers()
\ No newline at end of file
@@ -3,6 +3,7 @@
 
 import subprocess, os
 from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import rScriptsDirectory
+from nucperiodpy.helper_scripts.Instrumentation import measureStage
 
 
 class MSIIdentifier:
@@ -47,8 +48,9 @@ class MSIIdentifier:
             self.MSISeqInputDataFile.close()
 
         if verbose: print("Calling MSIseq to generate MSI donor list...")
-        subprocess.run(" ".join(("Rscript",os.path.join(rScriptsDirectory,"FindMSIDonors.R"),
-                                self.MSISeqInputDataFilePath, self.MSICohortsFilePath)), shell = True, check = True)
+        with measureStage("R: FindMSIDonors", self.MSISeqInputDataFilePath):
+            subprocess.run(" ".join(("Rscript",os.path.join(rScriptsDirectory,"FindMSIDonors.R"),
+                                    self.MSISeqInputDataFilePath, self.MSICohortsFilePath)), shell = True, check = True)
 
         self.MSICohortsIdentified = True
     
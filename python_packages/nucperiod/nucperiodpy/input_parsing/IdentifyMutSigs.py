@@ -3,6 +3,7 @@
 
 import subprocess, os
 from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import rScriptsDirectory
+from nucperiodpy.helper_scripts.Instrumentation import measureStage
 
 
 class MutSigIdentifier:
@@ -47,8 +48,9 @@ class MutSigIdentifier:
             self.deconstructSigsInputDataFile.close()
 
         if verbose: print("Calling deconstructSigs to identify mutation signatures")
-        subprocess.run(" ".join(("Rscript",os.path.join(rScriptsDirectory,"GetMutSigs.R"),
-                                self.deconstructSigsInputDataFilePath, self.deconstructSigsOutputFilePath)), shell = True, check = True)
+        with measureStage("R: GetMutSigs", self.deconstructSigsInputDataFilePath):
+            subprocess.run(" ".join(("Rscript",os.path.join(rScriptsDirectory,"GetMutSigs.R"),
+                                    self.deconstructSigsInputDataFilePath, self.deconstructSigsOutputFilePath)), shell = True, check = True)
 
         self.mutSigsIdentified = True
     
@@ -1,13 +1,33 @@
 # This script takes data from the Alexandrov paper and parses it into a format acceptable for the rest of the pipeline.
 
 import os
-from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog, Selections
 from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import (generateFilePath, generateMetadata, DataTypeStr, InputFormat,
-                                                                  checkDirs, getIsolatedParentDir, dataDirectory, getAcceptableChromosomes)
-from nucperiodpy.input_parsing.ParseCustomBed import parseCustomBed
+                                                                  checkDirs, getIsolatedParentDir, getDataDirectory, getAcceptableChromosomes)
+from nucperiodpy.input_parsing.ParseCustomBed import parseCustomBed, parseCustomBedRecords
+from nucperiodpy.helper_scripts.Instrumentation import measureStage
 
 
-def parseAlexandrov (bedInputFilePaths, genomeFilePath, nucPosFilePath):
+# Yields each valid mutation in the given Alexandrov data file as a list of custom bed columns.
+def getAlexandrovRecords(bedInputFilePath, acceptableChromosomes):
+
+    with open(bedInputFilePath, 'r') as bedInputFile:
+        for line in bedInputFile:
+
+            choppedUpLine = str(line).strip().split('\t')
+
+            # Make sure we have a valid chromosome
+            if ("chr" + choppedUpLine[2]) in acceptableChromosomes and not '/' in choppedUpLine[5]:
+            
+                # Convert the line to custom bed format.
+                if choppedUpLine[5] == '-': choppedUpLine[5] = '*'
+                if choppedUpLine[6] == '-': choppedUpLine[6] = '*'
+                yield ["chr" + choppedUpLine[2], str(int(choppedUpLine[3])-1), choppedUpLine[4], 
+                       choppedUpLine[5], choppedUpLine[6], '.', choppedUpLine[0]]
+
+
+# If streamRecords is true, mutations are passed directly to the custom bed parser instead of through an intermediate
+# custom bed file.
+def parseAlexandrov (bedInputFilePaths, genomeFilePath, nucPosFilePath, streamRecords = False):
 
     outputBedFilePaths = list()
 
@@ -26,39 +46,38 @@ def parseAlexandrov (bedInputFilePaths, genomeFilePath, nucPosFilePath):
         # Get the list of acceptable chromosomes
         acceptableChromosomes = getAcceptableChromosomes(genomeFilePath)
 
+        if streamRecords:
+            print("Passing data directly to custom bed parser.")
+            parseCustomBedRecords(getAlexandrovRecords(bedInputFilePath, acceptableChromosomes), bedInputFilePath,
+                                  genomeFilePath, False, False, False)
+            continue
+
         # Generate the output file.
         outputBedFilePath = generateFilePath(directory = intermediateFilesDir, dataGroup = getIsolatedParentDir(bedInputFilePath),
                                              dataType = DataTypeStr.customInput, fileExtension = ".bed")
 
         # Write data to the output file.
-        with open(bedInputFilePath, 'r') as bedInputFile:
-            with open(outputBedFilePath, 'w') as outputBedFile:
-
-                for line in bedInputFile:
-
-                    choppedUpLine = str(line).strip().split('\t')
+        with measureStage("parseAlexandrov", bedInputFilePath) as stageMetrics, open(outputBedFilePath, 'w') as outputBedFile:
 
-                    # Make sure we have a valid chromosome
-                    if ("chr" + choppedUpLine[2]) in acceptableChromosomes and not '/' in choppedUpLine[5]:
-                    
-                        # Convert the line to custom bed format.
-                        if choppedUpLine[5] == '-': choppedUpLine[5] = '*'
-                        if choppedUpLine[6] == '-': choppedUpLine[6] = '*'
-                        outputBedFile.write('\t'.join(("chr" + choppedUpLine[2], str(int(choppedUpLine[3])-1), choppedUpLine[4], 
-                                                    choppedUpLine[5], choppedUpLine[6], '.', choppedUpLine[0])) + '\n')
+            stageMetrics.records = 0
+            for record in getAlexandrovRecords(bedInputFilePath, acceptableChromosomes):
+                stageMetrics.records += 1
+                outputBedFile.write('\t'.join(record) + '\n')
 
         # Add the output file to the list.
         outputBedFilePaths.append(outputBedFilePath)
 
     # Pass the data to the custome bed parser.
-    print("\nPassing data to custom bed parser.\n")
-    parseCustomBed(outputBedFilePaths, genomeFilePath, nucPosFilePath, False, False, False)
+    if len(outputBedFilePaths) > 0:
+        print("\nPassing data to custom bed parser.\n")
+        parseCustomBed(outputBedFilePaths, genomeFilePath, nucPosFilePath, False, False, False)
 
 
 if __name__ == "__main__":
 
     #Create the Tkinter UI
-    dialog = TkinterDialog(workingDirectory=dataDirectory)
+    from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog, Selections
+    dialog = TkinterDialog(workingDirectory=getDataDirectory())
     dialog.createMultipleFileSelector("Input Files:",0,"alexandrov.txt",("text files",".txt"))
     dialog.createFileSelector("Genome Fasta File:",1,("Fasta Files",".fa"))
     dialog.createFileSelector("Strongly Positioned Nucleosome File:",2,("Bed Files",".bed"))
@@ -16,14 +16,14 @@
 #          in this column can be used to avoid assigning an entry to another cohort without breaking this rule.
 # The file is then converted to a format suitable for the rest of the package's analysis scripts.
 
-import os, subprocess, sys
-from typing import List
-from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog, Selections
+import os, re, contextlib, itertools, operator
+from typing import Iterable, List
 from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import (getDataDirectory, getIsolatedParentDir, generateMetadata,
-                                                                  Metadata, checkDirs, getFilesInDirectory, 
+                                                                  Metadata, getFilesInDirectory,
                                                                   InputFormat, getAcceptableChromosomes)
-from nucperiodpy.helper_scripts.UsefulBioinformaticsFunctions import (bedToFasta, FastaFileIterator,
-                                                                      isPurine, reverseCompliment)
+from nucperiodpy.helper_scripts.UsefulBioinformaticsFunctions import isPurine, reverseCompliment
+from nucperiodpy.helper_scripts.IndexedGenome import IndexedGenome
+from nucperiodpy.helper_scripts.Instrumentation import measureStage
 from nucperiodpy.input_parsing.WriteManager import WriteManager
 
 
@@ -79,99 +79,279 @@ def checkForErrors(choppedUpLine: List[str], cohortDesignationPresent, acceptabl
                          "Use \".\" to denote an entry that does not belong to a cohort.")
 
 
-def equivalentEntries(fastaEntry: FastaFileIterator.FastaEntry, choppedUpLine):
+# Returns a regular expression matching (whole) lines of custom bed input that pass every check in checkForErrors, apart
+# from the comparisons of the base positions, which are captured.  Lines which don't match aren't necessarily invalid
+# (e.g. extra whitespace) and should be checked with checkForErrors.
+def getValidEntryPattern(cohortDesignationPresent, acceptableChromosomes):
 
-    return(fastaEntry.chromosome == choppedUpLine[0] and
-           fastaEntry.startPos == choppedUpLine[1] and
-           fastaEntry.endPos == choppedUpLine[2] and
-           fastaEntry.strand == choppedUpLine[5])
+    return re.compile('^(?:' + '|'.join(re.escape(chromosome) for chromosome in acceptableChromosomes) + ')' +
+                      r"\t([0-9]+)\t([0-9]+)\t(?:[ACGT]+|\*|\.)\t(?:[ACGT]+|\*|OTHER)\t[-+.]" +
+                      (r"\t[^\t\n]*[^\s][^\t\n]*" if cohortDesignationPresent else '') + r"\r?$", re.MULTILINE)
 
+# Captures the positions and mutation of insertions (which need their positions checked further).
+insertionPattern = re.compile(r"^[^\t\n]*\t([0-9]+)\t([0-9]+)\t\*\t([^\t\n]*)", re.MULTILINE)
 
-# Checks each line for errors and auto acquire bases/strand designations where requested. 
-# Overwrites the original bed file if auto-acquiring occurred.
-def autoAcquireAndQACheck(bedInputFilePath: str, genomeFilePath, autoAcquiredFilePath):
 
-    print("Checking custom bed file for formatting and auto-acquire requests...")
+# Checks the given chunk of lines (text ending at the end of a line) for errors in bulk.  Lines are matched against
+# the valid entry pattern all at once, and the positions are compared column-wise.  Returns True if every line is valid.
+def chunkIsValid(chunk: str, lineCount, validEntryPattern):
 
-    # To start, assume that no sequences need to be acquired, and do it on the fly if need be.
-    autoAcquiring = False
-    autoAcquireFastaIterator = None
-    fastaEntry = None
-    cohortDesignationPresent = None
+    positions = validEntryPattern.findall(chunk)
+    if len(positions) != lineCount: return False
 
-    # Get the list of acceptable chromosomes
-    acceptableChromosomes = getAcceptableChromosomes(genomeFilePath)
+    if not all(map(operator.lt, map(int, map(operator.itemgetter(0), positions)),
+                                map(int, map(operator.itemgetter(1), positions)))): return False
+
+    # Insertions need to span exactly 2 bases and can't also be deletions.
+    if "\t*\t" in chunk:
+        for startPos, endPos, mutation in insertionPattern.findall(chunk):
+            if int(endPos) - int(startPos) != 2 or mutation == '*': return False
+
+    return True
+
+
+# Checks the given entries (lists of columns) one at a time with checkForErrors, returning a list of the errors found
+# (up to maxErrors), each prefixed with its line number.  firstLineNumber is the line number of the first entry.
+def getEntryErrors(entries, firstLineNumber, cohortDesignationPresent, acceptableChromosomes, maxErrors):
+
+    errors = list()
+    for i, choppedUpLine in enumerate(entries):
+        try: checkForErrors(choppedUpLine, cohortDesignationPresent, acceptableChromosomes)
+        except ValueError as error:
+            errors.append("Line " + str(firstLineNumber + i) + ": " + str(error))
+            if len(errors) == maxErrors: break
+    return errors
+
+
+# Raises a ValueError listing the given errors (if there are any) found in the given input.
+def raiseEntryErrors(errors, inputName, maxReportedErrors):
+
+    if len(errors) > 0:
+        raise ValueError("Invalid entries found in " + inputName + 
+                         (" (Checking stopped after the first " + str(maxReportedErrors) + ".)" 
+                          if len(errors) == maxReportedErrors else '') + ":\n" + '\n'.join(errors))
 
-    # Create a temporary file to write the data to (potentially after auto-acquiring).  
-    # Will replace original file at the end if auto-acquiring occurred.
-    temporaryBedFilePath = bedInputFilePath + ".tmp"
 
-    # Iterate through the input file one line at a time, checking the format of each entry and looking for auto-acquire requests.
+# Validates the entire custom bed file, reading it in large chunks which are checked in bulk.  Chunks containing
+# invalid lines are checked one line at a time with checkForErrors, and a ValueError is raised listing the line numbers
+# and errors of the first invalid lines found (up to maxReportedErrors).
+# Returns whether or not a cohort designation is present.
+def validateCustomBedFile(bedInputFilePath, acceptableChromosomes, maxReportedErrors = 10, chunkSize = 2**23):
+
+    errors = list()
+    linesChecked = 0
+
     with open(bedInputFilePath, 'r') as bedInputFile:
-        with open(temporaryBedFilePath, 'w')as temporaryBedFile:
-            for line in bedInputFile:
 
-                choppedUpLine = str(line).strip().split('\t')
+        # The first entry determines whether all entries should have a cohort designation.
+        cohortDesignationPresent = len(bedInputFile.readline().strip().split('\t')) == 7
+        bedInputFile.seek(0)
+        validEntryPattern = getValidEntryPattern(cohortDesignationPresent, acceptableChromosomes)
+
+        while len(errors) < maxReportedErrors:
+
+            # Read the next chunk, completing its last line.
+            chunk = bedInputFile.read(chunkSize)
+            if not chunk: break
+            if not chunk.endswith('\n'): chunk += bedInputFile.readline()
+            lineCount = chunk.count('\n') + (0 if chunk.endswith('\n') else 1)
+
+            if not chunkIsValid(chunk, lineCount, validEntryPattern):
+                errors += getEntryErrors((line.strip().split('\t') for line in chunk.split('\n')[:lineCount]),
+                                         linesChecked + 1, cohortDesignationPresent, acceptableChromosomes,
+                                         maxReportedErrors - len(errors))
+
+            linesChecked += lineCount
+
+    raiseEntryErrors(errors, bedInputFilePath, maxReportedErrors)
+
+    return cohortDesignationPresent
+
+
+# Validates a batch of custom bed records (lists of columns, e.g. from a format specific parser) in bulk, the same way
+# as validateCustomBedFile validates each chunk.  Records are numbered as lines, starting after recordsChecked.
+def validateCustomBedRecords(records: List[List[str]], recordsChecked, cohortDesignationPresent, validEntryPattern,
+                             acceptableChromosomes, inputName, maxReportedErrors = 10):
+
+    if chunkIsValid('\n'.join(map('\t'.join, records)) + '\n', len(records), validEntryPattern): return
+    raiseEntryErrors(getEntryErrors(records, recordsChecked + 1, cohortDesignationPresent, acceptableChromosomes,
+                                    maxReportedErrors), inputName, maxReportedErrors)
+
+
+# Returns whether or not the given entry requests auto-acquiring of its base(s) or strand designation.
+# (The strand designation of an insertion cannot be determined.)
+def requiresAutoAcquire(choppedUpLine: List[str]):
+    return choppedUpLine[3] == '.' or (choppedUpLine[5] == '.' and choppedUpLine[3] != '*')
 
-                # If it isn't already, initialize the cohortDesignationPresent variable.
-                if cohortDesignationPresent is None: cohortDesignationPresent = len(choppedUpLine) == 7
 
-                # Check for possible error states.
-                checkForErrors(choppedUpLine, cohortDesignationPresent, acceptableChromosomes)
+# Fills in the base(s) and/or strand designation for the given entries (which have requested auto-acquiring) using the
+# given indexed genome.  Sequences for the whole batch are retrieved at once.
+def autoAcquire(entries: List[List[str]], indexedGenome: IndexedGenome):
 
-                # If this is the first entry requiring auto-acquiring, generate the required fasta file.
-                if not autoAcquiring and (choppedUpLine[3] == '.' or (choppedUpLine[5] == '.' and choppedUpLine[3] != '*')):
-                    print("Found line with auto-acquire requested.  Generating fasta...")
-                    autoAcquiring = True
-                    bedToFasta(bedInputFilePath, genomeFilePath, autoAcquiredFilePath)
-                    autoAcquiredFile = open(autoAcquiredFilePath, 'r')
-                    autoAcquireFastaIterator = FastaFileIterator(autoAcquiredFile)
-                    fastaEntry = autoAcquireFastaIterator.readEntry()
-                    print("Continuing...")
+    # Get the sequence on the given strand if the bases are requested, and on the plus strand to determine strand designations.
+    sequences = indexedGenome.fetchBatch([(choppedUpLine[0], choppedUpLine[1], choppedUpLine[2],
+                                           choppedUpLine[5] if choppedUpLine[5] != '.' else '+') for choppedUpLine in entries])
 
-                # Check for any base identities that need to be auto-acquired.
-                if choppedUpLine[3] == '.':
+    for choppedUpLine, sequence in zip(entries, sequences):
 
-                    # Find the equivalent fasta entry.
-                    while not equivalentEntries(fastaEntry, choppedUpLine):
-                        if autoAcquireFastaIterator.eof:
-                            raise ValueError("Reached end of fasta file without finding a match for: ",' '.join(choppedUpLine))
-                        fastaEntry = autoAcquireFastaIterator.readEntry()
+        # Set the base(s) if requested.
+        if choppedUpLine[3] == '.': choppedUpLine[3] = sequence
 
-                    # Set the sequence.
-                    choppedUpLine[3] = fastaEntry.sequence
+        # Determine which strand is represented if requested.
+        if choppedUpLine[5] == '.' and choppedUpLine[3] != '*':
+            if sequence == choppedUpLine[3]: choppedUpLine[5] = '+'
+            elif sequence == reverseCompliment(choppedUpLine[3]): choppedUpLine[5] = '-'
+            else: raise ValueError("The given sequence " + choppedUpLine[3] + " for location " + choppedUpLine[0] + ':' +
+                                   choppedUpLine[1] + '-' + choppedUpLine[2] + ' ' +
+                                   "does not match the corresponding sequence in the given genome, or its reverse compliment.")
 
-                # Check for any strand designations that need to be auto-acquired.
-                # Also, make sure this isn't an insertion, in which case the strand designation cannot be determined.
-                if choppedUpLine[5] == '.' and choppedUpLine[3] != '*':
 
-                    # Find the equivalent fasta entry.
-                    while not equivalentEntries(fastaEntry, choppedUpLine):
-                        if autoAcquireFastaIterator.eof:
-                            raise ValueError("Reached end of fasta file without finding a match for: ",' '.join(choppedUpLine))
-                        fastaEntry = autoAcquireFastaIterator.readEntry()
+# Iterates through the entries in a custom bed file, checking each one for errors and auto-acquiring bases/strand
+# designations where requested.  Each entry is returned as a list of its (tab separated) columns.
+# Entries are read in batches so that the sequences needed for auto-acquiring can be retrieved together, and each batch
+# is checked for errors in bulk as it is read.
+# If records are given (as lists of columns, e.g. from a format specific parser), they are used in place of the entries
+# in the bed file, which then only names the input in error messages.
+class CheckedCustomBedEntries:
 
-                    # Determine which strand is represented.
-                    if fastaEntry.sequence == choppedUpLine[3]: choppedUpLine[5] = '+'
-                    elif fastaEntry.sequence == reverseCompliment(choppedUpLine[3]): choppedUpLine[5] = '-'
-                    else: raise ValueError("The given sequence " + choppedUpLine[3] + " for location " + fastaEntry.sequenceName + ' ' +
-                                        "does not match the corresponding sequence in the given genome, or its reverse compliment.")
+    def __init__(self, bedInputFilePath, genomeFilePath, batchSize = 10000, records: Iterable[List[str]] = None,
+                 maxReportedErrors = 10):
 
-                # Write the current line to the temporary bed file.
-                temporaryBedFile.write('\t'.join(choppedUpLine) + '\n')
+        self.bedInputFilePath = bedInputFilePath
+        self.genomeFilePath = genomeFilePath
+        self.batchSize = batchSize
+        self.maxReportedErrors = maxReportedErrors
+        self.records = records
+
+        # To start, assume that no sequences need to be acquired, and do it on the fly if need be.
+        self.autoAcquiring = False
+
+        # Whether or not the entries have a cohort designation (determined by the first entry).
+        self.cohortDesignationPresent = None
+
+
+    # Yields the entries in batches, each of which has been checked for errors.
+    def getCheckedBatches(self):
+
+        acceptableChromosomes = getAcceptableChromosomes(self.genomeFilePath)
+
+        if self.records is None:
+
+            # Iterate through the input file one batch of lines at a time, checking each batch in bulk as it is read.
+            # (The same way as validateCustomBedFile checks each chunk, so that the file is only read once.)
+            with open(self.bedInputFilePath, 'r') as bedInputFile:
+                linesChecked = 0
+                while True:
+
+                    lines = list(itertools.islice(bedInputFile, self.batchSize))
+                    if len(lines) == 0: return
+                    entries = [line.strip().split('\t') for line in lines]
+
+                    if self.cohortDesignationPresent is None:
+                        self.cohortDesignationPresent = len(entries[0]) == 7
+                        validEntryPattern = getValidEntryPattern(self.cohortDesignationPresent, acceptableChromosomes)
+
+                    if not chunkIsValid(''.join(lines), len(lines), validEntryPattern):
+                        raiseEntryErrors(getEntryErrors(entries, linesChecked + 1, self.cohortDesignationPresent,
+                                                        acceptableChromosomes, self.maxReportedErrors),
+                                         self.bedInputFilePath, self.maxReportedErrors)
+                    linesChecked += len(lines)
+                    yield entries
+
+        else:
+
+            records = iter(self.records)
+            recordsChecked = 0
+            while True:
+
+                entries = list(itertools.islice(records, self.batchSize))
+                if len(entries) == 0: return
+
+                if self.cohortDesignationPresent is None:
+                    self.cohortDesignationPresent = len(entries[0]) == 7
+                    validEntryPattern = getValidEntryPattern(self.cohortDesignationPresent, acceptableChromosomes)
+
+                validateCustomBedRecords(entries, recordsChecked, self.cohortDesignationPresent, validEntryPattern,
+                                         acceptableChromosomes, self.bedInputFilePath, self.maxReportedErrors)
+                recordsChecked += len(entries)
+                yield entries
+
+
+    def __iter__(self):
+
+        with contextlib.ExitStack() as exitStack:
+
+            indexedGenome = None
+
+            # Look through each batch for auto-acquire requests.
+            for entries in self.getCheckedBatches():
+
+                autoAcquireEntries = [choppedUpLine for choppedUpLine in entries if requiresAutoAcquire(choppedUpLine)]
+                if len(autoAcquireEntries) > 0:
+
+                    # If these are the first entries requiring auto-acquiring, open the genome.
+                    if indexedGenome is None:
+                        print("Found line with auto-acquire requested.  Reading from the genome directly...")
+                        self.autoAcquiring = True
+                        indexedGenome = exitStack.enter_context(IndexedGenome(self.genomeFilePath))
+
+                    autoAcquire(autoAcquireEntries, indexedGenome)
+
+                yield from entries
+
+
+# Checks each line for errors and auto acquire bases/strand designations where requested. 
+# Overwrites the original bed file if auto-acquiring occurred.
+def autoAcquireAndQACheck(bedInputFilePath: str, genomeFilePath):
+
+    print("Checking custom bed file for formatting and auto-acquire requests...")
+
+    # Create a temporary file to write the data to (potentially after auto-acquiring).  
+    # Will replace original file at the end if auto-acquiring occurred.
+    temporaryBedFilePath = bedInputFilePath + ".tmp"
+
+    checkedEntries = CheckedCustomBedEntries(bedInputFilePath, genomeFilePath)
+    with open(temporaryBedFilePath, 'w')as temporaryBedFile:
+        for choppedUpLine in checkedEntries:
+            temporaryBedFile.write('\t'.join(choppedUpLine) + '\n')
 
     # If any lines were auto-acquired, replace the input bed file with the temporary bed file. (Which has auto-acquires)
-    if autoAcquiring:
+    if checkedEntries.autoAcquiring:
         print("Overwriting custom bed input with auto-acquired bases/strand designations.")
         os.replace(temporaryBedFilePath, bedInputFilePath)
     # Otherwise, just delete the temporary file.
     else: os.remove(temporaryBedFilePath)
-    
+
+
+# If the given entry is an SNP from a purine, flip it (in place) to the pyrimidine containing strand.
+def flipToPyrimidineStrand(choppedUpLine: List[str]):
+
+    if isPurine(choppedUpLine[3]) and choppedUpLine[4].upper() in ('A','C','G','T'):
+
+        choppedUpLine[3] = reverseCompliment(choppedUpLine[3])
+        choppedUpLine[4] = reverseCompliment(choppedUpLine[4])
+        if choppedUpLine[5] == '+': choppedUpLine[5] = '-'
+        elif choppedUpLine[5] == '-': choppedUpLine[5] = '+'
+
+
+# Passes the given entry on to the write manager.
+def writeEntry(choppedUpLine: List[str], writeManager: WriteManager):
+
+    if len(choppedUpLine) == 7:
+        writeManager.writeData(choppedUpLine[0], choppedUpLine[1], choppedUpLine[2],
+                               choppedUpLine[3], choppedUpLine[4], choppedUpLine[5],
+                               choppedUpLine[6])
+    else:
+        writeManager.writeData(choppedUpLine[0], choppedUpLine[1], choppedUpLine[2],
+                               choppedUpLine[3], choppedUpLine[4], choppedUpLine[5])
+
 
 # Converts the custom bed input into the singlenuc context format acceptable for analysis further down the pipeline.
+# Returns the number of entries converted.
 def convertToStandardInput(bedInputFilePath, writeManager: WriteManager):
 
     print("Converting custom bed file to standard bed input...")
+    entriesConverted = 0
 
     # Iterate through the input file one line at a time, converting each line to an acceptable format for the rest of the pipeline.
     with open(bedInputFilePath,'r') as bedInputFile:
@@ -180,21 +360,41 @@ def convertToStandardInput(bedInputFilePath, writeManager: WriteManager):
             choppedUpLine = str(line).strip().split('\t')
 
             # Is this an SNP from a purine?  If so, flip the strand to the pyrimidine containing strand.
-            if isPurine(choppedUpLine[3]) and choppedUpLine[4].upper() in ('A','C','G','T'):
-
-                choppedUpLine[3] = reverseCompliment(choppedUpLine[3])
-                choppedUpLine[4] = reverseCompliment(choppedUpLine[4])
-                if choppedUpLine[5] == '+': choppedUpLine[5] = '-'
-                elif choppedUpLine[5] == '-': choppedUpLine[5] = '+'
+            flipToPyrimidineStrand(choppedUpLine)
 
             # Call on the write manager to handle the rest!
-            if len(choppedUpLine) == 7:
-                writeManager.writeData(choppedUpLine[0], choppedUpLine[1], choppedUpLine[2],
-                                       choppedUpLine[3], choppedUpLine[4], choppedUpLine[5],
-                                       choppedUpLine[6])
-            else:
-                writeManager.writeData(choppedUpLine[0], choppedUpLine[1], choppedUpLine[2],
-                                       choppedUpLine[3], choppedUpLine[4], choppedUpLine[5])
+            writeEntry(choppedUpLine, writeManager)
+
+            entriesConverted += 1
+
+    return entriesConverted
+
+
+# Returns the arguments to pass to an MSIIdentifier for the given entry, or None if it shouldn't be used to identify MSI.
+def getMSIData(choppedUpLine: List[str]):
+
+    if choppedUpLine[4] == "OTHER" or choppedUpLine[6] == '.': return None
+
+    if choppedUpLine[3] == '*':
+        mutType = "INS"
+    elif choppedUpLine[4] == '*':
+        mutType = "DEL"
+    else: mutType = "SNP"
+
+    return (choppedUpLine[0], str(int(choppedUpLine[1]) + 1), choppedUpLine[2], mutType, choppedUpLine[6])
+
+
+# Returns the arguments to pass to a MutSigIdentifier for the given entry,
+# or None if it shouldn't be used to identify mutation signatures.
+def getMutSigData(choppedUpLine: List[str]):
+
+    # Only use SNP's.  Skip this entry if it does not represent an SNP.
+    if choppedUpLine[3] not in ('A','C','G','T') or choppedUpLine[4] not in ('A','C','G','T'): return None
+
+    # Skip any entries that are independent of cohorts.
+    if choppedUpLine[6] == '.': return None
+
+    return (choppedUpLine[6], choppedUpLine[0], choppedUpLine[2], choppedUpLine[3], choppedUpLine[4])
 
 
 # Set up the WriteManager to stratify by microsatellite stability by identifiying MSI cohorts.
@@ -206,24 +406,10 @@ def setUpForMSStratification(writeManager: WriteManager, bedInputFilePath):
     with writeManager.setUpForMSStratification() as myMSIIdentifier:
         with open(bedInputFilePath, 'r') as bedInputFile:
 
-            mutType = None # Either SNP, INS, or DEL
-
             for line in bedInputFile:
 
-                choppedUpLine: List[str] = line.strip().split('\t')
-
-                if choppedUpLine[4] != "OTHER" and choppedUpLine[6] != '.':
-
-                    if choppedUpLine[3] == '*':
-                        mutType = "INS"
-                    elif choppedUpLine[4] == '*':
-                        mutType = "DEL"
-                    else: mutType = "SNP"
-
-                else: continue
-                
-                myMSIIdentifier.addData(choppedUpLine[0], str(int(choppedUpLine[1]) + 1), choppedUpLine[2],
-                                        mutType, choppedUpLine[6])
+                MSIData = getMSIData(line.strip().split('\t'))
+                if MSIData is not None: myMSIIdentifier.addData(*MSIData)
 
         myMSIIdentifier.identifyMSICohorts()
 
@@ -239,23 +425,74 @@ def setUpForMutSigStratification(writeManager: WriteManager, bedInputFilePath):
 
             for line in bedInputFile:
 
-                choppedUpLine: List[str] = line.strip().split('\t')
+                mutSigData = getMutSigData(line.strip().split('\t'))
+                if mutSigData is not None: mutSigIdentifier.addData(*mutSigData)
+
+        mutSigIdentifier.identifyMutSigs()
 
-                # Only use SNP's.  Skip this entry if it does not represent an SNP.
-                if choppedUpLine[3] not in ('A','C','G','T') or choppedUpLine[4] not in ('A','C','G','T'): continue
 
-                # Skip any entries that are independent of cohorts.
-                if choppedUpLine[6] == '.': continue
+# Checks, auto-acquires, and converts the given custom bed file while passing its data to the MSI and mutation signature
+# identifiers in a single pass, instead of one pass for each step.  The input file is not sorted or overwritten.
+# If stratifying by microsatellite stability or mutation signature, the data for cohort stratification is staged by the
+# write manager and sorted once, after the identifiers have finished.
+# If records are given, they are converted in place of the entries in the bed file (see CheckedCustomBedEntries).
+# Returns the number of entries converted.
+def parseCustomBedSinglePass(bedInputFilePath, genomeFilePath, writeManager: WriteManager,
+                             stratifyByMS, stratifyByMutSig, separateIndividualCohorts, records = None):
 
-                mutSigIdentifier.addData(choppedUpLine[6], choppedUpLine[0], choppedUpLine[2], 
-                                         choppedUpLine[3], choppedUpLine[4])
+    print("Checking and converting custom bed file in a single pass...")
+    entriesConverted = 0
 
-        mutSigIdentifier.identifyMutSigs()
+    with contextlib.ExitStack() as identifiers:
+
+        # Prepare any requested cohort stratification.  (Cohort designations are checked for on the fly.)
+        MSIIdentifier = identifiers.enter_context(writeManager.setUpForMSStratification()) if stratifyByMS else None
+        mutSigIdentifier = identifiers.enter_context(writeManager.setUpForMutSigStratification()) if stratifyByMutSig else None
+        if separateIndividualCohorts: writeManager.setUpForIndividualCohorts()
+        if stratifyByMS or stratifyByMutSig: writeManager.stageCohortData()
+
+        checkedEntries = CheckedCustomBedEntries(bedInputFilePath, genomeFilePath, records = records)
+        for choppedUpLine in checkedEntries:
+
+            if not checkedEntries.cohortDesignationPresent and entriesConverted == 0:
+                if stratifyByMS or stratifyByMutSig: 
+                    raise ValueError("Additional stratification given, but no cohort designation given.")
+                elif separateIndividualCohorts:
+                    raise ValueError("Separation by individual cohorts requested, but no cohort designation given.")
+
+            # Pass the entry to the identifiers (before the strand is flipped).
+            if MSIIdentifier is not None:
+                MSIData = getMSIData(choppedUpLine)
+                if MSIData is not None: MSIIdentifier.addData(*MSIData)
+            if mutSigIdentifier is not None:
+                mutSigData = getMutSigData(choppedUpLine)
+                if mutSigData is not None: mutSigIdentifier.addData(*mutSigData)
+
+            flipToPyrimidineStrand(choppedUpLine)
+            writeEntry(choppedUpLine, writeManager)
+            entriesConverted += 1
+
+        if checkedEntries.autoAcquiring: print("Auto-acquired bases/strand designations were used without overwriting the input.")
+
+        if MSIIdentifier is not None:
+            print("Running MSIseq...")
+            MSIIdentifier.identifyMSICohorts()
+        if mutSigIdentifier is not None:
+            print("Running deconstructSigs...")
+            mutSigIdentifier.identifyMutSigs()
+
+    # Now that the cohorts' designations are known, write the data for cohort stratification.
+    if stratifyByMS or stratifyByMutSig:
+        print("Writing cohort stratified data...")
+        writeManager.writeStagedCohortData()
+
+    return entriesConverted
 
 
 # Handles the scripts main functionality.
+# If singlePass is true, each file is checked and converted with parseCustomBedSinglePass.
 def parseCustomBed(bedInputFilePaths, genomeFilePath, nucPosFilePath, stratifyByMS, 
-                   stratifyByMutSig, separateIndividualCohorts):
+                   stratifyByMutSig, separateIndividualCohorts, singlePass = False):
 
     for bedInputFilePath in bedInputFilePaths:
 
@@ -272,26 +509,27 @@ def parseCustomBed(bedInputFilePaths, genomeFilePath, nucPosFilePath, stratifyBy
                              os.path.basename(bedInputFilePath), InputFormat.customBed,  os.path.dirname(bedInputFilePath))
 
         metadata = Metadata(dataDirectory)
-        intermediateFilesDir = os.path.join(dataDirectory,"intermediate_files")
-        checkDirs(intermediateFilesDir)
-        autoAcquiredFilePath = os.path.join(intermediateFilesDir,"auto_acquire.fa")
 
-        autoAcquireAndQACheck(bedInputFilePath, genomeFilePath, autoAcquiredFilePath)
+        if singlePass:
+            with measureStage("parseCustomBed", bedInputFilePath) as stageMetrics, WriteManager(dataDirectory) as writeManager:
+                stageMetrics.records = parseCustomBedSinglePass(bedInputFilePath, genomeFilePath,
+                                                                writeManager, stratifyByMS, stratifyByMutSig,
+                                                                separateIndividualCohorts)
+            continue
 
-        # Create an instance of the WriteManager to handle writing.
-        with WriteManager(dataDirectory) as writeManager:
+        with measureStage("autoAcquireAndQACheck", bedInputFilePath):
+            autoAcquireAndQACheck(bedInputFilePath, genomeFilePath)
+
+        # Create an instance of the WriteManager to handle writing.  (The measurements include the sorting done when it closes.)
+        with measureStage("parseCustomBed", bedInputFilePath) as stageMetrics, WriteManager(dataDirectory) as writeManager:
 
             # Check to see if cohort designations are present to see if preparations need to be made.
-            optionalArgument = tuple()
             with open(bedInputFilePath, 'r') as bedInputFile:
                 line = bedInputFile.readline()
 
                 # Is the cohort designation present?
                 if len(line.strip().split('\t')) == 7: 
 
-                    # Include in sort function
-                    optionalArgument = ("-k7,7",)
-
                     # Prepare the write manager for individual cohorts if desired.
                     if separateIndividualCohorts: writeManager.setUpForIndividualCohorts()
 
@@ -300,10 +538,6 @@ def parseCustomBed(bedInputFilePaths, genomeFilePath, nucPosFilePath, stratifyBy
                 elif separateIndividualCohorts:
                     raise ValueError("Separation by individual cohorts requested, but no cohort designation given.")
 
-            # Sort the input data (should also ensure that the output data is sorted)
-            subprocess.run(" ".join(("sort",) + optionalArgument + 
-                                    ("-k1,1","-k2,2n",bedInputFilePath,"-o",bedInputFilePath)), shell = True, check = True)
-
             # If requested, also prepare for stratification by microsatellite stability.
             if stratifyByMS:             
                 setUpForMSStratification(writeManager, bedInputFilePath)
@@ -314,7 +548,19 @@ def parseCustomBed(bedInputFilePaths, genomeFilePath, nucPosFilePath, stratifyBy
                 inputQAChecked = True
 
             # Go, go, go!
-            convertToStandardInput(bedInputFilePath, writeManager)
+            stageMetrics.records = convertToStandardInput(bedInputFilePath, writeManager)
+
+
+# Converts the given stream of custom bed records (lists of the columns described above, as yielded by a format specific
+# parser) to standard input for the data group containing the given input file, in a single pass and without writing
+# them to an intermediate custom bed file.  Metadata for the data group should already have been generated.
+def parseCustomBedRecords(records: Iterable[List[str]], inputFilePath, genomeFilePath, stratifyByMS,
+                          stratifyByMutSig, separateIndividualCohorts):
+
+    dataDirectory = os.path.dirname(inputFilePath)
+    with measureStage("parseCustomBed", inputFilePath) as stageMetrics, WriteManager(dataDirectory) as writeManager:
+        stageMetrics.records = parseCustomBedSinglePass(inputFilePath, genomeFilePath, writeManager, stratifyByMS,
+                                                        stratifyByMutSig, separateIndividualCohorts, records)
 
 
 # Given a namespace resulting from an argparser object (constructed in nucperiodpy.Main),
@@ -322,7 +568,7 @@ def parseCustomBed(bedInputFilePaths, genomeFilePath, nucPosFilePath, stratifyBy
 def parseArgs(args):
     
     # If only the subcommand was given, run the UI.
-    if len(sys.argv) == 2: 
+    if not args.subcommandArgumentsGiven: 
         main(); return
 
     # Otherwise, check to make sure valid arguments were passed:
@@ -340,12 +586,13 @@ def parseArgs(args):
 
     # Run the parser.
     parseCustomBed(finalCustomBedPaths, args.genome_file, args.nuc_pos_file, args.stratify_by_Microsatellite, 
-                   args.stratify_by_Mut_Sigs, args.stratify_by_cohorts)
+                   args.stratify_by_Mut_Sigs, args.stratify_by_cohorts, args.single_pass)
 
 
 def main():
 
     #Create the Tkinter UI
+    from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog, Selections
     dialog = TkinterDialog(workingDirectory=getDataDirectory())
     dialog.createMultipleFileSelector("Custom bed Input Files:",0,"custom_input.bed",("bed files",".bed"))
     dialog.createFileSelector("Genome Fasta File:",1,("Fasta Files",".fa"))
@@ -1,15 +1,17 @@
 # This script reads one or more "simple somatic mutation" data file(s) from ICGC and 
 # writes information on single base substitution mutations to a new bed file or files for further analysis.
 
-import os, gzip, subprocess, sys
-from typing import IO, List
+import os, gzip, queue, threading
+from typing import Iterable, List
 
-from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog, Selections
 from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import (DataTypeStr, generateFilePath, getDataDirectory, checkDirs,
                                                                   generateMetadata, getIsolatedParentDir, getFilesInDirectory, 
                                                                   InputFormat, getAcceptableChromosomes)
 from nucperiodpy.helper_scripts.UsefulBioinformaticsFunctions import reverseCompliment, isPurine
-from nucperiodpy.input_parsing.ParseCustomBed import parseCustomBed
+from nucperiodpy.helper_scripts.Instrumentation import measureStage
+from nucperiodpy.helper_scripts.TaskScheduler import TaskScheduler
+from nucperiodpy.helper_scripts.IndexedGenome import getFastaIndex
+from nucperiodpy.input_parsing.ParseCustomBed import parseCustomBed, parseCustomBedRecords
 
 
 # This class represents the mutation data obtained from ICGC in a more precise form.
@@ -36,16 +38,71 @@ class ICGCMutation:
                              "Found " + str(choppedUpLine[11]) + " instead.")
 
 
-# This class takes an ICGCFile object and, when iterated over, returns exactly once each mutation present in a donor that is
-# the result of whole genome sequencing using GRCh37 as the reference genome.
+# Decompresses a gzipped file in a background thread, so that decompression overlaps with parsing.
+# When iterated over, returns each line in the file (as bytes).  Decompressed chunks are passed through a bounded queue
+# so that the background thread can't get too far ahead.
+class BackgroundDecompressor:
+
+    def __init__(self, gzipFilePath, chunkSize = 2**22, maxQueuedChunks = 8):
+
+        self.gzipFilePath = gzipFilePath
+        self.chunkSize = chunkSize
+        self.decompressedChunks = queue.Queue(maxQueuedChunks)
+        self.stopped = False
+
+        self.decompressorThread = threading.Thread(target = self.decompress, daemon = True)
+        self.decompressorThread.start()
+
+
+    # Create the necessary functions to use the class with the "with" keyword.
+    def __enter__(self): return self
+
+    def __exit__(self, type, value, tb): self.close()
+
+
+    # Run in the background thread.  Reads the file in chunks of complete lines and passes them to the queue, followed by
+    # None at the end of the file.  Any exception is passed along instead so that it can be raised in the main thread.
+    def decompress(self):
+
+        try:
+            with gzip.open(self.gzipFilePath, 'rb') as gzipFile:
+                while not self.stopped:
+                    chunk = gzipFile.read(self.chunkSize)
+                    if not chunk: break
+                    chunk += gzipFile.readline() # Complete the last line.
+                    self.decompressedChunks.put(chunk)
+            self.decompressedChunks.put(None)
+        except Exception as error: self.decompressedChunks.put(error)
+
+
+    def __iter__(self):
+
+        while True:
+            chunk = self.decompressedChunks.get()
+            if chunk is None: return
+            if isinstance(chunk, Exception): raise chunk
+            yield from chunk.splitlines(True)
+
+
+    # Stops the background thread early (e.g. if iteration was abandoned).
+    def close(self):
+
+        self.stopped = True
+        while self.decompressorThread.is_alive():
+            try: self.decompressedChunks.get(timeout = 0.1)
+            except queue.Empty: pass
+
+
+# This class takes an ICGCFile object (or any iterable of its lines as bytes) and, when iterated over, returns exactly
+# once each mutation present in a donor that is the result of whole genome sequencing using GRCh37 as the reference genome.
 # The mutation is returned as an ICGCMutation object.
 class ICGCIterator:
 
-    def __init__(self, ICGCFile: IO, genomeFilePath):
+    def __init__(self, ICGCFile: Iterable[bytes], genomeFilePath):
         
-        self.ICGCFile = ICGCFile # The file containing the ICGC data
-        self.acceptableChromosomes = getAcceptableChromosomes(genomeFilePath)
-        self.finishedDonors = list() # A list of donors to make sure we don't encounter one more than once.
+        self.ICGCLines = iter(ICGCFile) # The lines of the file containing the ICGC data
+        self.acceptableChromosomes = set(getAcceptableChromosomes(genomeFilePath))
+        self.finishedDonors = set() # A set of donors to make sure we don't encounter one more than once.
         self.currentDonor = '' # The donorID currently being read for mutation data.
         self.currentDonorMutations = dict() # A dictionary of mutations unique to the current donor, to avoid writing duplicate mutations.
         self.previousDonorMutations: List[ICGCMutation] = list() # A list that keeps the last donor's mutations in order to write data on individual donors all at once.
@@ -59,7 +116,12 @@ class ICGCIterator:
         while(True):
 
             # Read in the next line in the file.
-            line = self.ICGCFile.readline()
+            line = next(self.ICGCLines, b'')
+            if not line: raise StopIteration # Check to see if we have reached the end of the file.
+
+            # Quickly skip lines which can't pass the filters below without decoding or splitting them.
+            if not (b"\tGRCh37\t" in line and b"\tWGS" in line): continue
+
             # Split the line into its individual data components.  The relevant components (with indices) are:
             #   0: mutation ID
             #   1: donor ID
@@ -72,17 +134,18 @@ class ICGCIterator:
             #   11: strand
             #   12: reference genome version
             #   33: sequencing method
-            choppedUpLine = str(line,"utf-8").strip().split('\t')
+            # (Components after the sequencing method are not needed and are left unsplit.)
+            choppedUpLine = str(line,"utf-8").split('\t', 34)
             if len(choppedUpLine) < 34: raise StopIteration # Check to see if we have reached the end of the file.
 
 
             if (choppedUpLine[12] == "GRCh37" and # Is the reference genome hg19?
-                choppedUpLine[33] == "WGS" and # Was whole genome sequencing used to generate the data?
+                choppedUpLine[33].strip() == "WGS" and # Was whole genome sequencing used to generate the data?
                 ("chr" + choppedUpLine[8]) in self.acceptableChromosomes): # Is the chromosome acceptable?
 
                 # Is this a new donor?
                 if choppedUpLine[1] != self.currentDonor:
-                    self.finishedDonors.append(self.currentDonor)
+                    self.finishedDonors.add(self.currentDonor)
                     self.currentDonor = choppedUpLine[1]
                     self.previousDonorMutations = list(self.currentDonorMutations.values())
                     self.currentDonorMutations.clear()
@@ -97,65 +160,145 @@ class ICGCIterator:
                     return newMutation
 
 
-# Handles the basic parsing of the script.
-def parseICGC(ICGCFilePaths, genomeFilePath, nucPosFilePath, separateDonors, 
-              stratifyByMS, stratifyByMutSig):
+# Yields each mutation from the given ICGC file (see ICGCIterator) as a list of custom bed columns.
+def getICGCRecords(ICGCFilePath, genomeFilePath):
 
-    outputBedFilePaths = list()
+    with BackgroundDecompressor(ICGCFilePath) as ICGCFile:
+        for mutation in ICGCIterator(ICGCFile, genomeFilePath):
 
-    # Run the parser for each ICGC file given.
-    for ICGCFilePath in ICGCFilePaths:
+            # Change the formatting if a deletion or insertion is given.              
+            if mutation.mutatedFrom == '-': 
+                mutation.mutatedFrom = '*'
+                # NOTE: We are making the assumption that the given base pos (1-based) is after the insertion, not before.
+                mutation.startPos = str(int(mutation.startPos) - 1) 
+
+            elif mutation.mutatedTo == '-': 
+                mutation.mutatedTo = '*'
+
+            yield [mutation.chromosome, mutation.startPos, mutation.endPos, mutation.mutatedFrom,
+                   mutation.mutatedTo, mutation.strand, mutation.donorID]
 
-        print("\nWorking in:",os.path.split(ICGCFilePath)[1])
 
-        if not str(ICGCFilePath).endswith(".gz"):
-            raise ValueError("Error:  Expected ICGC file to be gzipped (.gz file format).")
-        if not "simple_somatic_mutation" in os.path.split(ICGCFilePath)[1]:
-            raise ValueError("Error:  Expected ICGC file with \"simple_somatic_mutation\" in the name.\n" +
-                            "Note: if a directory was specified to search for ICGC input files, all files ending in .tsv.gz\
-                            are selected.")
+# Checks that the given ICGC file looks like one, and generates metadata for its data group.
+# Returns the path to the data group's intermediate_files directory.
+def setUpICGCDataGroup(ICGCFilePath, genomeFilePath, nucPosFilePath):
 
-        # Get some important file system paths for the rest of the function and generate metadata.
-        dataDirectory = os.path.dirname(ICGCFilePath)
-        intermediateFilesDir = os.path.join(dataDirectory,"intermediate_files")
-        checkDirs(intermediateFilesDir)
+    print("\nWorking in:",os.path.split(ICGCFilePath)[1])
 
-        generateMetadata(getIsolatedParentDir(ICGCFilePath), getIsolatedParentDir(genomeFilePath), getIsolatedParentDir(nucPosFilePath), 
-                         os.path.basename(ICGCFilePath), InputFormat.ICGC, os.path.dirname(ICGCFilePath))
+    if not str(ICGCFilePath).endswith(".gz"):
+        raise ValueError("Error:  Expected ICGC file to be gzipped (.gz file format).")
+    if not "simple_somatic_mutation" in os.path.split(ICGCFilePath)[1]:
+        raise ValueError("Error:  Expected ICGC file with \"simple_somatic_mutation\" in the name.\n" +
+                        "Note: if a directory was specified to search for ICGC input files, all files ending in .tsv.gz\
+                        are selected.")
 
-        # Generate the output file.
-        outputBedFilePath = generateFilePath(directory = intermediateFilesDir, dataGroup = getIsolatedParentDir(ICGCFilePath),
-                                             dataType = DataTypeStr.customInput, fileExtension = ".bed")
+    # Get some important file system paths for the rest of the function and generate metadata.
+    dataDirectory = os.path.dirname(ICGCFilePath)
+    intermediateFilesDir = os.path.join(dataDirectory,"intermediate_files")
+    checkDirs(intermediateFilesDir)
 
-        # Write the relevant information from the ICGC file to the output file.
-        print("Writing data to custom bed format.")
-        with gzip.open(ICGCFilePath, 'r') as ICGCFile:
-            with open(outputBedFilePath, 'w') as outputBedFile:
-                for mutation in ICGCIterator(ICGCFile, genomeFilePath):
+    generateMetadata(getIsolatedParentDir(ICGCFilePath), getIsolatedParentDir(genomeFilePath), getIsolatedParentDir(nucPosFilePath), 
+                     os.path.basename(ICGCFilePath), InputFormat.ICGC, os.path.dirname(ICGCFilePath))
 
-                    # Change the formatting if a deletion or insertion is given.              
-                    if mutation.mutatedFrom == '-': 
-                        mutation.mutatedFrom = '*'
-                        # NOTE: We are making the assumption that the given base pos (1-based) is after the insertion, not before.
-                        mutation.startPos = str(int(mutation.startPos) - 1) 
+    return intermediateFilesDir
+
+
+# Converts the given ICGC file to a custom bed file in its data group's intermediate_files directory.
+# Returns the path to the new custom bed file.
+def convertICGCFile(ICGCFilePath, genomeFilePath, nucPosFilePath):
+
+    intermediateFilesDir = setUpICGCDataGroup(ICGCFilePath, genomeFilePath, nucPosFilePath)
+
+    # Generate the output file.
+    outputBedFilePath = generateFilePath(directory = intermediateFilesDir, dataGroup = getIsolatedParentDir(ICGCFilePath),
+                                         dataType = DataTypeStr.customInput, fileExtension = ".bed")
+
+    # Write the relevant information from the ICGC file to the output file.
+    print("Writing data to custom bed format.")
+    with measureStage("parseICGC", ICGCFilePath) as stageMetrics, open(outputBedFilePath, 'w') as outputBedFile:
+
+        stageMetrics.records = 0
+        for record in getICGCRecords(ICGCFilePath, genomeFilePath):
+            stageMetrics.records += 1
+            outputBedFile.write('\t'.join(record) + '\n')
+
+    return outputBedFilePath
+
+
+# Passes the mutations in the given ICGC file straight to the custom bed parser, without writing them to an
+# intermediate custom bed file.
+def streamICGCFile(ICGCFilePath, genomeFilePath, nucPosFilePath, separateDonors, stratifyByMS, stratifyByMutSig):
+
+    setUpICGCDataGroup(ICGCFilePath, genomeFilePath, nucPosFilePath)
+    print("Passing data directly to custom bed parser.")
+    parseCustomBedRecords(getICGCRecords(ICGCFilePath, genomeFilePath), ICGCFilePath, genomeFilePath,
+                          stratifyByMS, stratifyByMutSig, separateDonors)
+
+
+# Returns the path to the log file for parsing the given ICGC file on a worker process.
+def getParseLogFilePath(ICGCFilePath):
+
+    intermediateFilesDir = os.path.join(os.path.dirname(ICGCFilePath),"intermediate_files")
+    checkDirs(intermediateFilesDir)
+    return generateFilePath(directory = intermediateFilesDir, dataGroup = getIsolatedParentDir(ICGCFilePath),
+                            dataType = "parse_log", fileExtension = ".txt")
+
+
+# Handles the basic parsing of the script.
+# If jobs is greater than 1, each ICGC file is converted and passed to the custom bed parser on its own worker process,
+# with each file's output written to a log file in its intermediate_files directory.
+# If streamRecords is true, mutations are passed directly to the custom bed parser instead of through an intermediate
+# custom bed file.
+def parseICGC(ICGCFilePaths, genomeFilePath, nucPosFilePath, separateDonors, 
+              stratifyByMS, stratifyByMutSig, jobs = 1, streamRecords = False):
+
+    if jobs == 1:
+
+        if streamRecords:
+            for ICGCFilePath in ICGCFilePaths:
+                streamICGCFile(ICGCFilePath, genomeFilePath, nucPosFilePath, separateDonors, stratifyByMS, stratifyByMutSig)
+            return
+
+        # Run the parser for each ICGC file given.
+        outputBedFilePaths = [convertICGCFile(ICGCFilePath, genomeFilePath, nucPosFilePath) for ICGCFilePath in ICGCFilePaths]
+
+        # Pass the parsed bed files to the custom bed parser for even more parsing! (Hooray for modularization!)
+        print("\nPassing data to custom bed parser...")
+        parseCustomBed(outputBedFilePaths, genomeFilePath, nucPosFilePath, stratifyByMS, stratifyByMutSig, separateDonors)
+        return
+
+    # Create the files shared by every worker (the acceptable chromosomes and the genome's fasta index) up front,
+    # so that each worker reads the same files instead of generating them again.
+    getAcceptableChromosomes(genomeFilePath)
+    getFastaIndex(genomeFilePath)
+
+    scheduler = TaskScheduler(jobs)
+    for ICGCFilePath in ICGCFilePaths:
 
-                    elif mutation.mutatedTo == '-': 
-                        mutation.mutatedTo = '*'
+        ICGCFileName = os.path.basename(ICGCFilePath)
+        logFilePath = getParseLogFilePath(ICGCFilePath)
+        open(logFilePath, 'w').close()
+        print("Output for", ICGCFileName, "will be written to", logFilePath)
 
-                    outputBedFile.write('\t'.join((mutation.chromosome, mutation.startPos, mutation.endPos, mutation.mutatedFrom,
-                                                   mutation.mutatedTo, mutation.strand, mutation.donorID)) + '\n')
+        if streamRecords:
+            scheduler.addTask("Parsing " + ICGCFileName, streamICGCFile, ICGCFilePath, genomeFilePath, nucPosFilePath,
+                              separateDonors, stratifyByMS, stratifyByMutSig, logFilePath = logFilePath)
+            continue
 
-        outputBedFilePaths.append(outputBedFilePath)  
+        conversionTask = scheduler.addTask("Converting " + ICGCFileName, convertICGCFile,
+                                           ICGCFilePath, genomeFilePath, nucPosFilePath, logFilePath = logFilePath)
+        scheduler.addTask("Passing " + ICGCFileName + " to the custom bed parser", parseCustomBed,
+                          [conversionTask], genomeFilePath, nucPosFilePath, stratifyByMS, stratifyByMutSig, separateDonors,
+                          logFilePath = logFilePath)
 
-    # Pass the parsed bed files to the custom bed parser for even more parsing! (Hooray for modularization!)
-    print("\nPassing data to custom bed parser...")
-    parseCustomBed(outputBedFilePaths, genomeFilePath, nucPosFilePath, stratifyByMS, stratifyByMutSig, separateDonors)
+    print("\nParsing", len(ICGCFilePaths), "ICGC file(s) using", jobs, "job(s)...")
+    scheduler.run()
 
 
 def parseArgs(args):
     
     # If only the subcommand was given, run the UI.
-    if len(sys.argv) == 2: 
+    if not args.subcommandArgumentsGiven: 
         main(); return
 
     
@@ -174,12 +317,13 @@ def parseArgs(args):
 
     # Run the parser.
     parseICGC(finalICGCPaths, args.genome_file, args.nuc_pos_file, args.stratify_by_donors, 
-              args.stratify_by_Microsatellite, args.stratify_by_Mut_Sigs)
+              args.stratify_by_Microsatellite, args.stratify_by_Mut_Sigs, args.jobs, args.stream_records)
 
 
 def main():
 
     #Create the Tkinter UI
+    from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog, Selections
     dialog = TkinterDialog(workingDirectory=getDataDirectory())
     dialog.createMultipleFileSelector("ICGC Mutation Files:",0,".tsv.gz",("gzip files",".gz"))
     dialog.createFileSelector("Genome Fasta File:",1,("Fasta Files",".fa"))
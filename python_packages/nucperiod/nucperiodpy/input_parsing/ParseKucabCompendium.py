@@ -1,12 +1,13 @@
 # This script takes data from the Kucab et al. mutation compendium paper and converts it to
 # a trinucleotide context bed file.
 
-import os, subprocess
-from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog, Selections
+import os
 from nucperiodpy.helper_scripts.UsefulBioinformaticsFunctions import reverseCompliment, isPurine
-from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import (getIsolatedParentDir, generateFilePath, dataDirectory,
-                                                                  dataTypes, generateMetadata, getAcceptableChromosomes)
-                                                                  
+from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import (getIsolatedParentDir, generateFilePath, getDataDirectory,
+                                                                  DataTypeStr, generateMetadata, getAcceptableChromosomes)
+from nucperiodpy.helper_scripts.Instrumentation import measureStage
+from nucperiodpy.helper_scripts.ExternalSort import sortFile
+
 
 def parseKucabCompendium(kucabSubstitutionsFilePaths, genomeFilePath, nucPosFilePath, includeAllPAHs):
 
@@ -32,7 +33,7 @@ def parseKucabCompendium(kucabSubstitutionsFilePaths, genomeFilePath, nucPosFile
 
         # Generate the output file path and metadata
         outputTrinucBedFilePath = generateFilePath(directory = outputDirectory, dataGroup = dataGroupName,
-                                                   context = "trinuc", dataType = dataTypes.mutations, fileExtension = ".bed")
+                                                   context = "trinuc", dataType = DataTypeStr.mutations, fileExtension = ".bed")
         generateMetadata(dataGroupName, getIsolatedParentDir(genomeFilePath), getIsolatedParentDir(nucPosFilePath),
                          os.path.join("..",os.path.basename(kucabSubstitutionsFilePath)), outputDirectory)
 
@@ -51,9 +52,10 @@ def parseKucabCompendium(kucabSubstitutionsFilePaths, genomeFilePath, nucPosFile
         else: relevantDesignations = LungCancerSpecificDesignations
 
         print("Reading data and writing to trinuc bed file...")
-        with open(kucabSubstitutionsFilePath, 'r') as kucabSubstitutionsFile:
+        with measureStage("parseKucabCompendium", kucabSubstitutionsFilePath) as stageMetrics, open(kucabSubstitutionsFilePath, 'r') as kucabSubstitutionsFile:
             with open(outputTrinucBedFilePath, 'w') as outputTrinucBedFile:
 
+                stageMetrics.records = 0
                 firstLineFlag = True
                 for line in kucabSubstitutionsFile:
                     
@@ -62,6 +64,8 @@ def parseKucabCompendium(kucabSubstitutionsFilePaths, genomeFilePath, nucPosFile
                         firstLineFlag = False
                         continue
 
+                    stageMetrics.records += 1
+
                     # The lines are separated by tabs.  The relevant data have the following indices in a tab-separated list:
                     # 15: mutagen designation
                     # 4: Chromosome
@@ -104,14 +108,14 @@ def parseKucabCompendium(kucabSubstitutionsFilePaths, genomeFilePath, nucPosFile
 
         # Sort the output file.
         print("Sorting output file...")
-        subprocess.run(" ".join(("sort","-k1,1","-k2,2n",outputTrinucBedFilePath,"-o",outputTrinucBedFilePath)),
-                           shell = True, check = True)
+        sortFile(outputTrinucBedFilePath)
 
 
 if __name__ == "__main__":
 
     #Create the Tkinter UI
-    dialog = TkinterDialog(workingDirectory=dataDirectory)
+    from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog, Selections
+    dialog = TkinterDialog(workingDirectory=getDataDirectory())
     dialog.createMultipleFileSelector("Kucab Substitutions File Paths:",0,"final.txt",("text files",".txt")) #NOTE: Weird file ending?
     dialog.createFileSelector("Genome Fasta File:",1,("Fasta Files",".fa"))
     dialog.createFileSelector("Strongly Positioned Nucleosome File:",2,("Bed Files",".bed"))
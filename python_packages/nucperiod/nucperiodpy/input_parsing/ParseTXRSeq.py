@@ -2,11 +2,12 @@
 # file of estimated lesion locations.
 
 from typing import List
-import os, subprocess
-from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog, Selections
-from nucperiodpy.helper_scripts.UsefulBioinformaticsFunctions import bedToFasta, FastaFileIterator
-from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import (getIsolatedParentDir, generateFilePath, dataDirectory,
+import os, subprocess, itertools
+from nucperiodpy.helper_scripts.IndexedGenome import IndexedGenome
+from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import (getIsolatedParentDir, generateFilePath, getDataDirectory,
                                                                   DataTypeStr, generateMetadata, InputFormat, getAcceptableChromosomes)
+from nucperiodpy.helper_scripts.Instrumentation import measureStage
+from nucperiodpy.helper_scripts.ExternalSort import sortFile
 
 
 # Estimates (Most likely with perfect accuracy) the minimum adjusted counts value that is then assumed to represent one count.
@@ -38,7 +39,7 @@ def getMinAdjustedCountValue(tXRSeqBedGraphReadsFilePath):
 
 # Create a new reads file which filters out any reads with a length greater than 28 or less than 26.
 # Combine + and - reads into one file with a +/- column
-# Also, convert normalized counts to actual counts and swap out the counts column for duplicated entries with multiple counts.
+# Also, convert normalized counts to actual counts, which are written to the score column (instead of duplicating the entry).
 # The input format should be a bedGraph file.
 def trimBedGraphTXRSeqData(tXRSeqBedGraphReadsFilePathPair: List[str], trimmedReadsFilePath, minAdjustedCountValue, 
                            acceptableLengths, acceptableChromosomes, roundingErrorLeniency = 0.01):
@@ -62,7 +63,7 @@ def trimBedGraphTXRSeqData(tXRSeqBedGraphReadsFilePathPair: List[str], trimmedRe
                     readLength = int(choppedUpLine[2]) - int(choppedUpLine[1])
                     if readLength in acceptableLengths:
 
-                        # determine the actual counts for the current entry to enter it that many times in the output file.
+                        # determine the actual counts for the current entry.
                         counts = float(choppedUpLine[3]) / minAdjustedCountValue
 
                         # Make sure the conversion to actual counts produced a reasonably whole number.
@@ -70,14 +71,15 @@ def trimBedGraphTXRSeqData(tXRSeqBedGraphReadsFilePathPair: List[str], trimmedRe
                             raise ValueError(choppedUpLine[3] + " cannot be converted to actual counts as it is not evenly divisible by" +
                                              str(minAdjustedCountValue) + ". (Rounding error > " + str(roundingErrorLeniency) + ")")
                         
-                        # Write the data
+                        # Write the data, with the counts as the score.  (Entries with no counts are left out.)
                         # readID = choppedUpLine[0] + ':' + choppedUpLine[1] + '-' + choppedUpLine[2] + '(' + plusOrMinus + ')'
-                        for i in range(round(counts)):
-                            trimmedReadsFile.write('\t'.join((choppedUpLine[0],choppedUpLine[1],choppedUpLine[2],'NA','NA',plusOrMinus)) + '\n')
+                        if round(counts) > 0:
+                            trimmedReadsFile.write('\t'.join((choppedUpLine[0],choppedUpLine[1],choppedUpLine[2],'NA',
+                                                              str(round(counts)),plusOrMinus)) + '\n')
 
 
 # Create a new reads file which filters out any reads with a length greater than 28 or less than 26.
-# Also, replace the columns with the read ID and score with NA.
+# Also, replace the read ID with NA, and the score with a count of 1.
 # The input format should be a bed file.
 def trimBedTXRSeqData(tXRSeqBedReadsFilePath: str, trimmedReadsFilePath, acceptableLengths, acceptableChromosomes):
     
@@ -97,7 +99,7 @@ def trimBedTXRSeqData(tXRSeqBedReadsFilePath: str, trimmedReadsFilePath, accepta
                 if readLength in acceptableLengths:
                     
                     # Write the data
-                    trimmedReadsFile.write('\t'.join((choppedUpLine[0],choppedUpLine[1],choppedUpLine[2],'NA','NA',choppedUpLine[5])) + '\n')
+                    trimmedReadsFile.write('\t'.join((choppedUpLine[0],choppedUpLine[1],choppedUpLine[2],'NA','1',choppedUpLine[5])) + '\n')
 
 
 # Given a nucleotide sequence, do the conditions suggest a lesion is present?
@@ -119,32 +121,42 @@ def searchForLesion(sequence, expectedLocation, acceptableBases):
         else: return len(sequence) + expectedLocation
 
 
-# From a given fasta file of reads, find likely BPDE-dG lesions and write their
-# location to a bed file.
-def writeLesions(fastaReadsFilePath, lesionsBedFilePath, expectedLocationsByLength, acceptableBasesByLength):
+# From a given bed file of trimmed reads (with their counts as the score), find likely BPDE-dG lesions and write their
+# location to a bed file.  Each read's sequence is retrieved from the genome once (in batches), and each lesion found is
+# written once for every count of its read.  Reads which extend past the end of their chromosome are skipped.
+def writeLesions(trimmedReadsFilePath, genomeFilePath, lesionsBedFilePath, expectedLocationsByLength, acceptableBasesByLength,
+                 batchSize = 10000):
 
-    with open(fastaReadsFilePath, 'r') as fastaReadsFile:
+    with IndexedGenome(genomeFilePath) as indexedGenome, open(trimmedReadsFilePath, 'r') as trimmedReadsFile:
         with open(lesionsBedFilePath, 'w') as lesionsBedFile:
 
-            # Look for lesions in each fasta entry and write them to the bed file.
-            for fastaEntry in FastaFileIterator(fastaReadsFile):
-                for expectedLocation in expectedLocationsByLength[len(fastaEntry.sequence)]:
+            while True:
 
-                    lesionLocation = searchForLesion(fastaEntry.sequence, expectedLocation, acceptableBasesByLength[len(fastaEntry.sequence)])
+                reads = [line.strip().split('\t') for line in itertools.islice(trimmedReadsFile, batchSize)]
+                if len(reads) == 0: break
 
-                    if lesionLocation is not None:
-                        
-                        # IMPORTANT: If the sequence is on the minus strand, the location needs to be inverted with respect to the fragment
-                        # because reverse complement and stuff.
-                        if fastaEntry.strand == '-': lesionLocation = len(fastaEntry.sequence) - (lesionLocation + 1)
+                reads = [read for read in reads if indexedGenome.contains(read[0], read[1], read[2])]
+                sequences = indexedGenome.fetchBatch([(read[0], read[1], read[2], read[5]) for read in reads])
+
+                # Look for lesions in each read and write them to the bed file.
+                for read, sequence in zip(reads, sequences):
+                    for expectedLocation in expectedLocationsByLength[len(sequence)]:
+
+                        lesionLocation = searchForLesion(sequence, expectedLocation, acceptableBasesByLength[len(sequence)])
 
-                        bedEntry = '\t'.join((fastaEntry.sequenceLocation[0],
-                                                str(int(fastaEntry.sequenceLocation[1]) + lesionLocation),
-                                                str(int(fastaEntry.sequenceLocation[1]) + lesionLocation + 1),
-                                                fastaEntry.sequence[lesionLocation],
-                                                "OTHER",
-                                                fastaEntry.sequenceLocation[3])) + '\n'
-                        lesionsBedFile.write(bedEntry)
+                        if lesionLocation is not None:
+                            
+                            # IMPORTANT: If the sequence is on the minus strand, the location needs to be inverted with respect to the fragment
+                            # because reverse complement and stuff.
+                            if read[5] == '-': lesionLocation = len(sequence) - (lesionLocation + 1)
+
+                            bedEntry = '\t'.join((read[0],
+                                                  str(int(read[1]) + lesionLocation),
+                                                  str(int(read[1]) + lesionLocation + 1),
+                                                  sequence[lesionLocation],
+                                                  "OTHER",
+                                                  read[5])) + '\n'
+                            lesionsBedFile.write(bedEntry * int(read[4]))
 
 
 # Given a file path, looks for the complementary file path (with the opposite strand designation) and returns both as a tuple.
@@ -239,9 +251,8 @@ class TXRSeqInputDataPipeline:
                 self.bedGraphReadsFilePathPair.append(os.path.join(intermediateFilesDirectory,
                                                                    os.path.basename(bigWigReadsFilePath).rsplit('.',1)[0]+".bedGraph"))
 
-        # Generate the trimmed reads output, the fasta output, and bed output file paths.
+        # Generate the trimmed reads output and bed output file paths.
         self.trimmedReadsFilePath = os.path.join(intermediateFilesDirectory,dataGroupName+"_trimmed_reads.bed")
-        self.fastaReadsFilePath = os.path.join(intermediateFilesDirectory,dataGroupName+"_fasta_reads.fa")
         self.lesionsBedFilePath = generateFilePath(directory = localRootDirectory, dataGroup = dataGroupName,
                                                       context = "singlenuc", dataType = DataTypeStr.mutations, fileExtension = ".bed") 
 
@@ -281,16 +292,12 @@ class TXRSeqInputDataPipeline:
 
         if not self.readsHaveBeenTrimmed: raise ValueError("Trying to generate final output without trimmed reads.")
 
-        # Convert the trimmed file to fasta format to get the sequences associated with each read.
-        bedToFasta(self.trimmedReadsFilePath, self.genomeFilePath, self.fastaReadsFilePath)
-
-        # Find the lesions and write them to the final output file.
-        writeLesions(self.fastaReadsFilePath, self.lesionsBedFilePath, 
+        # Find the lesions (using the sequences associated with each read) and write them to the final output file.
+        writeLesions(self.trimmedReadsFilePath, self.genomeFilePath, self.lesionsBedFilePath, 
                      self.expectedLocationsByLength, self.acceptableBasesByLength)
 
         # Sort the output file.
-        subprocess.run(" ".join(("sort","-k1,1","-k2,2n", self.lesionsBedFilePath,"-o", self.lesionsBedFilePath)), 
-                       shell = True, check = True)    
+        sortFile(self.lesionsBedFilePath)
 
 
 def parseTXRSeq(inputDataFilePaths, callParamsFilePath, genomeFilePath, nucPosFilePath):
@@ -301,17 +308,20 @@ def parseTXRSeq(inputDataFilePaths, callParamsFilePath, genomeFilePath, nucPosFi
         print("\nWorking with:",os.path.basename(inputDataFilePath))
         tXRSeqInputDataPipeline = TXRSeqInputDataPipeline(inputDataFilePath, callParamsFilePath, genomeFilePath, nucPosFilePath)
 
-        print("Generating trimmed reads bed file...")
-        tXRSeqInputDataPipeline.generateTrimmedReads()
+        with measureStage("parseTXRSeq", inputDataFilePath):
+
+            print("Generating trimmed reads bed file...")
+            tXRSeqInputDataPipeline.generateTrimmedReads()
 
-        print("Locating and writing lesion locations to final output file...")
-        tXRSeqInputDataPipeline.generateLesionsBedOutputFile()
+            print("Locating and writing lesion locations to final output file...")
+            tXRSeqInputDataPipeline.generateLesionsBedOutputFile()
  
 
 if __name__ == "__main__":
 
     # Create the Tkinter UI
-    dialog = TkinterDialog(workingDirectory=dataDirectory)
+    from nucperiodpy.Tkinter_scripts.TkinterDialog import TkinterDialog, Selections
+    dialog = TkinterDialog(workingDirectory=getDataDirectory())
     dialog.createMultipleFileSelector("tXR-seq bigwig data (plus strand):",0,
                                       "+.bigWig",("BigWig Files",".bigWig"))
     dialog.createMultipleFileSelector("tXR-seq bed data (alternative to bigwig):",1,
@@ -3,14 +3,40 @@
 # This is done by taking the 2 bp lesion and splitting it into 2 single base lesions.
 
 import os
-from nucperiodpy.Tkinter_scripts.TkinterDialog import Selections, TkinterDialog
-from nucperiodpy.input_parsing.ParseCustomBed import parseCustomBed
+from nucperiodpy.input_parsing.ParseCustomBed import parseCustomBed, parseCustomBedRecords
 from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import (getIsolatedParentDir, generateFilePath, getDataDirectory,
                                                                   DataTypeStr, generateMetadata, InputFormat, checkDirs,
                                                                   getAcceptableChromosomes)
+from nucperiodpy.helper_scripts.Instrumentation import measureStage
 
 
-def parseUVDESeq(UVDESeqFilePaths, genomeFilePath, nucPosFilePath):
+# Yields two single base lesions (as lists of custom bed columns) for each 2 bp lesion in the given UVDE-seq file.
+# Lesions outside of the given acceptable chromosomes are skipped.
+def getUVDESeqRecords(UVDESeqFilePath, acceptableChromosomes):
+
+    with open(UVDESeqFilePath, 'r') as UVDESeqFile:
+        for line in UVDESeqFile:
+
+            choppedUpLine = line.strip().split("\t")
+
+            # Make sure the lesion is in a valid chromosome.  Otherwise, skip it.
+            if not choppedUpLine[0] in acceptableChromosomes: continue
+
+            # Extract the relevant data from the line.
+            chromosome = choppedUpLine[0]
+            startPos = int(choppedUpLine[1])
+            endPos = int(choppedUpLine[2]) - 1
+            plusOrMinus = choppedUpLine[5]
+
+            for i in range(2):
+
+                # Return the two single base lesions from the one 2 bp lesion.
+                yield [chromosome,str(startPos+i),str(endPos+i),".","OTHER",plusOrMinus]
+
+
+# If streamRecords is true, lesions are passed directly to the custom bed parser instead of through an intermediate
+# custom bed file.
+def parseUVDESeq(UVDESeqFilePaths, genomeFilePath, nucPosFilePath, streamRecords = False):
 
     customBedOutputFilePaths = list() # The list of file paths to be passed to the custom bed parser.
 
@@ -27,42 +53,38 @@ def parseUVDESeq(UVDESeqFilePaths, genomeFilePath, nucPosFilePath):
         checkDirs(intermediateFilesDir)
         dataGroupName = getIsolatedParentDir(UVDESeqFilePath)
 
-        # Generate the output file path and metadata
-        customBedOutputFilePath = generateFilePath(directory = intermediateFilesDir, dataGroup = dataGroupName,
-                                                   dataType = DataTypeStr.customInput, fileExtension = ".bed")
-        customBedOutputFilePaths.append(customBedOutputFilePath)
+        # Generate the metadata
         generateMetadata(dataGroupName, getIsolatedParentDir(genomeFilePath), getIsolatedParentDir(nucPosFilePath), 
                          os.path.basename(UVDESeqFilePath), InputFormat.UVDESeq, localRootDirectory)
 
         # Get the list of acceptable chromosomes.
         acceptableChromosomes = getAcceptableChromosomes(genomeFilePath)
 
+        if streamRecords:
+            print("Passing single base lesions directly to custom bed parser...")
+            parseCustomBedRecords(getUVDESeqRecords(UVDESeqFilePath, acceptableChromosomes), UVDESeqFilePath,
+                                  genomeFilePath, False, False, False)
+            continue
+
+        # Generate the output file path
+        customBedOutputFilePath = generateFilePath(directory = intermediateFilesDir, dataGroup = dataGroupName,
+                                                   dataType = DataTypeStr.customInput, fileExtension = ".bed")
+        customBedOutputFilePaths.append(customBedOutputFilePath)
+
         # Iterate through the 2 bp lesions, adding 2 single base lesions to the singlenuc output file for each.
         print("Converting 2-bp lesions to 2 single base lesions...")
-        with open(UVDESeqFilePath, 'r') as UVDESeqFile:
+        with measureStage("parseUVDESeq", UVDESeqFilePath) as stageMetrics:
             with open(customBedOutputFilePath, 'w') as customBedOutputFile:
 
-                for line in UVDESeqFile:
-                    
-                    choppedUpLine = line.strip().split("\t")
-
-                    # Make sure the lesion is in a valid chromosome.  Otherwise, skip it.
-                    if not choppedUpLine[0] in acceptableChromosomes: continue
-
-                    # Extract the relevant data from the line.
-                    chromosome = choppedUpLine[0]
-                    startPos = int(choppedUpLine[1])
-                    endPos = int(choppedUpLine[2]) - 1
-                    plusOrMinus = choppedUpLine[5]
-
-                    for i in range(2):
-
-                        # Write the two single base lesions from the one 2 bp lesion.
-                        customBedOutputFile.write('\t'.join((chromosome,str(startPos+i),str(endPos+i),".","OTHER",plusOrMinus)) + '\n')
+                stageMetrics.records = 0
+                for record in getUVDESeqRecords(UVDESeqFilePath, acceptableChromosomes):
+                    stageMetrics.records += 1
+                    customBedOutputFile.write('\t'.join(record) + '\n')
 
 
     # Pass the generated files to the custom bed parser.
-    parseCustomBed(customBedOutputFilePaths, genomeFilePath, nucPosFilePath, False, False, False)
+    if len(customBedOutputFilePaths) > 0:
+        parseCustomBed(customBedOutputFilePaths, genomeFilePath, nucPosFilePath, False, False, False)
 
 
 
@@ -70,6 +92,7 @@ def parseUVDESeq(UVDESeqFilePaths, genomeFilePath, nucPosFilePath):
 if __name__ == "__main__":
 
     # Create the Tkinter UI
+    from nucperiodpy.Tkinter_scripts.TkinterDialog import Selections, TkinterDialog
     dialog = TkinterDialog(workingDirectory=getDataDirectory())
     dialog.createMultipleFileSelector("UVDE-seq data:",0,"dipy.bed",("Bed Files",".bed"),additionalFileEndings=("TA.bed",))    
     dialog.createFileSelector("Genome Fasta File:",1,("Fasta Files",".fa"))
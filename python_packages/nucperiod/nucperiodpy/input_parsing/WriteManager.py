@@ -1,10 +1,13 @@
 # This script contains a class for managing the writing of input data to various stratified data files.
 # Once set up, it only needs to be passed data one line at a time.
 
-import os, subprocess
-from typing import IO
+import os
+from collections import OrderedDict
+from typing import Dict, List
 from nucperiodpy.helper_scripts.UsefulFileSystemFunctions import (Metadata, checkDirs, DataTypeStr, generateFilePath,
                                                                   generateMetadata, getIsolatedParentDir)
+from nucperiodpy.helper_scripts.ExternalSort import sortFile, cohortBedSortKey
+from nucperiodpy.helper_scripts.FanOutWriter import FanOutWriter, BufferedOutputFile
 from nucperiodpy.input_parsing.IdentifyMSI import MSIIdentifier
 from nucperiodpy.input_parsing.IdentifyMutSigs import MutSigIdentifier
 
@@ -17,10 +20,13 @@ class WriteManager:
         self.rootDataDir = rootDataDir
         self.rootMetadata = Metadata(self.rootDataDir)
 
+        # Output files are written through a fan-out writer, which buffers them and writes them in the background.
+        self.fanOutWriter = FanOutWriter()
+
         # create and open the output file in the same directory as the root data.
         self.rootOutputFilePath = generateFilePath(directory = self.rootDataDir, dataGroup = self.rootMetadata.dataGroupName,
                                                    context = "singlenuc", dataType = DataTypeStr.mutations, fileExtension = ".bed")
-        self.rootOutputFile = open(self.rootOutputFilePath, 'w')
+        self.rootOutputFile = self.fanOutWriter.open(self.rootOutputFilePath)
         self.rootMutCounts = 0
 
         # By default, all other write options are off unless otherwise specified.
@@ -29,6 +35,10 @@ class WriteManager:
         self.stratifyByMutSig = False
         self.stratifyBySignature = False
 
+        # Used to hold data for cohort stratification until it can all be written at once. (See stageCohortData)
+        self.cohortStagingFile: BufferedOutputFile = None
+        self.individualCohortsPresorted = False # Whether or not data arrives for each individual cohort in sorted order.
+
 
     # Create the necessary functions to use the class with the "with" keyword.
     def __enter__(self): return self
@@ -39,14 +49,22 @@ class WriteManager:
         self.cleanupAndSort()
 
 
-    # Prepares the manager to separate data by cohort.
-    def setUpForIndividualCohorts(self):
+    # Prepares the manager to separate data by cohort.  Data for each cohort does not need to be contiguous.  Each cohort's
+    # data is held in its own buffer until cohortBufferLines lines have built up (or maxBufferedCohortLines lines have
+    # built up across all cohorts, in which case every buffer is written), and only then written to the cohort's file.
+    # At most maxOpenCohortFiles are kept open at once. (The least recently used cohort file is closed to make room for another.)
+    def setUpForIndividualCohorts(self, maxOpenCohortFiles = 64, cohortBufferLines = 4096, maxBufferedCohortLines = 2**19):
 
         self.stratifyByIndividualCohorts = True
+        self.maxOpenCohortFiles = maxOpenCohortFiles
+        self.cohortBufferLines = cohortBufferLines
+        self.maxBufferedCohortLines = maxBufferedCohortLines
 
-        self.currentIndividualCohortID = None # The cohort being written to at a point in time.
-        self.currentIndividualCohortFile: IO = None # The open file for the current cohort.
-        self.completedIndividualCohorts = dict() # A hashtable of cohorts that have been seen before and should NOT be revisited/rewritten.        
+        self.openIndividualCohortFiles: Dict[str, BufferedOutputFile] = OrderedDict() # Open cohort files, least recently used first.
+        self.individualCohortFilePaths: Dict[str, str] = dict() # The file paths for every cohort seen so far.
+        self.individualCohortMutCounts: Dict[str, int] = dict()
+        self.individualCohortBuffers: Dict[str, List[str]] = dict() # The lines waiting to be written for each cohort.
+        self.bufferedCohortLines = 0
 
         # Create the directory.
         self.rootIndividualCohortsDirectory = os.path.join(self.rootMetadata.directory,"individual_cohorts")
@@ -76,10 +94,10 @@ class WriteManager:
 
         self.aggregateMSSFilePath = generateFilePath(directory = aggregateMSSDirectory, dataGroup = "MSS_" + self.rootMetadata.dataGroupName,
                                                      context = "singlenuc", dataType = DataTypeStr.mutations, fileExtension = ".bed")
-        self.aggregateMSSFile = open(self.aggregateMSSFilePath, 'w')
+        self.aggregateMSSFile = self.fanOutWriter.open(self.aggregateMSSFilePath)
         self.aggregateMSIFilePath = generateFilePath(directory = aggregateMSIDirectory, dataGroup = "MSI_" + self.rootMetadata.dataGroupName,
                                                      context = "singlenuc", dataType = DataTypeStr.mutations, fileExtension = ".bed")
-        self.aggregateMSIFile = open(self.aggregateMSIFilePath, 'w')
+        self.aggregateMSIFile = self.fanOutWriter.open(self.aggregateMSIFilePath)
 
         # Set up the MSIIdentifier to be returned.
         intermediateFilesDir = os.path.join(self.rootDataDir,"intermediate_files")
@@ -127,7 +145,7 @@ class WriteManager:
             # File path
             self.mutSigFilePaths[mutSig] = generateFilePath(directory = thisMutSigDirectory, dataGroup = thisMutSigDataGroup, 
                                                             context = "singlenuc", dataType = DataTypeStr.mutations, fileExtension = ".bed")
-            self.mutSigFiles[mutSig] = open(self.mutSigFilePaths[mutSig], 'w')
+            self.mutSigFiles[mutSig] = self.fanOutWriter.open(self.mutSigFilePaths[mutSig])
 
         # Set up the MutSigIdentifier object to be returned.
         intermediateFilesDir = os.path.join(self.rootDataDir,"intermediate_files")
@@ -142,48 +160,66 @@ class WriteManager:
         return(self.mutSigIdentifier)
 
 
-    # Open a new individual cohort file for writing (and close the last one, if applicable.)
-    def setUpNewIndividualCohort(self, cohortID):
+    # Returns the open file for the given individual cohort, reopening it (to append to it) if it was closed to make
+    # room for other cohorts.
+    def getIndividualCohortFile(self, cohortID) -> BufferedOutputFile:
+
+        # Is the file already open?  If so, mark it as the most recently used.
+        if cohortID in self.openIndividualCohortFiles:
+            self.openIndividualCohortFiles.move_to_end(cohortID)
+            return self.openIndividualCohortFiles[cohortID]
+
+        # Make room for another open file if necessary.  (Without waiting for the closed file's data to be written)
+        if len(self.openIndividualCohortFiles) >= self.maxOpenCohortFiles:
+            self.openIndividualCohortFiles.popitem(last = False)[1].close(waitForWrites = False)
+
+        individualCohortFile = self.fanOutWriter.open(self.individualCohortFilePaths[cohortID], 'a')
+        self.openIndividualCohortFiles[cohortID] = individualCohortFile
+        return individualCohortFile
+
+
+    # Writes the given individual cohort's buffered data to its file.
+    def flushIndividualCohortBuffer(self, cohortID):
 
-        # If this isn't the first opened cohort file, close and sort the last one.
-        if self.currentIndividualCohortFile is not None: 
-            self.currentIndividualCohortFile.close()
-            subprocess.run(" ".join(("sort","-k1,1","-k2,2n",self.individualCohortFilePath,"-o",self.individualCohortFilePath)), 
-                           shell = True, check = True)
-            Metadata(self.individualCohortFilePath).addMetadata(Metadata.AddableKeys.mutCounts, self.currentIndividualCohortMutCounts)
+        individualCohortBuffer = self.individualCohortBuffers[cohortID]
+        if len(individualCohortBuffer) == 0: return
 
-        # Make sure this is actually a new cohort.
-        if cohortID in self.completedIndividualCohorts:
-            raise ValueError("The cohort " + cohortID + " was encountered in more than one distinct block of data.")
-        else:
-            self.currentIndividualCohortID = cohortID
+        self.getIndividualCohortFile(cohortID).write(''.join(individualCohortBuffer))
+        self.bufferedCohortLines -= len(individualCohortBuffer)
+        individualCohortBuffer.clear()
 
-        individualCohortDirectory = os.path.join(self.rootIndividualCohortsDirectory,self.currentIndividualCohortID)
-        individualCohortDataGroup = self.currentIndividualCohortID + "_" + self.rootMetadata.dataGroupName
+
+    # Sets up the directory, metadata, and (empty) file for a new individual cohort.
+    def setUpNewIndividualCohort(self, cohortID):
+
+        individualCohortDirectory = os.path.join(self.rootIndividualCohortsDirectory,cohortID)
+        individualCohortDataGroup = cohortID + "_" + self.rootMetadata.dataGroupName
 
         checkDirs(individualCohortDirectory)
 
         # Determine which other set up "umbrella" cohorts this cohort belongs to.
-        cohortMembership = [self.currentIndividualCohortID,]
+        cohortMembership = [cohortID,]
         if self.stratifyByMS:
-            if self.currentIndividualCohortID in self.MSICohorts:
+            if cohortID in self.MSICohorts:
                 cohortMembership.append("MSI")
             else:
                 cohortMembership.append("MSS")
         if self.stratifyByMutSig:
-            if self.currentIndividualCohortID in self.mutSigDesignations:
-                for mutSig in self.mutSigDesignations[self.currentIndividualCohortID]:
+            if cohortID in self.mutSigDesignations:
+                for mutSig in self.mutSigDesignations[cohortID]:
                     cohortMembership.append("mut_sig_" + mutSig)
                 
 
-        # Generate the file path and metadata file and open the file for writing.
-        self.individualCohortFilePath = generateFilePath(directory = individualCohortDirectory, dataGroup = individualCohortDataGroup, 
-                                                         context = "singlenuc", dataType = DataTypeStr.mutations, fileExtension = ".bed")
-        self.currentIndividualCohortFile = open(self.individualCohortFilePath, 'w')
+        # Generate the file path and metadata file and create the file.  (Data is appended to it as the cohort's buffer fills.)
+        self.individualCohortFilePaths[cohortID] = generateFilePath(directory = individualCohortDirectory,
+                                                                    dataGroup = individualCohortDataGroup, context = "singlenuc",
+                                                                    dataType = DataTypeStr.mutations, fileExtension = ".bed")
         generateMetadata(individualCohortDataGroup, self.rootMetadata.genomeName, self.rootMetadata.nucPosName,
                          os.path.join("..",self.rootMetadata.localParentDataPath),
                          self.rootMetadata.inputFormat, individualCohortDirectory, *cohortMembership)
-        self.currentIndividualCohortMutCounts = 0
+        open(self.individualCohortFilePaths[cohortID], 'w').close()
+        self.individualCohortMutCounts[cohortID] = 0
+        self.individualCohortBuffers[cohortID] = list()
 
 
     # Writes the given data to all the relevant files based on how the manager was set up.
@@ -199,8 +235,19 @@ class WriteManager:
         self.rootOutputFile.write(outputLine)
         self.rootMutCounts += 1
 
+        if cohortID == '.': return
+
+        # Hold on to the data for cohort stratification if it is being staged.  Otherwise, write it now.
+        if self.cohortStagingFile is not None:
+            self.cohortStagingFile.write(outputLine[:-1] + '\t' + cohortID + '\n')
+        else: self.writeCohortData(outputLine, cohortID)
+
+
+    # Writes the given (formatted) output line to the files for any cohort stratification that was set up.
+    def writeCohortData(self, outputLine, cohortID):
+
         # Write to microsatellite designation if it was set up.
-        if self.stratifyByMS and cohortID != '.':
+        if self.stratifyByMS:
 
             # Make sure the MSICohorts hashtable has actually been propogated.
             if len(self.MSICohorts) == 0:
@@ -219,7 +266,7 @@ class WriteManager:
                 self.aggregateMSSMutCounts += 1
 
         # Write to signature designations if it was set up.
-        if self.stratifyByMutSig and cohortID != '.':
+        if self.stratifyByMutSig:
 
             # Propogate the mutSigDesignations dictionary if it hasn't been.
             if len(self.mutSigDesignations) == 0:
@@ -244,47 +291,80 @@ class WriteManager:
                     self.mutSigMutCounts[mutSig] += 1
 
 
-        # Write to individual cohorts if desired.
-        if self.stratifyByIndividualCohorts and cohortID != '.':
-            
-            # Check to see if we've reached a new cohortID .
-            if self.currentIndividualCohortID is None or self.currentIndividualCohortID != cohortID:
-                self.completedIndividualCohorts[self.currentIndividualCohortID] = None
-                self.setUpNewIndividualCohort(cohortID)
+        # Write to individual cohorts if desired, by way of the cohort's buffer.
+        if self.stratifyByIndividualCohorts:
+
+            if cohortID not in self.individualCohortBuffers: self.setUpNewIndividualCohort(cohortID)
+            individualCohortBuffer = self.individualCohortBuffers[cohortID]
+            individualCohortBuffer.append(outputLine)
+            self.individualCohortMutCounts[cohortID] += 1
+            self.bufferedCohortLines += 1
+
+            if len(individualCohortBuffer) >= self.cohortBufferLines: self.flushIndividualCohortBuffer(cohortID)
+            elif self.bufferedCohortLines >= self.maxBufferedCohortLines:
+                for bufferedCohortID in self.individualCohortBuffers: self.flushIndividualCohortBuffer(bufferedCohortID)
+
+
+    # Holds all data for cohort stratification in a staging file instead of writing it as it arrives, so that it doesn't
+    # need to be grouped by cohort and can be written after the cohorts' microsatellite stability and mutation signatures
+    # have been identified.  The staged data is written with writeStagedCohortData.
+    def stageCohortData(self):
+
+        intermediateFilesDir = os.path.join(self.rootDataDir,"intermediate_files")
+        checkDirs(intermediateFilesDir)
+        self.cohortStagingFilePath = generateFilePath(directory = intermediateFilesDir, dataGroup = self.rootMetadata.dataGroupName,
+                                                      dataType = "staged_cohort_data", fileExtension = ".bed")
+        self.cohortStagingFile = self.fanOutWriter.open(self.cohortStagingFilePath)
+
+
+    # Sorts the staged data by cohort and then position (the only sort the staged data needs, since each individual
+    # cohort then arrives in order) and writes it to the files for each cohort stratification.
+    def writeStagedCohortData(self):
+
+        self.cohortStagingFile.close()
+        self.cohortStagingFile = None
+
+        sortFile(self.cohortStagingFilePath, sortKey = cohortBedSortKey)
+        self.individualCohortsPresorted = True
+
+        with open(self.cohortStagingFilePath, 'r') as cohortStagingFile:
+            for line in cohortStagingFile:
+                outputLineStart, cohortID = line.rstrip('\n').rsplit('\t', 1)
+                self.writeCohortData(outputLineStart + '\n', cohortID)
 
-            # Write to the current individual cohort.
-            self.currentIndividualCohortFile.write(outputLine)
-            self.currentIndividualCohortMutCounts += 1
+        os.remove(self.cohortStagingFilePath)
 
 
     # Closes open files to clean up the class after it's done being used.
     def cleanupAndSort(self):
 
         self.rootOutputFile.close()
-        subprocess.run(" ".join(("sort","-k1,1","-k2,2n",self.rootOutputFilePath,"-o",self.rootOutputFilePath)),
-                       shell = True, check = True)
+        sortFile(self.rootOutputFilePath)
         Metadata(self.rootOutputFilePath).addMetadata(Metadata.AddableKeys.mutCounts, self.rootMutCounts)
         
 
         if self.stratifyByMS:
             self.aggregateMSIFile.close()
-            subprocess.run(" ".join(("sort","-k1,1","-k2,2n",self.aggregateMSIFilePath,"-o",self.aggregateMSIFilePath)), 
-                           shell = True, check = True)
+            sortFile(self.aggregateMSIFilePath)
             Metadata(self.aggregateMSIFilePath).addMetadata(Metadata.AddableKeys.mutCounts, self.aggregateMSIMutCounts)
             self.aggregateMSSFile.close()
-            subprocess.run(" ".join(("sort","-k1,1","-k2,2n",self.aggregateMSSFilePath,"-o",self.aggregateMSSFilePath)),
-                           shell = True, check = True)
+            sortFile(self.aggregateMSSFilePath)
             Metadata(self.aggregateMSSFilePath).addMetadata(Metadata.AddableKeys.mutCounts, self.aggregateMSSMutCounts)
 
         if self.stratifyByMutSig:
             for mutSig in self.mutSigFiles:
                 self.mutSigFiles[mutSig].close()
-                subprocess.run(" ".join(("sort","-k1,1","-k2,2n",self.mutSigFilePaths[mutSig], "-o",self.mutSigFilePaths[mutSig])), 
-                               shell = True, check = True)
+                sortFile(self.mutSigFilePaths[mutSig])
                 Metadata(self.mutSigFilePaths[mutSig]).addMetadata(Metadata.AddableKeys.mutCounts, self.mutSigMutCounts[mutSig])
 
-        if self.stratifyByIndividualCohorts and self.currentIndividualCohortFile is not None:
-            self.currentIndividualCohortFile.close()
-            subprocess.run(" ".join(("sort","-k1,1","-k2,2n",self.individualCohortFilePath,"-o",self.individualCohortFilePath)), 
-                           shell = True, check = True)
-            Metadata(self.individualCohortFilePath).addMetadata(Metadata.AddableKeys.mutCounts, self.currentIndividualCohortMutCounts)
\ No newline at end of file
+        if self.stratifyByIndividualCohorts:
+            for cohortID in self.individualCohortBuffers: self.flushIndividualCohortBuffer(cohortID)
+            for individualCohortFile in self.openIndividualCohortFiles.values(): individualCohortFile.close(waitForWrites = False)
+            self.fanOutWriter.waitForWrites()
+            for cohortID, individualCohortFilePath in self.individualCohortFilePaths.items():
+                if not self.individualCohortsPresorted: sortFile(individualCohortFilePath)
+                Metadata(individualCohortFilePath).addMetadata(Metadata.AddableKeys.mutCounts, self.individualCohortMutCounts[cohortID])
+
+        # Stop the background writing now that all the output files are closed.
+        if self.cohortStagingFile is not None: self.cohortStagingFile.close()
+        self.fanOutWriter.close()